@@ -0,0 +1,42 @@
+"""cover kite credential lookups with one composite index
+
+Revision ID: 20261015_00
+Revises: 20260211_02
+Create Date: 2026-10-15 10:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_00"
+down_revision = "20260211_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Unique on (tenant_id, user_id) and carrying the encrypted columns, so the
+    # auth refresh join is an index-only scan. Supersedes both the unique
+    # constraint and the standalone tenant_id index.
+    op.create_index(
+        "ix_kite_credentials_tenant_user_covering",
+        "kite_credentials",
+        ["tenant_id", "user_id"],
+        unique=True,
+        postgresql_include=["api_key_encrypted", "api_secret_encrypted", "totp_secret_encrypted"],
+    )
+    op.drop_constraint("uq_kite_credentials_tenant_user", "kite_credentials", type_="unique")
+    op.drop_index("ix_kite_credentials_tenant_id", table_name="kite_credentials")
+
+
+def downgrade() -> None:
+    op.create_index("ix_kite_credentials_tenant_id", "kite_credentials", ["tenant_id"], unique=False)
+    op.create_unique_constraint(
+        "uq_kite_credentials_tenant_user",
+        "kite_credentials",
+        ["tenant_id", "user_id"],
+    )
+    op.drop_index("ix_kite_credentials_tenant_user_covering", table_name="kite_credentials")
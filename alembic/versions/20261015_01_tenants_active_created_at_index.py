@@ -0,0 +1,34 @@
+"""replace tenants is_active index with a partial created_at index
+
+Revision ID: 20261015_01
+Revises: 20261015_00
+Create Date: 2026-10-15 10:30:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_01"
+down_revision = "20261015_00"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.drop_index("ix_tenants_is_active", table_name="tenants")
+    op.create_index(
+        "ix_tenants_active_created_at",
+        "tenants",
+        ["created_at"],
+        unique=False,
+        postgresql_where=sa.text("is_active"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_tenants_active_created_at", table_name="tenants")
+    op.create_index("ix_tenants_is_active", "tenants", ["is_active"], unique=False)
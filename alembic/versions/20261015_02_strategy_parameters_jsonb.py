@@ -0,0 +1,41 @@
+"""store strategy instance parameters as jsonb
+
+Revision ID: 20261015_02
+Revises: 20261015_01
+Create Date: 2026-10-15 11:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_02"
+down_revision = "20261015_01"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.alter_column(
+        "strategy_instances",
+        "parameters",
+        type_=postgresql.JSONB(),
+        existing_type=sa.JSON(),
+        existing_nullable=False,
+        postgresql_using="parameters::jsonb",
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        "strategy_instances",
+        "parameters",
+        type_=sa.JSON(),
+        existing_type=postgresql.JSONB(),
+        existing_nullable=False,
+        postgresql_using="parameters::json",
+    )
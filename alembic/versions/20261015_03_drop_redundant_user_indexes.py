@@ -0,0 +1,43 @@
+"""drop single-column indexes shadowed by (tenant_id, user_id) unique indexes
+
+Revision ID: 20261015_03
+Revises: 20261015_02
+Create Date: 2026-10-15 12:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_03"
+down_revision = "20261015_02"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # The unique constraints already index (tenant_id, user_id): every repository lookup
+    # is tenant-scoped, so the standalone indexes only cost writes.
+    op.drop_index("ix_notification_preferences_user_id", table_name="notification_preferences")
+    op.drop_index("ix_notification_preferences_tenant_id", table_name="notification_preferences")
+    op.drop_index("ix_trading_profiles_user_id", table_name="trading_profiles")
+    op.drop_index("ix_trading_profiles_tenant_id", table_name="trading_profiles")
+
+
+def downgrade() -> None:
+    op.create_index("ix_trading_profiles_tenant_id", "trading_profiles", ["tenant_id"], unique=False)
+    op.create_index("ix_trading_profiles_user_id", "trading_profiles", ["user_id"], unique=False)
+    op.create_index(
+        "ix_notification_preferences_tenant_id",
+        "notification_preferences",
+        ["tenant_id"],
+        unique=False,
+    )
+    op.create_index(
+        "ix_notification_preferences_user_id",
+        "notification_preferences",
+        ["user_id"],
+        unique=False,
+    )
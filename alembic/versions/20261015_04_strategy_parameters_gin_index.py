@@ -0,0 +1,31 @@
+"""add gin index on strategy instance parameters
+
+Revision ID: 20261015_04
+Revises: 20261015_03
+Create Date: 2026-10-15 13:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_04"
+down_revision = "20261015_03"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_strategy_instances_params_gin",
+        "strategy_instances",
+        ["parameters"],
+        unique=False,
+        postgresql_using="gin",
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_strategy_instances_params_gin", table_name="strategy_instances")
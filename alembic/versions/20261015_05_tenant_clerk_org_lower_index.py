@@ -0,0 +1,34 @@
+"""index tenants.clerk_org_id case-insensitively
+
+Revision ID: 20261015_05
+Revises: 20261015_04
+Create Date: 2026-10-15 14:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_05"
+down_revision = "20261015_04"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Replaces the plain unique index: every lookup now compares lower(clerk_org_id).
+    op.create_index(
+        "ix_tenants_clerk_org_lower",
+        "tenants",
+        [sa.text("lower(clerk_org_id)")],
+        unique=True,
+    )
+    op.drop_index("ix_tenants_clerk_org_id", table_name="tenants")
+
+
+def downgrade() -> None:
+    op.create_index("ix_tenants_clerk_org_id", "tenants", ["clerk_org_id"], unique=True)
+    op.drop_index("ix_tenants_clerk_org_lower", table_name="tenants")
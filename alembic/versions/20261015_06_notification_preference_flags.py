@@ -0,0 +1,68 @@
+"""pack notification preference channel and is_enabled into flags
+
+Revision ID: 20261015_06
+Revises: 20261015_05
+Create Date: 2026-10-15 15:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_06"
+down_revision = "20261015_05"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    # Packing any other channel would silently reroute its destination and lose the original value.
+    unknown = op.get_bind().execute(
+        sa.text(
+            "SELECT DISTINCT channel FROM notification_preferences "
+            "WHERE lower(channel) NOT IN ('email', 'telegram', 'whatsapp')"
+        )
+    ).scalars().all()
+    if unknown:
+        raise RuntimeError(
+            f"notification_preferences has unsupported channels {sorted(unknown)}; "
+            "fix or delete those rows before upgrading"
+        )
+
+    op.add_column("notification_preferences", sa.Column("flags", sa.SmallInteger(), nullable=True))
+    # bit 0 = enabled, bits 1-4 = channel code (email=0, telegram=1, whatsapp=2).
+    op.execute(
+        """
+        UPDATE notification_preferences
+        SET flags = (
+            CASE lower(channel) WHEN 'telegram' THEN 1 WHEN 'whatsapp' THEN 2 WHEN 'email' THEN 0 END << 1
+        ) | CASE WHEN is_enabled THEN 1 ELSE 0 END
+        """
+    )
+    op.alter_column("notification_preferences", "flags", nullable=False)
+    op.create_check_constraint(
+        "ck_notification_preferences_flags",
+        "notification_preferences",
+        "flags >= 0 AND flags < 256",
+    )
+    op.drop_column("notification_preferences", "is_enabled")
+    op.drop_column("notification_preferences", "channel")
+
+
+def downgrade() -> None:
+    op.add_column("notification_preferences", sa.Column("channel", sa.String(length=20), nullable=True))
+    op.add_column("notification_preferences", sa.Column("is_enabled", sa.Boolean(), nullable=True))
+    op.execute(
+        """
+        UPDATE notification_preferences
+        SET channel = CASE (flags >> 1) & 15 WHEN 1 THEN 'telegram' WHEN 2 THEN 'whatsapp' ELSE 'email' END,
+            is_enabled = (flags & 1) = 1
+        """
+    )
+    op.alter_column("notification_preferences", "channel", nullable=False)
+    op.alter_column("notification_preferences", "is_enabled", nullable=False)
+    op.drop_constraint("ck_notification_preferences_flags", "notification_preferences", type_="check")
+    op.drop_column("notification_preferences", "flags")
@@ -0,0 +1,35 @@
+"""store trading profile max_daily_loss in minor units
+
+Revision ID: 20261015_07
+Revises: 20261015_06
+Create Date: 2026-10-15 16:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_07"
+down_revision = "20261015_06"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column("trading_profiles", sa.Column("max_daily_loss_minor", sa.BigInteger(), nullable=True))
+    op.execute("UPDATE trading_profiles SET max_daily_loss_minor = (max_daily_loss * 100)::bigint")
+    op.alter_column("trading_profiles", "max_daily_loss_minor", nullable=False)
+    op.drop_column("trading_profiles", "max_daily_loss")
+
+
+def downgrade() -> None:
+    op.add_column(
+        "trading_profiles",
+        sa.Column("max_daily_loss", sa.Numeric(precision=14, scale=2), nullable=True),
+    )
+    op.execute("UPDATE trading_profiles SET max_daily_loss = max_daily_loss_minor / 100.0")
+    op.alter_column("trading_profiles", "max_daily_loss", nullable=False)
+    op.drop_column("trading_profiles", "max_daily_loss_minor")
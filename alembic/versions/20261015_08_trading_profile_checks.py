@@ -0,0 +1,35 @@
+"""add check constraints on trading profile limits
+
+Revision ID: 20261015_08
+Revises: 20261015_07
+Create Date: 2026-10-15 17:00:00
+
+"""
+from __future__ import annotations
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = "20261015_08"
+down_revision = "20261015_07"
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_check_constraint(
+        "ck_trading_profiles_max_orders",
+        "trading_profiles",
+        "max_orders > 0 AND max_orders <= 500",
+    )
+    op.create_check_constraint(
+        "ck_trading_profiles_max_daily_loss_pos",
+        "trading_profiles",
+        "max_daily_loss_minor > 0",
+    )
+
+
+def downgrade() -> None:
+    op.drop_constraint("ck_trading_profiles_max_daily_loss_pos", "trading_profiles", type_="check")
+    op.drop_constraint("ck_trading_profiles_max_orders", "trading_profiles", type_="check")
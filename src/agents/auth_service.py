@@ -3,6 +3,7 @@ from __future__ import annotations
 import asyncio
 import contextlib
 import logging
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from urllib.parse import parse_qs, urlparse
@@ -12,12 +13,13 @@ import pyotp
 import redis.asyncio as redis
 from fastapi import FastAPI
 from kiteconnect import KiteConnect
-from playwright.async_api import Browser, async_playwright
+from playwright.async_api import BrowserContext, async_playwright
 from sqlalchemy import select
 
 from src.agents.health import AgentHealth
 from src.core.config import settings
 from src.core.db import AsyncSessionLocal
+from src.core.security.crypto import SecurityCipher
 from src.core.security.dependencies import get_security_cipher
 from src.models.kite_credential import KiteCredential
 from src.models.tenant import Tenant
@@ -38,9 +40,18 @@ class AuthAgent:
     def __init__(self) -> None:
         self.health = AgentHealth(name="auth-agent", ready=True)
         self._stop_event = asyncio.Event()
+        self._cipher: SecurityCipher | None = None
+        self._redis = redis.from_url(settings.redis_url, decode_responses=True)
 
     async def stop(self) -> None:
         self._stop_event.set()
+        await self._redis.aclose()
+
+    def _get_cipher(self) -> SecurityCipher:
+        # Built lazily: the agent is instantiated at import time, before the key is validated.
+        if self._cipher is None:
+            self._cipher = get_security_cipher()
+        return self._cipher
 
     async def run(self) -> None:
         retry_delay = 1
@@ -58,59 +69,88 @@ class AuthAgent:
             except Exception as exc:  # pragma: no cover - operational path
                 self.health.mark_error(exc)
                 logger.exception("Auth agent cycle failed")
-                await asyncio.sleep(retry_delay)
+                # Unlike sleep(), this returns as soon as stop() is called.
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=retry_delay)
                 retry_delay = min(retry_delay * 2, settings.auth_max_retry_delay_seconds)
 
     async def _refresh_all_tenant_tokens(self) -> None:
-        records = await self._fetch_tenant_records()
-        refreshed = 0
-        redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+        redis_client = self._redis
+        tenants_seen = 0
 
         async with async_playwright() as playwright:
             browser = await playwright.chromium.launch(headless=settings.playwright_headless)
             try:
-                for record in records:
-                    if self._stop_event.is_set():
-                        break
-                    try:
-                        await self._refresh_single_tenant_token(browser, redis_client, record)
-                        refreshed += 1
-                    except Exception as exc:
-                        logger.exception("Tenant token refresh failed for tenant=%s", record.tenant_id)
-                        await self._emit_auth_failure_event(redis_client, record, exc)
+                slots = max(1, settings.auth_refresh_concurrency)
+                pending: asyncio.Queue[TenantAuthRecord] = asyncio.Queue(maxsize=slots)
+                refreshed = 0
+
+                async def _worker() -> None:
+                    nonlocal refreshed
+                    # One reusable context per worker instead of a fresh one per tenant.
+                    context: BrowserContext | None = None
+                    while True:
+                        record = await pending.get()
+                        try:
+                            if self._stop_event.is_set():
+                                continue
+                            if context is None:
+                                context = await browser.new_context()
+                            # Contexts are shared across tenants; never carry a login session over.
+                            await context.clear_cookies()
+                            await self._refresh_single_tenant_token(context, redis_client, record)
+                            refreshed += 1
+                        except Exception as exc:
+                            logger.exception("Tenant token refresh failed for tenant=%s", record.tenant_id)
+                            # A worker must survive a failed report too, or the bounded queue stalls.
+                            try:
+                                await self._emit_auth_failure_event(redis_client, record, exc)
+                            except Exception:
+                                logger.exception("Auth failure event lost for tenant=%s", record.tenant_id)
+                        finally:
+                            pending.task_done()
+
+                workers = [asyncio.create_task(_worker()) for _ in range(slots)]
+                try:
+                    async for record in self._iter_tenant_records():
+                        tenants_seen += 1
+                        await pending.put(record)
+                    await pending.join()
+                finally:
+                    # Workers are stopped here rather than by sentinels they would have to be alive to read.
+                    for worker in workers:
+                        worker.cancel()
+                    await asyncio.gather(*workers, return_exceptions=True)
             finally:
                 await browser.close()
-                await redis_client.aclose()
 
-        self.health.metrics["tenants_seen"] = len(records)
+        self.health.metrics["tenants_seen"] = tenants_seen
         self.health.metrics["tenants_refreshed"] = refreshed
 
-    async def _fetch_tenant_records(self) -> list[TenantAuthRecord]:
+    async def _iter_tenant_records(self) -> AsyncIterator[TenantAuthRecord]:
+        stmt = (
+            select(
+                Tenant.id,
+                KiteCredential.user_id,
+                KiteCredential.api_key_encrypted,
+                KiteCredential.api_secret_encrypted,
+                KiteCredential.totp_secret_encrypted,
+            )
+            .join(KiteCredential, KiteCredential.tenant_id == Tenant.id)
+            .where(Tenant.is_active.is_(True))
+            .order_by(Tenant.created_at)
+            .execution_options(yield_per=settings.auth_tenant_fetch_batch_size)
+        )
         async with AsyncSessionLocal() as session:
-            stmt = (
-                select(
-                    Tenant.id,
-                    KiteCredential.user_id,
-                    KiteCredential.api_key_encrypted,
-                    KiteCredential.api_secret_encrypted,
-                    KiteCredential.totp_secret_encrypted,
+            result = await session.stream(stmt)
+            async for row in result:
+                yield TenantAuthRecord(
+                    tenant_id=row.id,
+                    user_id=row.user_id,
+                    api_key_encrypted=row.api_key_encrypted,
+                    api_secret_encrypted=row.api_secret_encrypted,
+                    totp_secret_encrypted=row.totp_secret_encrypted,
                 )
-                .join(KiteCredential, KiteCredential.tenant_id == Tenant.id)
-                .where(Tenant.is_active.is_(True))
-                .order_by(Tenant.created_at)
-            )
-            rows = (await session.execute(stmt)).all()
-
-        return [
-            TenantAuthRecord(
-                tenant_id=row.id,
-                user_id=row.user_id,
-                api_key_encrypted=row.api_key_encrypted,
-                api_secret_encrypted=row.api_secret_encrypted,
-                totp_secret_encrypted=row.totp_secret_encrypted,
-            )
-            for row in rows
-        ]
 
     async def _emit_auth_failure_event(
         self,
@@ -132,38 +172,43 @@ class AuthAgent:
 
     async def _refresh_single_tenant_token(
         self,
-        browser: Browser,
+        context: BrowserContext,
         redis_client: redis.Redis,
         record: TenantAuthRecord,
     ) -> None:
-        cipher = get_security_cipher()
+        cipher = self._get_cipher()
         api_key = cipher.decrypt(record.api_key_encrypted)
         api_secret = cipher.decrypt(record.api_secret_encrypted)
         totp_secret = cipher.decrypt(record.totp_secret_encrypted)
 
         request_token = await self._perform_zerodha_login(
-            browser=browser,
+            context=context,
             tenant_id=record.tenant_id,
             api_key=api_key,
             totp_secret=totp_secret,
         )
 
         kite = KiteConnect(api_key=api_key)
-        session_data = kite.generate_session(request_token, api_secret=api_secret)
+        session_data = await asyncio.to_thread(kite.generate_session, request_token, api_secret=api_secret)
         access_token = session_data.get("access_token")
         if not access_token:
             raise ValueError(f"Missing access token for tenant {record.tenant_id}")
 
-        key = f"kite:access_token:{record.tenant_id}"
-        await redis_client.set(key, access_token, ex=settings.auth_token_ttl_seconds)
-        await redis_client.publish(
-            f"auth:token_refreshed:{record.tenant_id}",
-            datetime.now(timezone.utc).isoformat(),
-        )
+        async with redis_client.pipeline(transaction=False) as pipe:
+            pipe.set(
+                f"kite:access_token:{record.tenant_id}",
+                access_token,
+                ex=settings.auth_token_ttl_seconds,
+            )
+            pipe.publish(
+                f"auth:token_refreshed:{record.tenant_id}",
+                datetime.now(timezone.utc).isoformat(),
+            )
+            await pipe.execute()
 
     async def _perform_zerodha_login(
         self,
-        browser: Browser,
+        context: BrowserContext,
         tenant_id: UUID,
         api_key: str,
         totp_secret: str,
@@ -180,7 +225,7 @@ class AuthAgent:
                 "Set ZERODHA_USER_ID_MAP_JSON and ZERODHA_PASSWORD_MAP_JSON."
             )
 
-        page = await browser.new_page()
+        page = await context.new_page()
         try:
             kite = KiteConnect(api_key=api_key)
             await page.goto(kite.login_url(), wait_until="networkidle")
@@ -205,22 +250,22 @@ class AuthAgent:
 
 
 auth_agent = AuthAgent()
-app = FastAPI(title="Orra Auth Agent")
 
 
-@app.on_event("startup")
-async def startup_event() -> None:
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
     logging.basicConfig(level=logging.INFO)
-    app.state.task = asyncio.create_task(auth_agent.run())
+    task = asyncio.create_task(auth_agent.run())
+    try:
+        yield
+    finally:
+        await auth_agent.stop()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
 
 
-@app.on_event("shutdown")
-async def shutdown_event() -> None:
-    await auth_agent.stop()
-    task: asyncio.Task[None] = app.state.task
-    task.cancel()
-    with contextlib.suppress(asyncio.CancelledError):
-        await task
+app = FastAPI(title="Orra Auth Agent", lifespan=lifespan)
 
 
 @app.get("/health", tags=["system"])
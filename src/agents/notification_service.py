@@ -2,59 +2,104 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
-import json
 import logging
+from collections.abc import AsyncIterator
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from uuid import UUID
 
+import httpx
+import orjson
 import redis.asyncio as redis
-import requests
 from fastapi import FastAPI
-from sqlalchemy import select
+from sqlalchemy import and_, bindparam, select
+from sqlalchemy.dialects.postgresql import UUID as PGUUID
 
 from src.agents.health import AgentHealth
 from src.core.config import settings
 from src.core.db import AsyncSessionLocal
-from src.models.notification_preference import NotificationPreference
+from src.models.notification_preference import NotificationChannel, NotificationPreference
 from src.models.tenant import Tenant
 
 logger = logging.getLogger(__name__)
 
-Channel = str
+_UUID_STR = PGUUID(as_uuid=False)
+
+# Stored channel codes are NotificationChannel values; unknown codes fall back to email.
+_CHANNELS_BY_CODE: dict[int, NotificationChannel] = {c.value: c for c in NotificationChannel}
+# Channel names sent to n8n in the payload's "channel" field.
+_CHANNEL_LABELS: dict[NotificationChannel, str] = {c: c.name.lower() for c in NotificationChannel}
+
+# Static parts of each webhook payload; handlers copy these and fill in per-event fields.
+_TRADE_SUCCESS_PAYLOAD: dict[str, object] = {
+    "event_type": "trade_execution",
+    "severity": "info",
+    "message": "Trade executed successfully",
+}
+_TRADE_FAILURE_PAYLOAD: dict[str, object] = {
+    "event_type": "trade_execution",
+    "severity": "warning",
+}
+_AUTH_FAILED_PAYLOAD: dict[str, object] = {
+    "event_type": "auth_2fa_failed",
+    "severity": "urgent",
+    "message": "Urgent: Zerodha 2FA login failed. Please re-check your credentials immediately.",
+}
 
 
 @dataclass(slots=True)
 class NotificationTarget:
-    channel: Channel
+    channel: NotificationChannel
     destination: str
 
 
+def _validate_ids(fields: dict[str, str]) -> dict[str, str]:
+    """Return a copy of ``fields`` with tenant_id/user_id in canonical UUID form.
+
+    Targets are keyed by canonical ids, so uppercase or unhyphenated ids must not reach lookups.
+    """
+    normalized = dict(fields)
+    for key in ("tenant_id", "user_id"):
+        value = fields.get(key)
+        if value:
+            normalized[key] = str(UUID(value))
+    return normalized
+
+
 class NotificationDispatcher:
     def __init__(self) -> None:
-        self.channel_webhooks: dict[str, str] = {
-            "telegram": settings.n8n_telegram_webhook_url,
-            "whatsapp": settings.n8n_whatsapp_webhook_url,
-            "email": settings.n8n_email_webhook_url,
+        self._webhooks: dict[NotificationChannel, str] = {
+            NotificationChannel.EMAIL: settings.n8n_email_webhook_url,
+            NotificationChannel.TELEGRAM: settings.n8n_telegram_webhook_url,
+            NotificationChannel.WHATSAPP: settings.n8n_whatsapp_webhook_url,
         }
+        self._urgent_webhook = settings.n8n_urgent_webhook_url
+        self._http = httpx.AsyncClient(
+            timeout=10,
+            headers={"Content-Type": "application/json"},
+            limits=httpx.Limits(max_keepalive_connections=32),
+        )
+
+    async def aclose(self) -> None:
+        await self._http.aclose()
 
     async def dispatch(
         self,
         *,
-        channel: str,
+        channel: NotificationChannel | None,
         payload: dict[str, object],
         urgent: bool = False,
     ) -> None:
-        webhook = settings.n8n_urgent_webhook_url if urgent else self.channel_webhooks.get(channel, "")
+        if urgent:
+            webhook = self._urgent_webhook
+        else:
+            webhook = self._webhooks.get(channel, "") if channel is not None else ""
         if not webhook:
             raise ValueError(f"Webhook is not configured for channel={channel} urgent={urgent}")
 
-        def _post() -> None:
-            # n8n workflow pattern: single webhook entry with event + routing metadata.
-            response = requests.post(webhook, json=payload, timeout=10)
-            response.raise_for_status()
-
-        await asyncio.to_thread(_post)
+        # n8n workflow pattern: single webhook entry with event + routing metadata.
+        response = await self._http.post(webhook, content=orjson.dumps(payload))
+        response.raise_for_status()
 
 
 class NotificationAgent:
@@ -63,14 +108,29 @@ class NotificationAgent:
         self._stop_event = asyncio.Event()
         self._redis = redis.from_url(settings.redis_url, decode_responses=True)
         self._dispatcher = NotificationDispatcher()
+        # (tenant_id, user_id) -> target; (tenant_id, None) holds the tenant's fallback.
+        self._targets: dict[tuple[str, str | None], NotificationTarget] = {}
+        self._event_slots = asyncio.Semaphore(max(1, settings.notification_dispatch_concurrency))
 
     async def stop(self) -> None:
         self._stop_event.set()
         await self._redis.aclose()
+        await self._dispatcher.aclose()
 
     async def run(self) -> None:
         await self._ensure_consumer_groups()
+        background = [
+            asyncio.create_task(self._listen_for_preference_changes()),
+            asyncio.create_task(self._refresh_targets_periodically()),
+        ]
+        try:
+            await self._consume_streams()
+        finally:
+            for task in background:
+                task.cancel()
+            await asyncio.gather(*background, return_exceptions=True)
 
+    async def _consume_streams(self) -> None:
         retry_delay = 1
         while not self._stop_event.is_set():
             self.health.mark_run()
@@ -84,60 +144,143 @@ class NotificationAgent:
                     },
                     count=100,
                     block=settings.notification_stream_block_ms,
+                    # At-most-once: nothing enters the PEL, so there is nothing to ack.
+                    # Undeliverable events are preserved on the failure stream instead.
+                    noack=True,
                 )
 
                 if not messages:
                     continue
 
-                for stream_name, entries in messages:
-                    for message_id, fields in entries:
-                        await self._process_event(stream_name, message_id, fields)
+                events = [
+                    (stream_name, message_id, fields)
+                    for stream_name, entries in messages
+                    for message_id, fields in entries
+                ]
+                now_iso = datetime.now(timezone.utc).isoformat()
+                failures = await asyncio.gather(
+                    *(self._process_event(*event, now_iso) for event in events)
+                )
+                await self._record_failures(failures)
 
                 self.health.mark_success()
                 retry_delay = 1
             except Exception as exc:  # pragma: no cover - operational path
                 self.health.mark_error(exc)
                 logger.exception("Notification agent stream loop failed")
-                await asyncio.sleep(retry_delay)
+                # Unlike sleep(), this returns as soon as stop() is called.
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=retry_delay)
                 retry_delay = min(retry_delay * 2, 120)
 
-    async def _ensure_consumer_groups(self) -> None:
-        for stream in (settings.execution_results_stream_name, settings.auth_error_stream_name):
+    async def _listen_for_preference_changes(self) -> None:
+        while not self._stop_event.is_set():
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(settings.notification_preferences_channel)
+                    async for message in pubsub.listen():
+                        if message.get("type") == "message":
+                            await self._handle_preference_change(message.get("data"))
+            except Exception:  # pragma: no cover - operational path
+                logger.exception("Notification preference listener failed")
+                # Invalidations may have been missed while disconnected; reload lazily per tenant.
+                self._targets.clear()
+                with contextlib.suppress(asyncio.TimeoutError):
+                    await asyncio.wait_for(self._stop_event.wait(), timeout=1)
+
+    async def _refresh_targets_periodically(self) -> None:
+        # Safety net for missed invalidations: a full reload on start and every TTL.
+        while not self._stop_event.is_set():
             try:
-                await self._redis.xgroup_create(
+                await self._reload_targets()
+            except Exception:  # pragma: no cover - operational path
+                logger.exception("Notification target reload failed")
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    self._stop_event.wait(), timeout=settings.notification_target_cache_ttl_seconds
+                )
+
+    async def _handle_preference_change(self, tenant_id: object) -> None:
+        try:
+            tenant_key = str(UUID(str(tenant_id)))
+        except ValueError:
+            await self._reload_targets()
+            return
+        await self._reload_targets(tenant_key)
+
+    async def _ensure_consumer_groups(self) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for stream in (settings.execution_results_stream_name, settings.auth_error_stream_name):
+                pipe.xgroup_create(
                     name=stream,
                     groupname=settings.notification_consumer_group,
                     id="0",
                     mkstream=True,
                 )
-            except Exception as exc:
-                if "BUSYGROUP" not in str(exc):
-                    raise
+            results = await pipe.execute(raise_on_error=False)
+        for result in results:
+            if isinstance(result, Exception) and "BUSYGROUP" not in str(result):
+                raise result
 
-    async def _process_event(self, stream_name: str, message_id: str, fields: dict[str, str]) -> None:
+    async def _process_event(
+        self,
+        stream_name: str,
+        message_id: str,
+        fields: dict[str, str],
+        now_iso: str,
+    ) -> dict[str, str] | None:
+        """Handle one event; return the failure-stream entry if it could not be delivered."""
         try:
-            if stream_name == settings.execution_results_stream_name:
-                await self._handle_execution_result(fields)
-            elif stream_name == settings.auth_error_stream_name:
-                await self._handle_auth_error(fields)
-            self.health.metrics["events_processed"] = self.health.metrics.get("events_processed", 0) + 1
-            await self._redis.xack(stream_name, settings.notification_consumer_group, message_id)
-        except Exception as exc:
-            self.health.metrics["events_failed"] = self.health.metrics.get("events_failed", 0) + 1
-            await self._redis.xadd(
-                settings.notification_failure_stream_name,
-                {
-                    "source_stream": stream_name,
-                    "message_id": message_id,
-                    "error": str(exc),
-                    "payload": json.dumps(fields),
-                    "failed_at": datetime.now(timezone.utc).isoformat(),
-                },
+            normalized = _validate_ids(fields)
+        except ValueError as exc:
+            # Poison ids would only fail later in the DB; skip the handler entirely.
+            return self._failure_entry(
+                stream_name, message_id, fields, now_iso, exc, reason="malformed_uuid"
             )
-            # Ack poison messages after sending to failure stream to avoid hard blocking.
-            await self._redis.xack(stream_name, settings.notification_consumer_group, message_id)
 
-    async def _handle_execution_result(self, fields: dict[str, str]) -> None:
+        async with self._event_slots:
+            try:
+                if stream_name == settings.execution_results_stream_name:
+                    await self._handle_execution_result(normalized, now_iso)
+                elif stream_name == settings.auth_error_stream_name:
+                    await self._handle_auth_error(normalized, now_iso)
+                self.health.metrics["events_processed"] = self.health.metrics.get("events_processed", 0) + 1
+                return None
+            except Exception as exc:
+                return self._failure_entry(
+                    stream_name, message_id, fields, now_iso, exc, reason="handler_error"
+                )
+
+    def _failure_entry(
+        self,
+        stream_name: str,
+        message_id: str,
+        fields: dict[str, str],
+        now_iso: str,
+        error: Exception,
+        *,
+        reason: str,
+    ) -> dict[str, str]:
+        self.health.metrics["events_failed"] = self.health.metrics.get("events_failed", 0) + 1
+        return {
+            "source_stream": stream_name,
+            "message_id": message_id,
+            "reason": reason,
+            "error": str(error),
+            "payload": orjson.dumps(fields).decode(),
+            "failed_at": now_iso,
+        }
+
+    async def _record_failures(self, failures: list[dict[str, str] | None]) -> None:
+        entries = [failure for failure in failures if failure is not None]
+        if not entries:
+            return
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for entry in entries:
+                pipe.xadd(settings.notification_failure_stream_name, entry)
+            await pipe.execute()
+
+    async def _handle_execution_result(self, fields: dict[str, str], now_iso: str) -> None:
         tenant_id = fields.get("tenant_id")
         user_id = fields.get("user_id")
         status_value = (fields.get("status") or "unknown").lower()
@@ -145,105 +288,131 @@ class NotificationAgent:
         if not tenant_id or not user_id:
             raise ValueError("execution_results event missing tenant_id/user_id")
 
-        target = await self._resolve_target(UUID(tenant_id), UUID(user_id))
+        target = await self._resolve_target(tenant_id, user_id)
         is_success = status_value in {"success", "filled", "completed"}
 
-        payload = {
-            "event_type": "trade_execution",
-            "severity": "info" if is_success else "warning",
-            "tenant_id": tenant_id,
-            "user_id": user_id,
-            "channel": target.channel,
-            "destination": target.destination,
-            "trade_status": status_value,
-            "message": (
-                "Trade executed successfully"
-                if is_success
-                else f"Trade execution failed: {fields.get('error', 'unknown reason')}"
-            ),
-            "meta": fields,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
-        }
+        if is_success:
+            payload = {**_TRADE_SUCCESS_PAYLOAD}
+        else:
+            payload = {
+                **_TRADE_FAILURE_PAYLOAD,
+                "message": f"Trade execution failed: {fields.get('error', 'unknown reason')}",
+            }
+        payload.update(
+            tenant_id=tenant_id,
+            user_id=user_id,
+            channel=_CHANNEL_LABELS[target.channel],
+            destination=target.destination,
+            trade_status=status_value,
+            meta=fields,
+            timestamp=now_iso,
+        )
         await self._dispatcher.dispatch(channel=target.channel, payload=payload, urgent=False)
 
-    async def _handle_auth_error(self, fields: dict[str, str]) -> None:
+    async def _handle_auth_error(self, fields: dict[str, str], now_iso: str) -> None:
         tenant_id = fields.get("tenant_id")
         user_id = fields.get("user_id")
         if not tenant_id:
             raise ValueError("auth_errors event missing tenant_id")
 
-        target = await self._resolve_target(
-            UUID(tenant_id),
-            UUID(user_id) if user_id else None,
-            prefer_urgent=True,
-        )
+        target = await self._resolve_target(tenant_id, user_id or None, prefer_urgent=True)
 
         payload = {
-            "event_type": "auth_2fa_failed",
-            "severity": "urgent",
+            **_AUTH_FAILED_PAYLOAD,
             "tenant_id": tenant_id,
             "user_id": user_id,
-            "channel": target.channel,
+            "channel": _CHANNEL_LABELS[target.channel],
             "destination": target.destination,
-            "message": "Urgent: Zerodha 2FA login failed. Please re-check your credentials immediately.",
             "meta": fields,
-            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "timestamp": now_iso,
         }
         await self._dispatcher.dispatch(channel=target.channel, payload=payload, urgent=True)
 
     async def _resolve_target(
         self,
-        tenant_id: UUID,
-        user_id: UUID | None,
+        tenant_id: str,
+        user_id: str | None,
         prefer_urgent: bool = False,
     ) -> NotificationTarget:
+        target = self._targets.get((tenant_id, user_id)) or self._targets.get((tenant_id, None))
+        if target is None:
+            # Tenant created after the snapshot, or the snapshot was dropped.
+            await self._reload_targets(tenant_id)
+            target = self._targets.get((tenant_id, user_id)) or self._targets.get((tenant_id, None))
+            if target is None:
+                raise ValueError(f"Tenant not found: {tenant_id}")
+        return target
+
+    async def _reload_targets(self, tenant_id: str | None = None) -> None:
+        targets = await self._load_targets(tenant_id)
+        if tenant_id is None:
+            self._targets = targets
+            return
+        for key in [key for key in self._targets if key[0] == tenant_id]:
+            del self._targets[key]
+        self._targets.update(targets)
+
+    async def _load_targets(
+        self,
+        tenant_id: str | None = None,
+    ) -> dict[tuple[str, str | None], NotificationTarget]:
+        # Every tenant row matches; preferences join only when enabled.
+        stmt = (
+            select(
+                Tenant.id,
+                Tenant.clerk_org_id,
+                NotificationPreference.user_id,
+                NotificationPreference.channel,
+                NotificationPreference.destination,
+            )
+            .select_from(Tenant)
+            .outerjoin(
+                NotificationPreference,
+                and_(
+                    NotificationPreference.tenant_id == Tenant.id,
+                    NotificationPreference.is_enabled,
+                ),
+            )
+        )
+        if tenant_id is not None:
+            # Ids arrive as strings from the streams and are bound as-is, without UUID round-trips.
+            stmt = stmt.where(Tenant.id == bindparam("tenant_id", tenant_id, type_=_UUID_STR))
+
         async with AsyncSessionLocal() as session:
-            destination = None
-            channel = None
-
-            if user_id is not None:
-                pref = await session.scalar(
-                    select(NotificationPreference).where(
-                        NotificationPreference.tenant_id == tenant_id,
-                        NotificationPreference.user_id == user_id,
-                        NotificationPreference.is_enabled.is_(True),
-                    )
+            rows = (await session.execute(stmt)).all()
+
+        targets: dict[tuple[str, str | None], NotificationTarget] = {}
+        for row in rows:
+            tenant_key = str(row.id)
+            # Fallback destination uses org id for n8n-side routing.
+            targets.setdefault(
+                (tenant_key, None),
+                NotificationTarget(channel=NotificationChannel.EMAIL, destination=row.clerk_org_id),
+            )
+            if row.user_id is not None and row.destination:
+                targets[(tenant_key, str(row.user_id))] = NotificationTarget(
+                    channel=_CHANNELS_BY_CODE.get(row.channel, NotificationChannel.EMAIL),
+                    destination=row.destination,
                 )
-                if pref is not None:
-                    channel = pref.channel.lower()
-                    destination = pref.destination
-
-            if not destination:
-                tenant = await session.scalar(select(Tenant).where(Tenant.id == tenant_id))
-                if tenant is None:
-                    raise ValueError(f"Tenant not found: {tenant_id}")
-                # Fallback destination uses org id for n8n-side routing.
-                destination = tenant.clerk_org_id
-                channel = "email"
-
-        if prefer_urgent and settings.n8n_urgent_webhook_url:
-            return NotificationTarget(channel=channel or "email", destination=destination)
-
-        return NotificationTarget(channel=channel or "email", destination=destination)
-
+        return targets
 
 notification_agent = NotificationAgent()
-app = FastAPI(title="Orra Notification Agent")
 
 
-@app.on_event("startup")
-async def startup_event() -> None:
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
     logging.basicConfig(level=logging.INFO)
-    app.state.task = asyncio.create_task(notification_agent.run())
+    task = asyncio.create_task(notification_agent.run())
+    try:
+        yield
+    finally:
+        await notification_agent.stop()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
 
 
-@app.on_event("shutdown")
-async def shutdown_event() -> None:
-    await notification_agent.stop()
-    task: asyncio.Task[None] = app.state.task
-    task.cancel()
-    with contextlib.suppress(asyncio.CancelledError):
-        await task
+app = FastAPI(title="Orra Notification Agent", lifespan=lifespan)
 
 
 @app.get("/health", tags=["system"])
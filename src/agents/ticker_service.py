@@ -2,15 +2,16 @@ from __future__ import annotations
 
 import asyncio
 import contextlib
-import json
 import logging
 import time
-from dataclasses import dataclass
+from collections import deque
+from collections.abc import AsyncIterator
 from uuid import UUID
 
+import orjson
+import redis.asyncio as redis
 from fastapi import FastAPI
 from kiteconnect import KiteTicker
-from redis import Redis
 from sqlalchemy import select
 
 from src.agents.health import AgentHealth
@@ -22,11 +23,12 @@ from src.models.tenant import Tenant
 
 logger = logging.getLogger(__name__)
 
-
-@dataclass(slots=True)
-class TenantTickerConfig:
-    tenant_id: UUID
-    api_key_encrypted: str
+# Kite's datetime fields, stringified up front so orjson never calls back into Python.
+# str() keeps the "YYYY-MM-DD HH:MM:SS" format consumers already parse; the values are
+# naive exchange time, not UTC.
+_TICK_DATETIME_FIELDS = ("last_trade_time", "exchange_timestamp")
+# Max ticks flushed per Redis pipeline.
+_TICK_DRAIN_BATCH = 512
 
 
 class TenantTickerWorker:
@@ -34,15 +36,20 @@ class TenantTickerWorker:
         self,
         tenant_id: UUID,
         api_key: str,
-        redis_client: Redis,
+        redis_client: redis.Redis,
         instrument_tokens: list[int],
         health: AgentHealth,
+        reconnect_initial_delay: int,
+        reconnect_max_delay: int,
     ) -> None:
         self.tenant_id = tenant_id
         self.api_key = api_key
         self.redis_client = redis_client
         self.instrument_tokens = instrument_tokens
         self.health = health
+        self.reconnect_initial_delay = reconnect_initial_delay
+        self.reconnect_max_delay = reconnect_max_delay
+        self._channels = {token: self._channel(token) for token in instrument_tokens}
 
         self._loop = asyncio.get_running_loop()
         self._should_run = True
@@ -50,6 +57,12 @@ class TenantTickerWorker:
         self._kws: KiteTicker | None = None
         self._tenant_active_cache = True
         self._tenant_active_checked_at = 0.0
+        # Filled from the Kite thread; maxlen drops the oldest ticks when Redis falls behind.
+        self._tick_buffer: deque[dict] = deque(maxlen=settings.ticker_tick_buffer_size)
+        self._drain_signal = asyncio.Event()
+
+    def _channel(self, instrument_token: int) -> bytes:
+        return f"ticker:{self.tenant_id}:{instrument_token}".encode()
 
     async def stop(self) -> None:
         self._should_run = False
@@ -61,18 +74,29 @@ class TenantTickerWorker:
         self._disconnect_event.set()
 
     async def run(self) -> None:
-        delay = settings.ticker_reconnect_initial_delay_seconds
+        drain = asyncio.create_task(self._drain_ticks())
+        try:
+            await self._run_connections()
+        finally:
+            drain.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await drain
+
+    async def _run_connections(self) -> None:
+        delay = self.reconnect_initial_delay
+        max_delay = self.reconnect_max_delay
         while self._should_run:
-            access_token = await asyncio.to_thread(
-                self.redis_client.get, f"kite:access_token:{self.tenant_id}"
-            )
+            access_token = await self.redis_client.get(f"kite:access_token:{self.tenant_id}")
             if not access_token:
                 logger.warning("No access token in redis for tenant=%s", self.tenant_id)
                 await asyncio.sleep(delay)
-                delay = min(delay * 2, settings.ticker_reconnect_max_delay_seconds)
+                delay = min(delay * 2, max_delay)
                 continue
 
-            self._disconnect_event = asyncio.Event()
+            # Reused across reconnects; a stop() that raced the token fetch must still win.
+            self._disconnect_event.clear()
+            if not self._should_run:
+                break
             self._kws = KiteTicker(api_key=self.api_key, access_token=access_token)
             self._configure_callbacks(self._kws)
 
@@ -93,20 +117,67 @@ class TenantTickerWorker:
                 break
 
             await asyncio.sleep(delay)
-            delay = min(delay * 2, settings.ticker_reconnect_max_delay_seconds)
+            delay = min(delay * 2, max_delay)
+
+    def _buffer_ticks(self, ticks: list[dict]) -> None:
+        # Called on the Kite thread: never blocks, only the loop touches metrics.
+        dropped = max(0, len(self._tick_buffer) + len(ticks) - (self._tick_buffer.maxlen or 0))
+        self._tick_buffer.extend(ticks)
+        self._loop.call_soon_threadsafe(self._signal_ticks, dropped)
+
+    def _signal_ticks(self, dropped: int) -> None:
+        if dropped:
+            self.health.metrics["ticks_dropped"] = self.health.metrics.get("ticks_dropped", 0) + dropped
+        self._drain_signal.set()
+
+    async def _drain_ticks(self) -> None:
+        buffer = self._tick_buffer
+        while True:
+            await self._drain_signal.wait()
+            self._drain_signal.clear()
+            batch = [buffer.popleft() for _ in range(min(len(buffer), _TICK_DRAIN_BATCH))]
+            if buffer:
+                self._drain_signal.set()
+            try:
+                await self._publish_ticks(batch)
+            except Exception:  # pragma: no cover - network path
+                logger.exception("Tick publish failed for tenant=%s", self.tenant_id)
 
-    def _configure_callbacks(self, kws: KiteTicker) -> None:
-        def is_tenant_active() -> bool:
-            now = time.monotonic()
-            if now - self._tenant_active_checked_at < 1.0:
-                return self._tenant_active_cache
-
-            raw = self.redis_client.get(f"tenant:active:{self.tenant_id}")
-            # Missing key defaults to active for backward compatibility.
-            self._tenant_active_cache = raw is None or raw in {"1", "true", "active", "True"}
-            self._tenant_active_checked_at = now
+    async def _is_tenant_active(self) -> bool:
+        now = time.monotonic()
+        if now - self._tenant_active_checked_at < 1.0:
             return self._tenant_active_cache
 
+        raw = await self.redis_client.get(f"tenant:active:{self.tenant_id}")
+        # Missing key defaults to active for backward compatibility.
+        self._tenant_active_cache = raw is None or raw in {"1", "true", "active", "True"}
+        self._tenant_active_checked_at = now
+        return self._tenant_active_cache
+
+    async def _publish_ticks(self, ticks: list[dict]) -> None:
+        if not ticks or not await self._is_tenant_active():
+            return
+        # One round-trip for the whole batch instead of one PUBLISH per tick.
+        published = 0
+        async with self.redis_client.pipeline(transaction=False) as pipe:
+            for tick in ticks:
+                instrument_token = tick.get("instrument_token")
+                if instrument_token is None:
+                    continue
+                channel = self._channels.get(instrument_token) or self._channel(instrument_token)
+                for field in _TICK_DATETIME_FIELDS:
+                    value = tick.get(field)
+                    if value is not None:
+                        tick[field] = str(value)
+                # default=str only fires for types Kite has not sent before.
+                pipe.publish(channel, orjson.dumps(tick, default=str))
+                published += 1
+            if not published:
+                return
+            await pipe.execute()
+        self.health.metrics["ticks_published"] = self.health.metrics.get("ticks_published", 0) + published
+
+    def _configure_callbacks(self, kws: KiteTicker) -> None:
         def on_connect(ws: KiteTicker, response: dict) -> None:
             logger.info("Ticker connected for tenant=%s", self.tenant_id)
             ws.subscribe(self.instrument_tokens)
@@ -114,16 +185,7 @@ class TenantTickerWorker:
             self.health.metrics["active_connections"] = self.health.metrics.get("active_connections", 0) + 1
 
         def on_ticks(ws: KiteTicker, ticks: list[dict]) -> None:
-            if not is_tenant_active():
-                return
-            for tick in ticks:
-                instrument_token = tick.get("instrument_token")
-                if instrument_token is None:
-                    continue
-                channel = f"ticker:{self.tenant_id}:{instrument_token}"
-                payload = json.dumps(tick, default=str)
-                self.redis_client.publish(channel, payload)
-                self.health.metrics["ticks_published"] = self.health.metrics.get("ticks_published", 0) + 1
+            self._buffer_ticks(ticks)
 
         def on_close(ws: KiteTicker, code: int, reason: str) -> None:
             logger.warning(
@@ -153,7 +215,21 @@ class TickerAgent:
         self._stop_event = asyncio.Event()
         self._tasks: list[asyncio.Task[None]] = []
         self._workers: list[TenantTickerWorker] = []
-        self._redis = Redis.from_url(settings.redis_url, decode_responses=True)
+        # Tenants that already have a worker; a cycle that fails part-way is picked up next cycle.
+        self._started_tenants: set[UUID] = set()
+        # Read once: settings are fixed for the process lifetime.
+        self._instruments = settings.ticker_instrument_tokens()
+        self._initial_delay = settings.ticker_reconnect_initial_delay_seconds
+        self._max_delay = settings.ticker_reconnect_max_delay_seconds
+        # One pooled async client shared by every tenant worker; flushes wait for a free
+        # connection rather than failing once every connection is checked out.
+        pool = redis.BlockingConnectionPool.from_url(
+            settings.redis_url,
+            decode_responses=True,
+            max_connections=settings.redis_max_connections,
+            timeout=settings.redis_pool_timeout_seconds,
+        )
+        self._redis = redis.Redis.from_pool(pool)
 
     async def stop(self) -> None:
         self._stop_event.set()
@@ -164,22 +240,22 @@ class TickerAgent:
         for task in self._tasks:
             with contextlib.suppress(asyncio.CancelledError):
                 await task
-        await asyncio.to_thread(self._redis.close)
+        await self._redis.aclose()
 
     async def run(self) -> None:
-        if not settings.ticker_instrument_tokens():
+        if not self._instruments:
             err = ValueError("No ticker instruments configured in TICKER_INSTRUMENT_TOKENS_CSV")
             self.health.mark_error(err)
             logger.error(str(err))
             return
 
-        retry_delay = settings.ticker_reconnect_initial_delay_seconds
+        retry_delay = self._initial_delay
         while not self._stop_event.is_set():
             self.health.mark_run()
             try:
                 await self._run_workers_once()
                 self.health.mark_success()
-                retry_delay = settings.ticker_reconnect_initial_delay_seconds
+                retry_delay = self._initial_delay
                 await asyncio.wait_for(self._stop_event.wait(), timeout=30)
             except asyncio.TimeoutError:
                 continue
@@ -187,64 +263,71 @@ class TickerAgent:
                 self.health.mark_error(exc)
                 logger.exception("Ticker agent cycle failed")
                 await asyncio.sleep(retry_delay)
-                retry_delay = min(retry_delay * 2, settings.ticker_reconnect_max_delay_seconds)
+                retry_delay = min(retry_delay * 2, self._max_delay)
 
     async def _run_workers_once(self) -> None:
-        configs = await self._fetch_tenant_configs()
-        self.health.metrics["tenants_seen"] = len(configs)
-
-        # Start workers only once.
-        if self._tasks:
-            return
-
+        tenants_seen = 0
+        async for tenant_ids, encrypted_keys in self._iter_tenant_batches():
+            tenants_seen += len(tenant_ids)
+            pending = [
+                (tenant_id, encrypted)
+                for tenant_id, encrypted in zip(tenant_ids, encrypted_keys)
+                if tenant_id not in self._started_tenants
+            ]
+            if pending:
+                await self._start_workers([row[0] for row in pending], [row[1] for row in pending])
+        self.health.metrics["tenants_seen"] = tenants_seen
+
+    async def _start_workers(self, tenant_ids: list[UUID], encrypted_keys: list[str]) -> None:
         cipher = get_security_cipher()
-        instruments = settings.ticker_instrument_tokens()
-
-        for config in configs:
-            api_key = cipher.decrypt(config.api_key_encrypted)
+        # A short AES-GCM decrypt is a couple of microseconds; a thread hop costs far more.
+        api_keys = [cipher.decrypt(encrypted) for encrypted in encrypted_keys]
+        for tenant_id, api_key in zip(tenant_ids, api_keys):
             worker = TenantTickerWorker(
-                tenant_id=config.tenant_id,
+                tenant_id=tenant_id,
                 api_key=api_key,
                 redis_client=self._redis,
-                instrument_tokens=instruments,
+                instrument_tokens=self._instruments,
                 health=self.health,
+                reconnect_initial_delay=self._initial_delay,
+                reconnect_max_delay=self._max_delay,
             )
             self._workers.append(worker)
             self._tasks.append(asyncio.create_task(worker.run()))
-
-    async def _fetch_tenant_configs(self) -> list[TenantTickerConfig]:
+            self._started_tenants.add(tenant_id)
+
+    async def _iter_tenant_batches(self) -> AsyncIterator[tuple[list[UUID], list[str]]]:
+        """Yield (tenant_ids, api_key_encrypted) column pairs, one per fetched batch."""
+        stmt = (
+            select(Tenant.id, KiteCredential.api_key_encrypted)
+            .join(KiteCredential, KiteCredential.tenant_id == Tenant.id)
+            .where(Tenant.is_active.is_(True))
+            .order_by(Tenant.created_at)
+            .execution_options(yield_per=settings.ticker_tenant_fetch_batch_size)
+        )
         async with AsyncSessionLocal() as session:
-            stmt = (
-                select(Tenant.id, KiteCredential.api_key_encrypted)
-                .join(KiteCredential, KiteCredential.tenant_id == Tenant.id)
-                .where(Tenant.is_active.is_(True))
-                .order_by(Tenant.created_at)
-            )
-            rows = (await session.execute(stmt)).all()
-
-        return [
-            TenantTickerConfig(tenant_id=row.id, api_key_encrypted=row.api_key_encrypted)
-            for row in rows
-        ]
+            result = await session.stream(stmt)
+            async for rows in result.partitions():
+                yield [row[0] for row in rows], [row[1] for row in rows]
 
 
 ticker_agent = TickerAgent()
-app = FastAPI(title="Orra Ticker Agent")
 
 
-@app.on_event("startup")
-async def startup_event() -> None:
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
     logging.basicConfig(level=logging.INFO)
-    app.state.task = asyncio.create_task(ticker_agent.run())
+    task = asyncio.create_task(ticker_agent.run())
+    try:
+        yield
+    finally:
+        await ticker_agent.stop()
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
 
 
-@app.on_event("shutdown")
-async def shutdown_event() -> None:
-    await ticker_agent.stop()
-    task: asyncio.Task[None] = app.state.task
-    task.cancel()
-    with contextlib.suppress(asyncio.CancelledError):
-        await task
+app = FastAPI(title="Orra Ticker Agent", lifespan=lifespan)
 
 
 @app.get("/health", tags=["system"])
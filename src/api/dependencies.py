@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+import redis.asyncio as redis
+
+from src.core.redis import get_redis_client
+
+
+def get_redis() -> redis.Redis:
+    return get_redis_client()
@@ -1,3 +1,8 @@
+from __future__ import annotations
+
+import contextlib
+from collections.abc import AsyncIterator
+
 from fastapi import FastAPI
 
 from src.api.middleware import tenant_context_middleware
@@ -6,9 +11,26 @@ from src.api.routes.admin import router as admin_router
 from src.api.routes.billing import router as billing_router
 from src.api.routes.connections import router as connections_router
 from src.api.routes.profiles import router as profiles_router
+from src.api.routes.webhooks import billing_events
 from src.api.routes.webhooks import router as webhooks_router
+from src.core.auth import jwks_cache
+from src.core.billing import close_clerk_http
+from src.core.redis import close_redis_pool
+
+
+@contextlib.asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    await billing_events.start()
+    try:
+        yield
+    finally:
+        await billing_events.aclose()
+        await close_redis_pool()
+        await close_clerk_http()
+        await jwks_cache.aclose()
+
 
-app = FastAPI(title="Orra Trading Platform")
+app = FastAPI(title="Orra Trading Platform", lifespan=lifespan)
 app.middleware("http")(tenant_context_middleware)
 app.include_router(connections_router, prefix="/api/v1")
 app.include_router(account_router, prefix="/api/v1")
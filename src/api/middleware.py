@@ -6,13 +6,22 @@ from fastapi import Request
 from starlette.responses import Response
 
 from src.core.context import reset_current_tenant_id, set_current_tenant_id
+from src.core.repositories.base import begin_request_row_cache, end_request_row_cache
+
+_TENANT_SCOPED_PREFIX = "/api/"
 
 
 async def tenant_context_middleware(
     request: Request, call_next: Callable[[Request], Awaitable[Response]]
 ) -> Response:
+    # Probes and docs never touch tenant data; skip the per-request context setup.
+    if not request.scope["path"].startswith(_TENANT_SCOPED_PREFIX):
+        return await call_next(request)
+
     token = set_current_tenant_id(None)
+    rows_token = begin_request_row_cache()
     try:
         return await call_next(request)
     finally:
+        end_request_row_cache(rows_token)
         reset_current_tenant_id(token)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 from datetime import datetime, timezone
 
 import redis.asyncio as redis
@@ -7,6 +8,7 @@ from fastapi import APIRouter, Depends, HTTPException, status
 from kiteconnect import KiteConnect
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.api.dependencies import get_redis
 from src.core.auth import AuthContext, require_auth_context
 from src.core.config import settings
 from src.core.db import get_db_session
@@ -23,7 +25,11 @@ from src.schemas.account import (
 router = APIRouter(prefix="/account", tags=["account"])
 
 
-@router.put("/kite-credentials", response_model=KiteCredentialStatusResponse)
+@router.put(
+    "/kite-credentials",
+    response_model=KiteCredentialStatusResponse,
+    response_model_exclude_none=True,
+)
 async def upsert_kite_credentials(
     payload: KiteCredentialUpsertRequest,
     auth: AuthContext = Depends(require_auth_context),
@@ -31,23 +37,12 @@ async def upsert_kite_credentials(
 ) -> KiteCredentialStatusResponse:
     cipher = get_security_cipher()
     repository = KiteCredentialRepository(session)
-    existing = await repository.get_by_user_id(auth.user_id)
-
-    encrypted_values = {
-        "api_key_encrypted": cipher.encrypt(payload.api_key),
-        "api_secret_encrypted": cipher.encrypt(payload.api_secret),
-        "totp_secret_encrypted": cipher.encrypt(payload.totp_secret),
-    }
-
-    if existing is None:
-        credential = await repository.create(user_id=auth.user_id, **encrypted_values)
-    else:
-        credential = await repository.update(existing.id, **encrypted_values)
-        if credential is None:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update Kite credentials",
-            )
+    credential = await repository.upsert(
+        auth.user_id,
+        api_key_encrypted=cipher.encrypt(payload.api_key),
+        api_secret_encrypted=cipher.encrypt(payload.api_secret),
+        totp_secret_encrypted=cipher.encrypt(payload.totp_secret),
+    )
 
     await session.commit()
     return KiteCredentialStatusResponse(
@@ -56,7 +51,11 @@ async def upsert_kite_credentials(
     )
 
 
-@router.get("/kite-credentials/status", response_model=KiteCredentialStatusResponse)
+@router.get(
+    "/kite-credentials/status",
+    response_model=KiteCredentialStatusResponse,
+    response_model_exclude_none=True,
+)
 async def kite_credentials_status(
     auth: AuthContext = Depends(require_auth_context),
     session: AsyncSession = Depends(get_db_session),
@@ -72,11 +71,16 @@ async def kite_credentials_status(
     )
 
 
-@router.post("/kite/check-connection", response_model=KiteConnectionCheckResponse)
+@router.post(
+    "/kite/check-connection",
+    response_model=KiteConnectionCheckResponse,
+    response_model_exclude_none=True,
+)
 async def check_kite_connection(
     payload: KiteConnectionCheckRequest,
     auth: AuthContext = Depends(require_auth_context),
     session: AsyncSession = Depends(get_db_session),
+    redis_client: redis.Redis = Depends(get_redis),
 ) -> KiteConnectionCheckResponse:
     repository = KiteCredentialRepository(session)
     credential = await repository.get_by_user_id(auth.user_id)
@@ -88,9 +92,9 @@ async def check_kite_connection(
 
     cipher = get_security_cipher()
     try:
+        # The TOTP secret stays encrypted: only the auth agent's login flow consumes it.
         api_key = cipher.decrypt(credential.api_key_encrypted)
         api_secret = cipher.decrypt(credential.api_secret_encrypted)
-        _ = cipher.decrypt(credential.totp_secret_encrypted)
     except EncryptionError as exc:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -99,25 +103,24 @@ async def check_kite_connection(
 
     kite = KiteConnect(api_key=api_key)
     try:
-        session_data = kite.generate_session(payload.request_token, api_secret=api_secret)
+        # KiteConnect is requests-based; keep its HTTP round-trips off the event loop.
+        session_data = await asyncio.to_thread(
+            kite.generate_session, payload.request_token, api_secret=api_secret
+        )
         access_token = session_data.get("access_token")
         if not access_token:
             raise ValueError("Kite access token is missing from response")
 
-        redis_client = redis.from_url(settings.redis_url, decode_responses=True)
-        try:
-            await redis_client.set(
-                f"kite:access_token:{auth.tenant_id}",
-                access_token,
-                ex=settings.auth_token_ttl_seconds,
-            )
-            await redis_client.set(
-                f"kite:connection_status:{auth.tenant_id}",
-                "connected",
-                ex=settings.auth_token_ttl_seconds,
-            )
-        finally:
-            await redis_client.aclose()
+        await redis_client.set(
+            f"kite:access_token:{auth.tenant_id}",
+            access_token,
+            ex=settings.auth_token_ttl_seconds,
+        )
+        await redis_client.set(
+            f"kite:connection_status:{auth.tenant_id}",
+            "connected",
+            ex=settings.auth_token_ttl_seconds,
+        )
 
         return KiteConnectionCheckResponse(
             success=True,
@@ -128,4 +131,5 @@ async def check_kite_connection(
         return KiteConnectionCheckResponse(
             success=False,
             message=f"Kite connection failed: {exc}",
+            kite_user_id=None,
         )
@@ -1,12 +1,14 @@
 from __future__ import annotations
 
+import orjson
 import redis.asyncio as redis
-from fastapi import APIRouter, Depends
-from sqlalchemy import func, select, text
+from fastapi import APIRouter, Depends, Response
+from sqlalchemy import exists, func, select, text
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import load_only
 
+from src.api.dependencies import get_redis
 from src.core.auth import AuthContext, require_super_admin
-from src.core.config import settings
 from src.core.db import get_db_session
 from src.models.kite_credential import KiteCredential
 from src.models.tenant import Tenant
@@ -19,41 +21,46 @@ router = APIRouter(prefix="/admin", tags=["admin"])
 async def list_active_tenants(
     _: AuthContext = Depends(require_super_admin),
     session: AsyncSession = Depends(get_db_session),
-) -> list[TenantConnectionStatus]:
+    redis_client: redis.Redis = Depends(get_redis),
+) -> Response:
+    # Semi-join instead of JOIN + GROUP BY, loading only the columns the response uses.
     stmt = (
         select(Tenant)
-        .join(KiteCredential, KiteCredential.tenant_id == Tenant.id)
-        .group_by(Tenant.id)
+        .options(load_only(Tenant.id, Tenant.clerk_org_id, Tenant.subscription_tier))
+        .where(exists().where(KiteCredential.tenant_id == Tenant.id))
         .order_by(Tenant.created_at)
     )
     tenants = (await session.scalars(stmt)).all()
 
-    redis_client = redis.from_url(settings.redis_url, decode_responses=True)
-    try:
-        statuses: list[TenantConnectionStatus] = []
+    async with redis_client.pipeline(transaction=False) as pipe:
         for tenant in tenants:
             token_key = f"kite:access_token:{tenant.id}"
-            token = await redis_client.get(token_key)
-            ttl = await redis_client.ttl(token_key)
-            statuses.append(
-                TenantConnectionStatus(
-                    tenant_id=str(tenant.id),
-                    clerk_org_id=tenant.clerk_org_id,
-                    subscription_tier=tenant.subscription_tier,
-                    connected=bool(token),
-                    token_ttl_seconds=ttl if ttl >= 0 else None,
-                )
-            )
-    finally:
-        await redis_client.aclose()
+            pipe.get(token_key)
+            pipe.ttl(token_key)
+        results = await pipe.execute()
 
-    return statuses
+    # Rows come straight from our own DB/Redis, so skip per-row model validation and
+    # encode once with orjson; response_model still documents the shape.
+    rows = []
+    for tenant, token, ttl in zip(tenants, results[::2], results[1::2]):
+        row = {
+            "tenant_id": str(tenant.id),
+            "clerk_org_id": tenant.clerk_org_id,
+            "subscription_tier": tenant.subscription_tier,
+            "connected": bool(token),
+        }
+        # Same convention as the model-backed routes: unset optionals are omitted.
+        if ttl >= 0:
+            row["token_ttl_seconds"] = ttl
+        rows.append(row)
+    return Response(content=orjson.dumps(rows), media_type="application/json")
 
 
 @router.get("/system/health", response_model=SystemHealthResponse)
 async def system_health(
     _: AuthContext = Depends(require_super_admin),
     session: AsyncSession = Depends(get_db_session),
+    redis_client: redis.Redis = Depends(get_redis),
 ) -> SystemHealthResponse:
     database_ok = True
     try:
@@ -65,20 +72,18 @@ async def system_health(
 
     redis_ok = True
     connected_tenants = 0
-    redis_client = redis.from_url(settings.redis_url, decode_responses=True)
     try:
         pong = await redis_client.ping()
         redis_ok = bool(pong)
 
         tenant_ids = (await session.scalars(select(Tenant.id))).all()
-        for tenant_id in tenant_ids:
-            key = f"kite:access_token:{tenant_id}"
-            if await redis_client.exists(key):
-                connected_tenants += 1
+        if tenant_ids:
+            # EXISTS counts the keys server-side; no access token leaves Redis.
+            connected_tenants = int(
+                await redis_client.exists(*(f"kite:access_token:{tenant_id}" for tenant_id in tenant_ids))
+            )
     except Exception:
         redis_ok = False
-    finally:
-        await redis_client.aclose()
 
     status_value = "ok" if database_ok and redis_ok else "degraded"
     return SystemHealthResponse(
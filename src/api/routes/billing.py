@@ -18,12 +18,7 @@ router = APIRouter(prefix="/billing", tags=["billing"])
 async def get_entitlements(
     entitlements: TierEntitlements = Depends(get_current_entitlements),
 ) -> EntitlementResponse:
-    return EntitlementResponse(
-        tier=entitlements.tier,
-        max_strategies=entitlements.max_strategies,
-        daily_trade_limit=entitlements.daily_trade_limit,
-        priority_execution=entitlements.priority_execution,
-    )
+    return EntitlementResponse.from_orm_trusted(entitlements)
 
 
 @router.post("/guards/strategy")
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException, status
 from kiteconnect import KiteConnect
 from sqlalchemy.ext.asyncio import AsyncSession
@@ -14,7 +16,7 @@ from src.schemas.security import KiteConnectionTestRequest, KiteConnectionTestRe
 router = APIRouter(prefix="/connections", tags=["connections"])
 
 
-@router.post("/kite/test", response_model=KiteConnectionTestResponse)
+@router.post("/kite/test", response_model=KiteConnectionTestResponse, response_model_exclude_none=True)
 async def test_kite_connection(
     payload: KiteConnectionTestRequest,
     auth: AuthContext = Depends(require_auth_context),
@@ -35,9 +37,9 @@ async def test_kite_connection(
 
     cipher = get_security_cipher()
     try:
+        # The TOTP secret stays encrypted: only the auth agent's login flow consumes it.
         api_key = cipher.decrypt(credential.api_key_encrypted)
         api_secret = cipher.decrypt(credential.api_secret_encrypted)
-        _ = cipher.decrypt(credential.totp_secret_encrypted)
     except EncryptionError as exc:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
@@ -46,12 +48,15 @@ async def test_kite_connection(
 
     kite = KiteConnect(api_key=api_key)
     try:
-        session_data = kite.generate_session(payload.request_token, api_secret=api_secret)
+        # KiteConnect is requests-based; keep its HTTP round-trips off the event loop.
+        session_data = await asyncio.to_thread(
+            kite.generate_session, payload.request_token, api_secret=api_secret
+        )
         access_token = session_data.get("access_token")
         if not access_token:
             raise ValueError("Kite access token is missing from response")
         kite.set_access_token(access_token)
-        profile = kite.profile()
+        profile = await asyncio.to_thread(kite.profile)
     except Exception as exc:
         raise HTTPException(
             status_code=status.HTTP_400_BAD_REQUEST,
@@ -28,11 +28,7 @@ async def get_trading_profile(
             detail="Trading profile not found",
         )
 
-    return TradingProfileResponse(
-        max_daily_loss=profile.max_daily_loss,
-        max_orders=profile.max_orders,
-        master_switch_enabled=profile.master_switch_enabled,
-    )
+    return TradingProfileResponse.from_orm_trusted(profile)
 
 
 @router.put("/trading", response_model=TradingProfileResponse)
@@ -42,34 +38,15 @@ async def upsert_trading_profile(
     session: AsyncSession = Depends(get_db_session),
 ) -> TradingProfileResponse:
     repository = TradingProfileRepository(session)
-    existing = await repository.get_by_user_id(auth.user_id)
-
-    if existing is None:
-        profile = await repository.create(
-            user_id=auth.user_id,
-            max_daily_loss=payload.max_daily_loss,
-            max_orders=payload.max_orders,
-            master_switch_enabled=payload.master_switch_enabled,
-        )
-    else:
-        profile = await repository.update(
-            existing.id,
-            max_daily_loss=payload.max_daily_loss,
-            max_orders=payload.max_orders,
-            master_switch_enabled=payload.master_switch_enabled,
-        )
-        if profile is None:
-            raise HTTPException(
-                status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-                detail="Failed to update trading profile",
-            )
+    profile = await repository.upsert(
+        auth.user_id,
+        max_daily_loss_minor=payload.max_daily_loss_minor,
+        max_orders=payload.max_orders,
+        master_switch_enabled=payload.master_switch_enabled,
+    )
 
     await session.commit()
-    return TradingProfileResponse(
-        max_daily_loss=profile.max_daily_loss,
-        max_orders=profile.max_orders,
-        master_switch_enabled=profile.master_switch_enabled,
-    )
+    return TradingProfileResponse.from_orm_trusted(profile)
 
 
 @router.patch("/trading/master-switch", response_model=TradingProfileResponse)
@@ -94,8 +71,4 @@ async def update_master_switch(
         )
 
     await session.commit()
-    return TradingProfileResponse(
-        max_daily_loss=updated.max_daily_loss,
-        max_orders=updated.max_orders,
-        master_switch_enabled=updated.master_switch_enabled,
-    )
+    return TradingProfileResponse.from_orm_trusted(updated)
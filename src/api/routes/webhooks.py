@@ -1,21 +1,39 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import contextlib
+import hmac
+import logging
+import os
+import socket
+import zlib
+from collections.abc import Sequence
+from dataclasses import dataclass
+from functools import lru_cache
+from uuid import UUID
 
-import redis.asyncio as redis
-import stripe
-from fastapi import APIRouter, Depends, Header, HTTPException, Request, status
-from sqlalchemy import select, update
+import orjson
+from fastapi import APIRouter, Header, HTTPException, Request, status
+from redis.commands.core import AsyncScript
+from redis.exceptions import ResponseError
+from sqlalchemy import func, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.core.auth import tenant_cache_key
+from src.core.billing import tenant_tier_generation_key, tenant_tier_key
 from src.core.config import settings
-from src.core.db import get_db_session
+from src.core.db import AsyncSessionLocal
+from src.core.redis import get_redis_client
 from src.models.strategy_instance import StrategyInstance
 from src.models.tenant import Tenant
 from src.schemas.billing import BillingWebhookResponse
 
+logger = logging.getLogger(__name__)
+
 router = APIRouter(prefix="/webhooks", tags=["webhooks"])
 
+_HANDLED_EVENT_TYPES = frozenset({"invoice.paid", "subscription.deleted"})
+
 
 def _extract_org_id(payload: dict) -> str | None:
     data = (payload.get("data") or {}).get("object") or {}
@@ -34,21 +52,94 @@ def _extract_tier(payload: dict) -> str:
     return (metadata.get("subscription_tier") or metadata.get("tier") or "pro").lower()
 
 
-async def _set_tenant_redis_state(tenant_id: str, active: bool) -> None:
-    redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+# Applies a tenant status flip and its fanout as one atomic server-side command.
+# KEYS: active flag, org lookup cache, access token, connection status, resolved tier cache,
+# tier cache generation (bumped so tier cache writes racing this update are never read back).
+# ARGV: flag, status label, status channel, deactivated channel, deactivated ids json.
+_TENANT_STATE_LUA = """
+redis.call('SET', KEYS[1], ARGV[1])
+redis.call('DEL', KEYS[2], KEYS[5])
+redis.call('INCR', KEYS[6])
+redis.call('PUBLISH', ARGV[3], ARGV[2])
+if ARGV[1] == '0' then
+    redis.call('DEL', KEYS[3])
+    redis.call('SET', KEYS[4], 'inactive', 'EX', 86400)
+    if ARGV[5] ~= '' then
+        redis.call('PUBLISH', ARGV[4], ARGV[5])
+    end
+end
+return 1
+"""
+
+
+# Sent by SHA (EVALSHA); redis-py reloads it if the server has not seen it yet. Registered on
+# first use so importing this module never touches the Redis pool.
+@lru_cache(maxsize=1)
+def _tenant_state_script() -> AsyncScript:
+    return get_redis_client().register_script(_TENANT_STATE_LUA)
+
+
+async def _set_tenant_redis_state(
+    tenant_id: str,
+    active: bool,
+    org_id: str,
+    deactivated_strategy_ids: Sequence[UUID] = (),
+) -> None:
+    deactivated = (
+        orjson.dumps([str(strategy_id) for strategy_id in deactivated_strategy_ids])
+        if deactivated_strategy_ids
+        else b""
+    )
+    await _tenant_state_script()(
+        keys=[
+            f"tenant:active:{tenant_id}",
+            tenant_cache_key(org_id),
+            f"kite:access_token:{tenant_id}",
+            f"kite:connection_status:{tenant_id}",
+            tenant_tier_key(tenant_id),
+            tenant_tier_generation_key(tenant_id),
+        ],
+        args=[
+            "1" if active else "0",
+            "active" if active else "inactive",
+            f"billing:tenant_status:{tenant_id}",
+            f"strategies:deactivated:{tenant_id}",
+            deactivated,
+        ],
+        client=get_redis_client(),
+    )
+
+
+def _parse_unverified(raw_body: bytes) -> dict:
     try:
-        await redis_client.set(f"tenant:active:{tenant_id}", "1" if active else "0")
-        await redis_client.publish(
-            f"billing:tenant_status:{tenant_id}", "active" if active else "inactive"
+        payload = orjson.loads(raw_body)
+    except orjson.JSONDecodeError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload",
+        ) from exc
+    if not isinstance(payload, dict):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid webhook payload",
         )
-        if not active:
-            await redis_client.delete(f"kite:access_token:{tenant_id}")
-            await redis_client.set(f"kite:connection_status:{tenant_id}", "inactive", ex=24 * 60 * 60)
-    finally:
-        await redis_client.aclose()
+    return payload
+
+
+def _event_type(payload: dict) -> str:
+    event_type = payload.get("type")
+    return event_type if isinstance(event_type, str) else "unknown"
+
 
+def _verify_and_parse_event(
+    raw_body: bytes,
+    stripe_signature: str | None,
+    unverified: dict | None = None,
+) -> dict:
+    """Return the event payload, verifying the Stripe signature when a secret is configured.
 
-def _verify_and_parse_event(raw_body: bytes, stripe_signature: str | None) -> dict:
+    ``unverified`` is the already-decoded body of ``raw_body``; it is reused instead of parsing again.
+    """
     if settings.stripe_webhook_secret and not stripe_signature:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,47 +147,243 @@ def _verify_and_parse_event(raw_body: bytes, stripe_signature: str | None) -> di
         )
 
     if stripe_signature and settings.stripe_webhook_secret:
+        # Imported on first signed event: the SDK is slow to import and unused without a secret.
+        import stripe
+
+        # Only the HMAC is checked here; the body is decoded with orjson rather than
+        # built into a StripeObject and converted back to a dict.
         try:
-            event = stripe.Webhook.construct_event(
-                payload=raw_body,
-                sig_header=stripe_signature,
-                secret=settings.stripe_webhook_secret,
+            stripe.WebhookSignature.verify_header(
+                raw_body,
+                stripe_signature,
+                settings.stripe_webhook_secret,
+                tolerance=stripe.Webhook.DEFAULT_TOLERANCE,
             )
-            return event.to_dict_recursive()
         except Exception as exc:
             raise HTTPException(
                 status_code=status.HTTP_400_BAD_REQUEST,
                 detail=f"Invalid Stripe signature: {exc}",
             ) from exc
 
-    try:
-        return json.loads(raw_body.decode("utf-8"))
-    except json.JSONDecodeError as exc:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid webhook payload",
-        ) from exc
+    return unverified if unverified is not None else _parse_unverified(raw_body)
+
+
+@dataclass(slots=True)
+class BillingEvent:
+    event_type: str
+    org_id: str
+    tier: str
 
 
-@router.post("/billing", response_model=BillingWebhookResponse)
+async def _apply_billing_event(session: AsyncSession, event: BillingEvent) -> UUID | None:
+    tenant = await session.scalar(
+        select(Tenant).where(func.lower(Tenant.clerk_org_id) == event.org_id.lower())
+    )
+    if tenant is None:
+        logger.warning("Billing event %s for unknown org=%s", event.event_type, event.org_id)
+        return None
+
+    if event.event_type == "invoice.paid":
+        tenant.subscription_tier = event.tier
+        tenant.is_active = True
+        await session.commit()
+        await _set_tenant_redis_state(str(tenant.id), active=True, org_id=event.org_id)
+        return tenant.id
+
+    tenant.is_active = False
+    deactivated = await session.scalars(
+        update(StrategyInstance)
+        .where(StrategyInstance.tenant_id == tenant.id, StrategyInstance.is_active.is_(True))
+        .values(is_active=False)
+        .returning(StrategyInstance.id)
+    )
+    deactivated_ids = deactivated.all()
+    await session.commit()
+    await _set_tenant_redis_state(
+        str(tenant.id), active=False, org_id=event.org_id, deactivated_strategy_ids=deactivated_ids
+    )
+    return tenant.id
+
+
+class BillingEventQueue:
+    """Bounded worker pool that applies billing events after the webhook is acked.
+
+    ``submit`` appends each event to a Redis stream before the webhook is acked, so a crash,
+    restart or deploy cannot lose it. Entries are acked and deleted only once applied. Entries
+    left pending by a dead process, or by a failed apply, are reclaimed and retried once idle
+    for ``billing_events_claim_idle_ms``.
+
+    Events are sharded by org so one tenant's events are applied in arrival order.
+    """
+
+    def __init__(self, workers: int, maxsize: int) -> None:
+        self._shards: list[asyncio.Queue[tuple[str, BillingEvent]]] = [
+            asyncio.Queue(maxsize=maxsize) for _ in range(max(1, workers))
+        ]
+        self._tasks: list[asyncio.Task[None]] = []
+        # Delivered to this process but not yet applied; never reclaimed from ourselves.
+        self._in_flight: set[str] = set()
+        self._consumer = f"{socket.gethostname()}-{os.getpid()}"
+        self.metrics: dict[str, int] = {"enqueued": 0, "rejected": 0, "processed": 0, "failed": 0}
+
+    @property
+    def depth(self) -> int:
+        return sum(shard.qsize() for shard in self._shards)
+
+    async def submit(self, event: BillingEvent) -> bool:
+        try:
+            await get_redis_client().xadd(
+                settings.billing_events_stream_name,
+                {"event_type": event.event_type, "org_id": event.org_id, "tier": event.tier},
+            )
+        except Exception:
+            self.metrics["rejected"] += 1
+            logger.exception("Billing event %s for org=%s not persisted", event.event_type, event.org_id)
+            return False
+        self.metrics["enqueued"] += 1
+        return True
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        try:
+            await get_redis_client().xgroup_create(
+                name=settings.billing_events_stream_name,
+                groupname=settings.billing_events_consumer_group,
+                id="0",
+                mkstream=True,
+            )
+        except ResponseError as exc:
+            if "BUSYGROUP" not in str(exc):
+                raise
+        self._tasks = [
+            asyncio.create_task(self._read()),
+            *(asyncio.create_task(self._work(shard)) for shard in self._shards),
+        ]
+
+    async def _read(self) -> None:
+        redis_client = get_redis_client()
+        while True:
+            try:
+                # Stale entries first, so a dead consumer's backlog is not starved by new events.
+                _, entries, *_ = await redis_client.xautoclaim(
+                    settings.billing_events_stream_name,
+                    settings.billing_events_consumer_group,
+                    self._consumer,
+                    min_idle_time=settings.billing_events_claim_idle_ms,
+                    count=100,
+                )
+                entries = [entry for entry in entries if entry[0] not in self._in_flight]
+                if not entries:
+                    messages = await redis_client.xreadgroup(
+                        groupname=settings.billing_events_consumer_group,
+                        consumername=self._consumer,
+                        streams={settings.billing_events_stream_name: ">"},
+                        count=100,
+                        block=5000,
+                    )
+                    entries = [entry for _, stream_entries in messages or () for entry in stream_entries]
+                for message_id, fields in entries:
+                    await self._dispatch(message_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Billing event stream read failed")
+                await asyncio.sleep(1)
+
+    async def _dispatch(self, message_id: str, fields: dict[str, str]) -> None:
+        try:
+            event = BillingEvent(
+                event_type=fields["event_type"], org_id=fields["org_id"], tier=fields["tier"]
+            )
+        except (KeyError, TypeError):
+            logger.error("Discarding malformed billing event %s: %s", message_id, fields)
+            await self._ack(message_id)
+            return
+        self._in_flight.add(message_id)
+        shard = self._shards[zlib.crc32(event.org_id.encode()) % len(self._shards)]
+        await shard.put((message_id, event))
+
+    async def _ack(self, message_id: str) -> None:
+        async with get_redis_client().pipeline(transaction=False) as pipe:
+            pipe.xack(settings.billing_events_stream_name, settings.billing_events_consumer_group, message_id)
+            pipe.xdel(settings.billing_events_stream_name, message_id)
+            await pipe.execute()
+
+    async def _work(self, shard: asyncio.Queue[tuple[str, BillingEvent]]) -> None:
+        while True:
+            message_id, event = await shard.get()
+            try:
+                async with AsyncSessionLocal() as session:
+                    await _apply_billing_event(session, event)
+                await self._ack(message_id)
+                self.metrics["processed"] += 1
+            except Exception:
+                self.metrics["failed"] += 1
+                logger.exception(
+                    "Billing event %s failed for org=%s; left pending for retry",
+                    event.event_type,
+                    event.org_id,
+                )
+            finally:
+                self._in_flight.discard(message_id)
+                shard.task_done()
+
+    async def aclose(self, timeout: float = 10.0) -> None:
+        # Give in-flight work a chance to land; anything left stays pending in the stream.
+        if self._tasks:
+            with contextlib.suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(
+                    asyncio.gather(*(shard.join() for shard in self._shards)), timeout=timeout
+                )
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
+        self._tasks = []
+        if self._in_flight:
+            logger.warning("%d billing events left pending for redelivery", len(self._in_flight))
+        for shard in self._shards:
+            while not shard.empty():
+                shard.get_nowait()
+                shard.task_done()
+        self._in_flight.clear()
+
+
+billing_events = BillingEventQueue(
+    workers=settings.billing_webhook_workers,
+    maxsize=settings.billing_webhook_queue_size,
+)
+
+
+@router.post("/billing", response_model=BillingWebhookResponse, response_model_exclude_none=True)
 async def billing_webhook(
     request: Request,
-    session: AsyncSession = Depends(get_db_session),
     stripe_signature: str | None = Header(default=None, alias="Stripe-Signature"),
     clerk_secret: str | None = Header(default=None, alias="X-Clerk-Webhook-Secret"),
 ) -> BillingWebhookResponse:
-    if settings.clerk_webhook_secret and clerk_secret != settings.clerk_webhook_secret:
+    # Checked before the body is read so rejected callers never pay for ingest.
+    if settings.clerk_webhook_secret and not hmac.compare_digest(
+        (clerk_secret or "").encode(), settings.clerk_webhook_secret.encode()
+    ):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid Clerk webhook secret",
         )
 
     raw_body = await request.body()
-    payload = _verify_and_parse_event(raw_body, stripe_signature)
-    event_type = payload.get("type", "unknown")
+    # Decoded once; ignored events are acked without paying for signature verification.
+    payload = _parse_unverified(raw_body)
+    event_type = _event_type(payload)
+    if event_type in _HANDLED_EVENT_TYPES:
+        payload = _verify_and_parse_event(raw_body, stripe_signature, unverified=payload)
+        event_type = _event_type(payload)
 
-    if event_type not in {"invoice.paid", "subscription.deleted"}:
-        return BillingWebhookResponse(received=True, event_type=event_type, tenant_id=None, updated=False)
+    if event_type not in _HANDLED_EVENT_TYPES:
+        return BillingWebhookResponse(
+            received=True, event_type=event_type, tenant_id=None, updated=False, queued=False
+        )
 
     org_id = _extract_org_id(payload)
     if not org_id:
@@ -105,34 +392,18 @@ async def billing_webhook(
             detail="Webhook payload missing org identifier",
         )
 
-    tenant = await session.scalar(select(Tenant).where(Tenant.clerk_org_id == org_id))
-    if tenant is None:
-        return BillingWebhookResponse(received=True, event_type=event_type, tenant_id=None, updated=False)
-
-    if event_type == "invoice.paid":
-        tenant.subscription_tier = _extract_tier(payload)
-        tenant.is_active = True
-        await session.commit()
-        await _set_tenant_redis_state(str(tenant.id), active=True)
-        return BillingWebhookResponse(
-            received=True,
-            event_type=event_type,
-            tenant_id=str(tenant.id),
-            updated=True,
+    # Ack once persisted; a worker applies the tenant update. A failed write makes the sender retry.
+    event = BillingEvent(event_type=event_type, org_id=org_id, tier=_extract_tier(payload))
+    if not await billing_events.submit(event):
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Billing event could not be queued",
         )
 
-    tenant.is_active = False
-    await session.execute(
-        update(StrategyInstance)
-        .where(StrategyInstance.tenant_id == tenant.id)
-        .values(is_active=False)
-    )
-    await session.commit()
-    await _set_tenant_redis_state(str(tenant.id), active=False)
-
     return BillingWebhookResponse(
         received=True,
         event_type=event_type,
-        tenant_id=str(tenant.id),
-        updated=True,
+        tenant_id=None,
+        updated=False,
+        queued=True,
     )
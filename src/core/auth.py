@@ -1,21 +1,31 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import logging
 import time
+from collections import OrderedDict
 from dataclasses import dataclass
+from functools import lru_cache
 from uuid import NAMESPACE_URL, UUID, uuid5
 
-import requests
+import httpx
+import orjson
+import redis.asyncio as redis
 from fastapi import Depends, HTTPException, Request, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from jose import JWTError, jwt
-from sqlalchemy import select
+from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.core.config import settings
 from src.core.context import set_current_tenant_id
 from src.core.db import get_db_session
+from src.core.redis import get_redis_client
 from src.models.tenant import Tenant
 
+logger = logging.getLogger(__name__)
+
 bearer_scheme = HTTPBearer(auto_error=True)
 
 
@@ -28,26 +38,133 @@ class AuthContext:
     claims: dict
 
 
+def _max_age(cache_control: str | None) -> int | None:
+    for directive in (cache_control or "").split(","):
+        name, _, value = directive.strip().partition("=")
+        if name.lower() == "max-age" and value.isdigit():
+            return int(value)
+    return None
+
+
 class JwksCache:
-    def __init__(self, ttl_seconds: int = 300) -> None:
+    def __init__(
+        self,
+        ttl_seconds: int = 300,
+        stale_seconds: int = 900,
+        min_refresh_seconds: int = 30,
+        min_ttl_seconds: int = 60,
+        max_ttl_seconds: int = 3600,
+    ) -> None:
         self.ttl_seconds = ttl_seconds
+        self.stale_seconds = stale_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.min_ttl_seconds = min_ttl_seconds
+        self.max_ttl_seconds = max_ttl_seconds
         self._jwks: dict | None = None
+        self._by_kid: dict[str, dict] = {}
         self._fetched_at = 0.0
-
-    def get(self, url: str) -> dict:
-        now = time.time()
-        if self._jwks is None or (now - self._fetched_at) > self.ttl_seconds:
-            response = requests.get(url, timeout=5)
-            response.raise_for_status()
-            self._jwks = response.json()
+        self._fresh_for = float(ttl_seconds)
+        self._lock = asyncio.Lock()
+        self._http: httpx.AsyncClient | None = None
+
+    def _client(self) -> httpx.AsyncClient:
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(timeout=5, limits=httpx.Limits(max_keepalive_connections=4))
+        return self._http
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+
+    def _fresh(self, now: float) -> bool:
+        return self._jwks is not None and now - self._fetched_at <= self._fresh_for
+
+    async def get(self, url: str) -> dict:
+        if self._fresh(time.monotonic()):
+            return self._jwks  # type: ignore[return-value]
+        return await self._refresh(url, seen=self._fetched_at)
+
+    async def get_key(self, url: str, kid: str) -> dict | None:
+        await self.get(url)
+        key = self._by_kid.get(kid)
+        # An unknown kid usually means Clerk rotated keys: refetch once, rate-limited so
+        # tokens with made-up kids cannot hammer the JWKS endpoint.
+        if key is None and time.monotonic() - self._fetched_at >= self.min_refresh_seconds:
+            await self._refresh(url, seen=self._fetched_at)
+            key = self._by_kid.get(kid)
+        return key
+
+    async def _refresh(self, url: str, *, seen: float) -> dict:
+        # Single-flight: concurrent callers wait for one fetch instead of each hitting Clerk.
+        async with self._lock:
+            if self._jwks is not None and self._fetched_at != seen:
+                return self._jwks
+            now = time.monotonic()
+            try:
+                response = await self._client().get(url)
+                response.raise_for_status()
+                jwks = response.json()
+            except (httpx.HTTPError, ValueError):
+                if self._jwks is not None and now - self._fetched_at <= self._fresh_for + self.stale_seconds:
+                    logger.warning("JWKS refresh failed; serving cached keys", exc_info=True)
+                    return self._jwks
+                raise
+
+            self._jwks = jwks
+            self._by_kid = {key["kid"]: key for key in jwks.get("keys", []) if key.get("kid")}
             self._fetched_at = now
-        return self._jwks
+            max_age = _max_age(response.headers.get("cache-control"))
+            # Clamp the issuer's max-age so a misconfigured header cannot pin or thrash the cache.
+            ttl = self.ttl_seconds if max_age is None else max_age
+            self._fresh_for = float(min(max(ttl, self.min_ttl_seconds), self.max_ttl_seconds))
+            return jwks
 
 
 jwks_cache = JwksCache()
 
 
-def _get_signing_key(token: str) -> dict:
+class ClaimsCache:
+    """Verified claims keyed by token digest, so repeat tokens skip RS256 verification."""
+
+    def __init__(self, maxsize: int = 10_000, ttl_seconds: int = 300, negative_ttl_seconds: int = 5) -> None:
+        self.maxsize = maxsize
+        self.ttl_seconds = ttl_seconds
+        self.negative_ttl_seconds = negative_ttl_seconds
+        # digest -> (expires_at, claims); claims is None for tokens that failed verification.
+        self._entries: OrderedDict[bytes, tuple[float, dict | None]] = OrderedDict()
+
+    @staticmethod
+    def key(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def get(self, key: bytes, now: float) -> tuple[float, dict | None] | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: bytes, claims: dict | None, now: float) -> None:
+        if claims is None:
+            expires_at = now + self.negative_ttl_seconds
+        else:
+            expires_at = now + self.ttl_seconds
+            exp = claims.get("exp")
+            if isinstance(exp, (int, float)):
+                expires_at = min(expires_at, float(exp))
+        self._entries[key] = (expires_at, claims)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+
+claims_cache = ClaimsCache()
+
+
+async def _get_signing_key(token: str) -> dict:
     try:
         unverified_header = jwt.get_unverified_header(token)
     except JWTError as exc:
@@ -63,10 +180,9 @@ def _get_signing_key(token: str) -> dict:
             detail="JWT is missing key id",
         )
 
-    jwks = jwks_cache.get(settings.clerk_jwks_url)
-    for key in jwks.get("keys", []):
-        if key.get("kid") == kid:
-            return key
+    key = await jwks_cache.get_key(settings.clerk_jwks_url, kid)
+    if key is not None:
+        return key
 
     raise HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -74,12 +190,23 @@ def _get_signing_key(token: str) -> dict:
     )
 
 
-def _decode_clerk_jwt(token: str) -> dict:
-    key = _get_signing_key(token)
+async def _decode_clerk_jwt(token: str) -> dict:
+    cache_key = claims_cache.key(token)
+    now = time.time()
+    cached = claims_cache.get(cache_key, now)
+    if cached is not None:
+        if cached[1] is None:
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Invalid or expired token",
+            )
+        return cached[1]
+
+    key = await _get_signing_key(token)
 
     options = {"verify_aud": bool(settings.clerk_audience)}
     try:
-        return jwt.decode(
+        claims = jwt.decode(
             token,
             key,
             algorithms=["RS256"],
@@ -88,18 +215,71 @@ def _decode_clerk_jwt(token: str) -> dict:
             options=options,
         )
     except JWTError as exc:
+        # Briefly remember the rejection so replayed bad tokens do not cost an RSA verify each.
+        claims_cache.put(cache_key, None, now)
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         ) from exc
 
+    claims_cache.put(cache_key, claims, now)
+    return claims
+
+
+@dataclass(slots=True)
+class CachedTenant:
+    id: UUID
+    is_active: bool
+    subscription_tier: str
+
+
+def tenant_cache_key(org_id: str) -> str:
+    return f"tenant:by_org:{org_id.lower()}"
+
+
+async def _load_tenant_by_org(session: AsyncSession, org_id: str) -> CachedTenant | None:
+    redis_client = get_redis_client()
+    cache_key = tenant_cache_key(org_id)
+    try:
+        cached = await redis_client.get(cache_key)
+    except redis.RedisError:
+        logger.warning("Tenant cache read failed for org=%s", org_id, exc_info=True)
+        cached = None
+    if cached:
+        data = orjson.loads(cached)
+        return CachedTenant(
+            id=UUID(data["id"]),
+            is_active=data["is_active"],
+            subscription_tier=data["subscription_tier"],
+        )
+
+    row = (
+        await session.execute(
+            select(Tenant.id, Tenant.is_active, Tenant.subscription_tier).where(
+                func.lower(Tenant.clerk_org_id) == org_id.lower()
+            )
+        )
+    ).first()
+    if row is None:
+        return None
+
+    tenant = CachedTenant(id=row.id, is_active=row.is_active, subscription_tier=row.subscription_tier)
+    payload = orjson.dumps(
+        {"id": str(tenant.id), "is_active": tenant.is_active, "subscription_tier": tenant.subscription_tier}
+    )
+    try:
+        await redis_client.set(cache_key, payload, ex=settings.tenant_cache_ttl_seconds)
+    except redis.RedisError:
+        logger.warning("Tenant cache write failed for org=%s", org_id, exc_info=True)
+    return tenant
+
 
 async def require_auth_context(
     request: Request,
     credentials: HTTPAuthorizationCredentials = Depends(bearer_scheme),
     session: AsyncSession = Depends(get_db_session),
 ) -> AuthContext:
-    claims = _decode_clerk_jwt(credentials.credentials)
+    claims = await _decode_clerk_jwt(credentials.credentials)
 
     org_id = claims.get("org_id")
     subject = claims.get("sub")
@@ -110,9 +290,7 @@ async def require_auth_context(
             detail="Token is missing required claims",
         )
 
-    tenant = await session.scalar(
-        select(Tenant).where(Tenant.clerk_org_id == org_id)
-    )
+    tenant = await _load_tenant_by_org(session, org_id)
     if tenant is None:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -134,6 +312,8 @@ async def require_auth_context(
     )
 
 
+# Runs on every authenticated request; active subjects repeat, so memoize the SHA-1.
+@lru_cache(maxsize=4096)
 def subject_to_user_id(subject: str) -> UUID:
     return uuid5(NAMESPACE_URL, f"clerk:{subject}")
 
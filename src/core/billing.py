@@ -1,26 +1,27 @@
 from __future__ import annotations
 
-import asyncio
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
 from typing import Literal
+from uuid import UUID
 
-import redis.asyncio as redis
-import requests
-from fastapi import Depends, HTTPException, status
+import httpx
+from fastapi import Depends, HTTPException, Request, status
 from sqlalchemy import func, select
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from src.core.auth import AuthContext, require_auth_context
+from src.core.auth import AuthContext, require_auth_context, tenant_cache_key
 from src.core.config import settings
 from src.core.db import get_db_session
+from src.core.redis import get_redis_client
 from src.models.strategy_instance import StrategyInstance
 from src.models.tenant import Tenant
 
 SubscriptionTier = Literal["basic", "pro"]
 
 
-@dataclass(slots=True)
+@dataclass(frozen=True, slots=True)
 class TierEntitlements:
     tier: SubscriptionTier
     max_strategies: int | None
@@ -30,7 +31,13 @@ class TierEntitlements:
 
 def tier_to_entitlements(tier: str) -> TierEntitlements:
     normalized = (tier or "basic").strip().lower()
-    if normalized == "pro":
+    return _entitlements_for("pro" if normalized == "pro" else "basic")
+
+
+# Frozen, so one shared instance per tier is handed to every request.
+@lru_cache(maxsize=2)
+def _entitlements_for(tier: SubscriptionTier) -> TierEntitlements:
+    if tier == "pro":
         return TierEntitlements(
             tier="pro",
             max_strategies=None,
@@ -46,21 +53,54 @@ def tier_to_entitlements(tier: str) -> TierEntitlements:
     )
 
 
+def tenant_tier_key(tenant_id: UUID | str) -> str:
+    return f"tenant:tier:{tenant_id}"
+
+
+def tenant_tier_generation_key(tenant_id: UUID | str) -> str:
+    return f"tenant:tier_gen:{tenant_id}"
+
+
+def _inactive_tenant() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_403_FORBIDDEN,
+        detail="Tenant subscription is inactive",
+    )
+
+
+# Shared across requests so keep-alive TLS connections to Clerk are reused.
+_clerk_http: httpx.AsyncClient | None = None
+
+
+def _get_clerk_http() -> httpx.AsyncClient:
+    global _clerk_http
+    if _clerk_http is None or _clerk_http.is_closed:
+        _clerk_http = httpx.AsyncClient(
+            timeout=8,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        )
+    return _clerk_http
+
+
+async def close_clerk_http() -> None:
+    if _clerk_http is not None:
+        await _clerk_http.aclose()
+
+
 class ClerkBillingClient:
     def __init__(self) -> None:
         self.base_url = settings.clerk_api_base_url.rstrip("/")
 
-    def fetch_org_subscription_tier(self, clerk_org_id: str) -> str:
+    async def fetch_org_subscription_tier(self, clerk_org_id: str) -> str:
         if not settings.clerk_secret_key:
             raise HTTPException(
                 status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
                 detail="CLERK_SECRET_KEY is not configured",
             )
 
-        response = requests.get(
+        response = await _get_clerk_http().get(
             f"{self.base_url}/organizations/{clerk_org_id}",
             headers={"Authorization": f"Bearer {settings.clerk_secret_key}"},
-            timeout=8,
         )
         response.raise_for_status()
         body = response.json()
@@ -79,22 +119,20 @@ async def resolve_tenant_subscription_tier(
     context: AuthContext,
     session: AsyncSession,
 ) -> str:
-    client = ClerkBillingClient()
-    try:
-        clerk_tier = await asyncio.to_thread(client.fetch_org_subscription_tier, context.org_id)
-    except Exception:
-        tenant = await session.scalar(select(Tenant).where(Tenant.id == context.tenant_id))
-        if tenant is None:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Tenant not found",
-            )
-        if not tenant.is_active:
-            raise HTTPException(
-                status_code=status.HTTP_403_FORBIDDEN,
-                detail="Tenant subscription is inactive",
-            )
-        return tenant.subscription_tier
+    # Cached as "<generation>:<active 0|1>:<tier>". Billing webhooks bump the generation whenever
+    # they change a tenant's tier or status, so an entry written by a request that read the tenant
+    # before the webhook landed never matches again, even if its SET arrives after the webhook's DEL.
+    redis_client = get_redis_client()
+    tier_key = tenant_tier_key(context.tenant_id)
+    cached, generation = await redis_client.mget(tier_key, tenant_tier_generation_key(context.tenant_id))
+    generation = generation or "0"
+    if cached is not None:
+        cached_generation, _, entry = cached.partition(":")
+        if cached_generation == generation:
+            active, _, tier = entry.partition(":")
+            if active != "1":
+                raise _inactive_tenant()
+            return tier
 
     tenant = await session.scalar(select(Tenant).where(Tenant.id == context.tenant_id))
     if tenant is None:
@@ -103,43 +141,67 @@ async def resolve_tenant_subscription_tier(
             detail="Tenant not found",
         )
     if not tenant.is_active:
-        raise HTTPException(
-            status_code=status.HTTP_403_FORBIDDEN,
-            detail="Tenant subscription is inactive",
+        await redis_client.set(
+            tier_key, f"{generation}:0:{tenant.subscription_tier}", ex=settings.tenant_tier_cache_ttl_seconds
         )
+        raise _inactive_tenant()
+
+    client = ClerkBillingClient()
+    try:
+        clerk_tier = await client.fetch_org_subscription_tier(context.org_id)
+    except Exception:
+        return tenant.subscription_tier
 
     if tenant.subscription_tier != clerk_tier:
         tenant.subscription_tier = clerk_tier
         await session.commit()
+        await redis_client.delete(tenant_cache_key(context.org_id))
 
+    await redis_client.set(
+        tier_key, f"{generation}:1:{clerk_tier}", ex=settings.tenant_tier_cache_ttl_seconds
+    )
     return clerk_tier
 
 
 async def get_current_entitlements(
+    request: Request,
     context: AuthContext = Depends(require_auth_context),
     session: AsyncSession = Depends(get_db_session),
 ) -> TierEntitlements:
-    tier = await resolve_tenant_subscription_tier(context, session)
-    return tier_to_entitlements(tier)
+    # Resolved once per request; the enforce_* guards reuse it.
+    entitlements = getattr(request.state, "entitlements", None)
+    if entitlements is None:
+        tier = await resolve_tenant_subscription_tier(context, session)
+        entitlements = request.state.entitlements = tier_to_entitlements(tier)
+    return entitlements
+
+
+async def _count_active_strategies(tenant_id: UUID, session: AsyncSession, cap: int) -> int:
+    """Return the tenant's active strategy count, counting no further than ``cap``."""
+    # Not cached: strategy writers do not maintain a count, so a cached value would go stale.
+    # Only whether the cap is reached matters, so Postgres stops after `cap` rows.
+    active = (
+        select(StrategyInstance.id)
+        .where(
+            StrategyInstance.tenant_id == tenant_id,
+            StrategyInstance.is_active.is_(True),
+        )
+        .limit(cap)
+        .subquery()
+    )
+    return int(await session.scalar(select(func.count()).select_from(active)) or 0)
 
 
 async def enforce_strategy_limit(
+    request: Request,
     context: AuthContext = Depends(require_auth_context),
     session: AsyncSession = Depends(get_db_session),
 ) -> TierEntitlements:
-    entitlements = await get_current_entitlements(context, session)
+    entitlements = await get_current_entitlements(request, context, session)
     if entitlements.max_strategies is None:
         return entitlements
 
-    active_count = int(
-        await session.scalar(
-            select(func.count(StrategyInstance.id)).where(
-                StrategyInstance.tenant_id == context.tenant_id,
-                StrategyInstance.is_active.is_(True),
-            )
-        )
-        or 0
-    )
+    active_count = await _count_active_strategies(context.tenant_id, session, entitlements.max_strategies)
     if active_count >= entitlements.max_strategies:
         raise HTTPException(
             status_code=status.HTTP_403_FORBIDDEN,
@@ -153,22 +215,22 @@ async def enforce_strategy_limit(
 
 
 async def enforce_daily_trade_limit(
+    request: Request,
     context: AuthContext = Depends(require_auth_context),
     session: AsyncSession = Depends(get_db_session),
 ) -> TierEntitlements:
-    entitlements = await get_current_entitlements(context, session)
+    entitlements = await get_current_entitlements(request, context, session)
     if entitlements.daily_trade_limit is None:
         return entitlements
 
     day_key = datetime.now(timezone.utc).strftime("%Y-%m-%d")
-    redis_client = redis.from_url(settings.redis_url, decode_responses=True)
+    redis_client = get_redis_client()
     redis_key = f"trades:count:{context.tenant_id}:{day_key}"
-    try:
-        count = await redis_client.incr(redis_key)
-        if count == 1:
-            await redis_client.expire(redis_key, 24 * 60 * 60)
-    finally:
-        await redis_client.aclose()
+    # EXPIRE NX (Redis 7+) only sets the TTL on the first trade of the day.
+    async with redis_client.pipeline(transaction=False) as pipe:
+        pipe.incr(redis_key)
+        pipe.expire(redis_key, 24 * 60 * 60, nx=True)
+        count, _ = await pipe.execute()
 
     if count > entitlements.daily_trade_limit:
         raise HTTPException(
@@ -3,12 +3,40 @@ from __future__ import annotations
 from collections.abc import AsyncGenerator
 from uuid import UUID
 
-from sqlalchemy import text
+from sqlalchemy import event, text
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, SessionTransaction
+from sqlalchemy.pool import NullPool
 
 from src.core.config import settings
 
-engine = create_async_engine(settings.database_url, future=True, pool_pre_ping=True)
+
+def _engine_pool_options() -> dict[str, object]:
+    if settings.db_use_null_pool:
+        return {"poolclass": NullPool}
+    return {
+        "pool_size": settings.db_pool_size,
+        "max_overflow": settings.db_max_overflow,
+        "pool_timeout": settings.db_pool_timeout_seconds,
+        "pool_recycle": settings.db_pool_recycle_seconds,
+        "pool_pre_ping": True,
+    }
+
+
+def _engine_connect_args() -> dict[str, object]:
+    # Sent as asyncpg startup parameters; behind PgBouncer add "jit" to ignore_startup_parameters.
+    server_settings = {"application_name": settings.db_application_name}
+    if not settings.db_jit:
+        server_settings["jit"] = "off"
+    return {"server_settings": server_settings}
+
+
+engine = create_async_engine(
+    settings.database_url,
+    future=True,
+    connect_args=_engine_connect_args(),
+    **_engine_pool_options(),
+)
 AsyncSessionLocal = async_sessionmaker(bind=engine, expire_on_commit=False, class_=AsyncSession)
 
 
@@ -17,8 +45,19 @@ async def get_db_session() -> AsyncGenerator[AsyncSession, None]:
         yield session
 
 
+_RLS_TENANT_KEY = "rls_tenant_id"
+# Constructed once instead of per request; the tenant id is always a bound parameter.
+_SET_RLS_TENANT = text("SELECT set_config('app.current_tenant_id', :tenant_id, true)")
+
+
 async def apply_rls_tenant_context(session: AsyncSession, tenant_id: UUID) -> None:
-    await session.execute(
-        text("SELECT set_config('app.current_tenant_id', :tenant_id, true)"),
-        {"tenant_id": str(tenant_id)},
-    )
+    # set_config(..., true) lasts until the transaction ends; skip repeats within it.
+    if session.info.get(_RLS_TENANT_KEY) == tenant_id:
+        return
+    await session.execute(_SET_RLS_TENANT, {"tenant_id": str(tenant_id)})
+    session.info[_RLS_TENANT_KEY] = tenant_id
+
+
+@event.listens_for(Session, "after_transaction_end")
+def _forget_rls_tenant(session: Session, _transaction: SessionTransaction) -> None:
+    session.info.pop(_RLS_TENANT_KEY, None)
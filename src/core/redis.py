@@ -0,0 +1,22 @@
+from __future__ import annotations
+
+import redis.asyncio as redis
+
+from src.core.config import settings
+
+# One pool per process; sockets are opened lazily and reused across requests. Callers
+# queue for a free connection under bursts instead of failing with MaxConnectionsError.
+redis_pool = redis.BlockingConnectionPool.from_url(
+    settings.redis_url,
+    decode_responses=True,
+    max_connections=settings.redis_max_connections,
+    timeout=settings.redis_pool_timeout_seconds,
+)
+
+
+def get_redis_client() -> redis.Redis:
+    return redis.Redis(connection_pool=redis_pool)
+
+
+async def close_redis_pool() -> None:
+    await redis_pool.aclose()
@@ -1,9 +1,13 @@
 from __future__ import annotations
 
-from typing import Generic, TypeVar
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Final, Generic, TypeVar
 from uuid import UUID
 
-from sqlalchemy import delete, select
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import Select
 
@@ -13,11 +17,34 @@ from src.models.base import TenantScopedBase
 
 ModelT = TypeVar("ModelT", bound=TenantScopedBase)
 
+_RowKey = tuple[type, UUID, str, object]
+
+# Rows loaded during the current request, keyed by (model, tenant, column, value).
+# None outside a request scope, which disables memoization (agents, scripts).
+_REQUEST_ROWS: Final[ContextVar[dict[_RowKey, object] | None]] = ContextVar(
+    "request_rows",
+    default=None,
+)
+
+
+def begin_request_row_cache() -> object:
+    return _REQUEST_ROWS.set({})
+
+
+def end_request_row_cache(token: object) -> None:
+    _REQUEST_ROWS.reset(token)
+
 
 class TenantContextMissingError(RuntimeError):
     pass
 
 
+# Select is generative, so one unfiltered statement per model can back every request.
+@lru_cache(maxsize=64)
+def _base_select(model: type[TenantScopedBase]) -> Select[tuple[TenantScopedBase]]:
+    return select(model)
+
+
 class TenantRepository(Generic[ModelT]):
     def __init__(self, session: AsyncSession, model: type[ModelT]) -> None:
         self.session = session
@@ -34,24 +61,88 @@ class TenantRepository(Generic[ModelT]):
         await apply_rls_tenant_context(self.session, self.tenant_id)
 
     def _scoped_select(self) -> Select[tuple[ModelT]]:
-        return select(self.model).where(self.model.tenant_id == self.tenant_id)
+        stmt = _base_select(self.model).where(self.model.tenant_id == self.tenant_id)
+        return stmt  # type: ignore[return-value]
+
+    def _remember(self, instance: ModelT) -> None:
+        rows = _REQUEST_ROWS.get()
+        if rows is None:
+            return
+        rows[(self.model, self.tenant_id, "id", instance.id)] = instance
+        user_id = getattr(instance, "user_id", None)
+        if user_id is not None:
+            rows[(self.model, self.tenant_id, "user_id", user_id)] = instance
+
+    def _forget(self, entity_id: UUID) -> None:
+        rows = _REQUEST_ROWS.get()
+        if not rows:
+            return
+        for key in [key for key, row in rows.items() if key[0] is self.model and row.id == entity_id]:
+            del rows[key]
+
+    async def _fetch_one(self, column: str, value: object, stmt: Select[tuple[ModelT]]) -> ModelT | None:
+        rows = _REQUEST_ROWS.get()
+        if rows is not None:
+            cached = rows.get((self.model, self.tenant_id, column, value))
+            if cached is not None:
+                return cached  # type: ignore[return-value]
+
+        await self._apply_rls()
+        result = await self.session.execute(stmt)
+        instance = result.scalar_one_or_none()
+        if instance is not None:
+            self._remember(instance)
+        return instance
 
     async def create(self, **values: object) -> ModelT:
         await self._apply_rls()
         payload = dict(values)
         payload.setdefault("tenant_id", self.tenant_id)
-        instance = self.model(**payload)
-        self.session.add(instance)
-        await self.session.flush()
-        await self.session.refresh(instance)
+        # RETURNING hands back the persisted row, so no follow-up refresh SELECT.
+        result = await self.session.execute(pg_insert(self.model).values(**payload).returning(self.model))
+        instance = result.scalar_one()
+        self._remember(instance)
         return instance
 
-    async def get(self, entity_id: UUID) -> ModelT | None:
+    async def _upsert(self, conflict_columns: tuple[str, ...], **values: object) -> ModelT:
+        """INSERT ... ON CONFLICT DO UPDATE ... RETURNING in a single round-trip."""
         await self._apply_rls()
-        result = await self.session.execute(
-            self._scoped_select().where(self.model.id == entity_id)
+        payload = dict(values)
+        payload.setdefault("tenant_id", self.tenant_id)
+        changes = {
+            field: value
+            for field, value in payload.items()
+            if field not in {"id", "tenant_id", *conflict_columns}
+        }
+        # Column onupdate hooks do not fire for ON CONFLICT, so stamp it here.
+        changes["updated_at"] = datetime.now(timezone.utc)
+        stmt = (
+            pg_insert(self.model)
+            .values(**payload)
+            .on_conflict_do_update(index_elements=list(conflict_columns), set_=changes)
+            .returning(self.model)
+            .execution_options(populate_existing=True)
         )
-        return result.scalar_one_or_none()
+        result = await self.session.execute(stmt)
+        instance = result.scalar_one()
+        self._remember(instance)
+        return instance
+
+    async def get(self, entity_id: UUID) -> ModelT | None:
+        return await self.get_by(id=entity_id)
+
+    async def get_by(self, **filters: object) -> ModelT | None:
+        """Return the first tenant row matching column=value filters."""
+        stmt = self._scoped_select().filter_by(**filters).limit(1)
+        if len(filters) == 1:
+            [(column, value)] = filters.items()
+            return await self._fetch_one(column, value, stmt)
+        await self._apply_rls()
+        result = await self.session.execute(stmt)
+        instance = result.scalar_one_or_none()
+        if instance is not None:
+            self._remember(instance)
+        return instance
 
     async def list(self, *, limit: int = 100, offset: int = 0) -> list[ModelT]:
         await self._apply_rls()
@@ -61,20 +152,27 @@ class TenantRepository(Generic[ModelT]):
         return list(result.scalars().all())
 
     async def update(self, entity_id: UUID, **values: object) -> ModelT | None:
-        instance = await self.get(entity_id)
-        if instance is None:
-            return None
-
-        for field, value in values.items():
-            if field in {"id", "tenant_id"}:
-                continue
-            setattr(instance, field, value)
+        changes = {field: value for field, value in values.items() if field not in {"id", "tenant_id"}}
+        if not changes:
+            return await self.get(entity_id)
 
-        await self.session.flush()
-        await self.session.refresh(instance)
+        await self._apply_rls()
+        stmt = (
+            update(self.model)
+            .where(self.model.id == entity_id)
+            .where(self.model.tenant_id == self.tenant_id)
+            .values(**changes)
+            .returning(self.model)
+            .execution_options(populate_existing=True, synchronize_session=False)
+        )
+        result = await self.session.execute(stmt)
+        instance = result.scalar_one_or_none()
+        if instance is not None:
+            self._remember(instance)
         return instance
 
     async def delete(self, entity_id: UUID) -> bool:
+        self._forget(entity_id)
         await self._apply_rls()
         result = await self.session.execute(
             delete(self.model)
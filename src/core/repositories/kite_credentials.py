@@ -13,8 +13,7 @@ class KiteCredentialRepository(TenantRepository[KiteCredential]):
         super().__init__(session=session, model=KiteCredential)
 
     async def get_by_user_id(self, user_id: UUID) -> KiteCredential | None:
-        await self._apply_rls()
-        result = await self.session.execute(
-            self._scoped_select().where(KiteCredential.user_id == user_id)
-        )
-        return result.scalar_one_or_none()
+        return await self.get_by(user_id=user_id)
+
+    async def upsert(self, user_id: UUID, **values: object) -> KiteCredential:
+        return await self._upsert(("tenant_id", "user_id"), user_id=user_id, **values)
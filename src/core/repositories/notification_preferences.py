@@ -1,11 +1,29 @@
 from __future__ import annotations
 
+import asyncio
+import logging
+from collections.abc import Iterable
 from uuid import UUID
 
+from sqlalchemy import event
 from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import Session
 
+from src.core.config import settings
+from src.core.redis import get_redis_client
 from src.core.repositories.base import TenantRepository
-from src.models.notification_preference import NotificationPreference
+from src.models.notification_preference import (
+    NotificationChannel,
+    NotificationPreference,
+    notification_flags,
+)
+
+logger = logging.getLogger(__name__)
+
+# Tenants whose preferences were written in the session's open transaction.
+_CHANGED_TENANTS_KEY = "notification_preferences_changed"
+# Strong references so in-flight publishes are not garbage collected.
+_publish_tasks: set[asyncio.Task[None]] = set()
 
 
 class NotificationPreferenceRepository(TenantRepository[NotificationPreference]):
@@ -13,8 +31,69 @@ class NotificationPreferenceRepository(TenantRepository[NotificationPreference])
         super().__init__(session=session, model=NotificationPreference)
 
     async def get_by_user_id(self, user_id: UUID) -> NotificationPreference | None:
-        await self._apply_rls()
-        result = await self.session.execute(
-            self._scoped_select().where(NotificationPreference.user_id == user_id)
-        )
-        return result.scalar_one_or_none()
+        return await self.get_by(user_id=user_id)
+
+    # channel and is_enabled are hybrids over flags, not columns, so they are folded into
+    # flags before the base class builds the INSERT / UPDATE.
+    async def create(self, **values: object) -> NotificationPreference:
+        payload = dict(values)
+        channel = payload.pop("channel", None)
+        is_enabled = payload.pop("is_enabled", None)
+        if "flags" not in payload:
+            payload["flags"] = notification_flags(
+                NotificationChannel.EMAIL if channel is None else channel,
+                True if is_enabled is None else is_enabled,
+            )
+        instance = await super().create(**payload)
+        self._mark_changed()
+        return instance
+
+    async def update(self, entity_id: UUID, **values: object) -> NotificationPreference | None:
+        changes = dict(values)
+        channel = changes.pop("channel", None)
+        is_enabled = changes.pop("is_enabled", None)
+        if channel is not None or is_enabled is not None:
+            changes["flags"] = NotificationPreference.flags_update_expression(
+                channel=channel, is_enabled=is_enabled
+            )
+        instance = await super().update(entity_id, **changes)
+        if instance is not None:
+            self._mark_changed()
+        return instance
+
+    async def delete(self, entity_id: UUID) -> bool:
+        deleted = await super().delete(entity_id)
+        if deleted:
+            self._mark_changed()
+        return deleted
+
+    def _mark_changed(self) -> None:
+        self.session.info.setdefault(_CHANGED_TENANTS_KEY, set()).add(self.tenant_id)
+
+
+async def publish_preference_changes(tenant_ids: Iterable[UUID]) -> None:
+    """Tell the notification agent to reload these tenants' targets."""
+    try:
+        async with get_redis_client().pipeline(transaction=False) as pipe:
+            for tenant_id in tenant_ids:
+                pipe.publish(settings.notification_preferences_channel, str(tenant_id))
+            await pipe.execute()
+    except Exception:
+        # The agent's periodic full reload still picks the change up.
+        logger.exception("Failed to publish notification preference changes")
+
+
+# Published only once the rows are committed, so the agent never reloads stale data.
+@event.listens_for(Session, "after_commit")
+def _publish_committed_changes(session: Session) -> None:
+    tenant_ids = session.info.pop(_CHANGED_TENANTS_KEY, None)
+    if not tenant_ids:
+        return
+    task = asyncio.get_running_loop().create_task(publish_preference_changes(tenant_ids))
+    _publish_tasks.add(task)
+    task.add_done_callback(_publish_tasks.discard)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_rolled_back_changes(session: Session) -> None:
+    session.info.pop(_CHANGED_TENANTS_KEY, None)
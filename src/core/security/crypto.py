@@ -1,6 +1,19 @@
 from __future__ import annotations
 
+import base64
+import binascii
+import os
+
+from cryptography.exceptions import InvalidTag
 from cryptography.fernet import Fernet, InvalidToken
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+
+# New ciphertexts are "<prefix><urlsafe b64 of nonce || ciphertext || tag>". Fernet tokens
+# always start with "gAAAAA", so anything without the prefix is decrypted as legacy Fernet.
+_AESGCM_PREFIX = "v2:"
+_NONCE_BYTES = 12
 
 
 class EncryptionError(ValueError):
@@ -9,13 +22,33 @@ class EncryptionError(ValueError):
 
 class SecurityCipher:
     def __init__(self, fernet_key: str) -> None:
-        self._fernet = Fernet(fernet_key.encode("utf-8"))
+        key_bytes = fernet_key.encode("utf-8")
+        self._fernet = Fernet(key_bytes)
+        # The AES-GCM key is derived from the same master key, so MASTER_ENCRYPTION_KEY is unchanged.
+        aead_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=None,
+            info=b"orra-security-cipher-aesgcm",
+        ).derive(base64.urlsafe_b64decode(key_bytes))
+        self._aead = AESGCM(aead_key)
 
     def encrypt(self, plaintext: str) -> str:
-        token = self._fernet.encrypt(plaintext.encode("utf-8"))
-        return token.decode("utf-8")
+        nonce = os.urandom(_NONCE_BYTES)
+        sealed = self._aead.encrypt(nonce, plaintext.encode("utf-8"), None)
+        return _AESGCM_PREFIX + base64.urlsafe_b64encode(nonce + sealed).decode("ascii")
 
     def decrypt(self, ciphertext: str) -> str:
+        if not ciphertext.startswith(_AESGCM_PREFIX):
+            return self._decrypt_fernet(ciphertext)
+        try:
+            raw = base64.urlsafe_b64decode(ciphertext[len(_AESGCM_PREFIX) :])
+            plaintext = self._aead.decrypt(raw[:_NONCE_BYTES], raw[_NONCE_BYTES:], None)
+        except (InvalidTag, ValueError, binascii.Error) as exc:
+            raise EncryptionError("Unable to decrypt value") from exc
+        return plaintext.decode("utf-8")
+
+    def _decrypt_fernet(self, ciphertext: str) -> str:
         try:
             plaintext = self._fernet.decrypt(ciphertext.encode("utf-8"))
         except InvalidToken as exc:
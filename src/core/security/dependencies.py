@@ -1,3 +1,7 @@
+from __future__ import annotations
+
+from functools import lru_cache
+
 from src.core.config import settings
 from src.core.security.crypto import SecurityCipher
 
@@ -6,4 +10,9 @@ def get_security_cipher() -> SecurityCipher:
     key = (settings.master_encryption_key or "").strip()
     if not key or key == "replace_with_fernet_key":
         raise ValueError("MASTER_ENCRYPTION_KEY is not configured with a valid Fernet key")
+    return _cipher_for_key(key)
+
+
+@lru_cache(maxsize=1)
+def _cipher_for_key(key: str) -> SecurityCipher:
     return SecurityCipher(key)
@@ -1,21 +1,99 @@
 from __future__ import annotations
 
+from enum import IntEnum
 from uuid import UUID
 
-from sqlalchemy import String, UniqueConstraint
+from sqlalchemy import CheckConstraint, ColumnElement, SmallInteger, String, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
+from sqlalchemy.ext.hybrid import hybrid_property
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.models.base import TenantScopedBase
 
+# flags layout: bit 0 = enabled, bits 1-4 = NotificationChannel code.
+_ENABLED_BIT = 0x1
+_CHANNEL_SHIFT = 1
+_CHANNEL_MASK = 0xF
+
+
+class NotificationChannel(IntEnum):
+    EMAIL = 0
+    TELEGRAM = 1
+    WHATSAPP = 2
+
+
+# Codes 3-15 fit the column but name no channel; they read back as email, like the agent does.
+_CHANNELS_BY_CODE: dict[int, NotificationChannel] = {c.value: c for c in NotificationChannel}
+
+
+def notification_flags(
+    channel: NotificationChannel = NotificationChannel.EMAIL, is_enabled: bool = True
+) -> int:
+    return (NotificationChannel(channel) << _CHANNEL_SHIFT) | (_ENABLED_BIT if is_enabled else 0)
+
 
 class NotificationPreference(TenantScopedBase):
     __tablename__ = "notification_preferences"
     __table_args__ = (
         UniqueConstraint("tenant_id", "user_id", name="uq_notification_preferences_tenant_user"),
+        CheckConstraint("flags >= 0 AND flags < 256", name="ck_notification_preferences_flags"),
     )
 
-    user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False, index=True)
-    channel: Mapped[str] = mapped_column(String(20), nullable=False, default="email")
+    # The (tenant_id, user_id) unique index serves tenant-scoped lookups; no standalone indexes.
+    tenant_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
+    user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
     destination: Mapped[str] = mapped_column(String(255), nullable=False)
-    is_enabled: Mapped[bool] = mapped_column(nullable=False, default=True)
+    # Enabled email by default.
+    flags: Mapped[int] = mapped_column(SmallInteger, nullable=False, default=_ENABLED_BIT)
+
+    def _current_flags(self) -> int:
+        return _ENABLED_BIT if self.flags is None else self.flags
+
+    @hybrid_property
+    def channel(self) -> NotificationChannel:
+        code = (self._current_flags() >> _CHANNEL_SHIFT) & _CHANNEL_MASK
+        return _CHANNELS_BY_CODE.get(code, NotificationChannel.EMAIL)
+
+    @channel.inplace.setter
+    def _channel_setter(self, value: NotificationChannel) -> None:
+        cleared = self._current_flags() & ~(_CHANNEL_MASK << _CHANNEL_SHIFT)
+        self.flags = cleared | (NotificationChannel(value) << _CHANNEL_SHIFT)
+
+    @channel.inplace.expression
+    @classmethod
+    def _channel_expression(cls) -> ColumnElement[int]:
+        return cls.flags.op(">>")(_CHANNEL_SHIFT).op("&")(_CHANNEL_MASK)
+
+    @hybrid_property
+    def is_enabled(self) -> bool:
+        return bool(self._current_flags() & _ENABLED_BIT)
+
+    @is_enabled.inplace.setter
+    def _is_enabled_setter(self, value: bool) -> None:
+        flags = self._current_flags()
+        self.flags = flags | _ENABLED_BIT if value else flags & ~_ENABLED_BIT
+
+    @is_enabled.inplace.expression
+    @classmethod
+    def _is_enabled_expression(cls) -> ColumnElement[bool]:
+        return cls.flags.op("&")(_ENABLED_BIT) == _ENABLED_BIT
+
+    # The hybrids above have no update_expression: setting both would target the same column.
+    # Writes go through these instead (see NotificationPreferenceRepository).
+    @classmethod
+    def flags_update_expression(
+        cls,
+        *,
+        channel: NotificationChannel | None = None,
+        is_enabled: bool | None = None,
+    ) -> ColumnElement[int]:
+        """``flags`` with only the bits of the given fields replaced, for UPDATE ... SET."""
+        cleared = 0
+        bits = 0
+        if channel is not None:
+            cleared |= _CHANNEL_MASK << _CHANNEL_SHIFT
+            bits |= NotificationChannel(channel) << _CHANNEL_SHIFT
+        if is_enabled is not None:
+            cleared |= _ENABLED_BIT
+            bits |= _ENABLED_BIT if is_enabled else 0
+        return cls.flags.op("&")(~cleared & 0xFF).op("|")(bits)
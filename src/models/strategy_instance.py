@@ -1,6 +1,7 @@
 from __future__ import annotations
 
-from sqlalchemy import JSON, String
+from sqlalchemy import Index, String
+from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.models.base import TenantScopedBase
@@ -8,8 +9,12 @@ from src.models.base import TenantScopedBase
 
 class StrategyInstance(TenantScopedBase):
     __tablename__ = "strategy_instances"
+    __table_args__ = (
+        # Serves containment (@>) and key-existence (?) filters on parameters.
+        Index("ix_strategy_instances_params_gin", "parameters", postgresql_using="gin"),
+    )
 
     name: Mapped[str] = mapped_column(String(120), nullable=False)
     strategy_type: Mapped[str] = mapped_column(String(80), nullable=False)
-    parameters: Mapped[dict] = mapped_column(JSON, nullable=False, default=dict)
+    parameters: Mapped[dict] = mapped_column(JSONB, nullable=False, default=dict)
     is_active: Mapped[bool] = mapped_column(nullable=False, default=True)
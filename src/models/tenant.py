@@ -1,6 +1,6 @@
 from __future__ import annotations
 
-from sqlalchemy import String
+from sqlalchemy import Index, String, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from src.models.base import TenantScopedBase
@@ -8,7 +8,13 @@ from src.models.base import TenantScopedBase
 
 class Tenant(TenantScopedBase):
     __tablename__ = "tenants"
+    __table_args__ = (
+        # Serves the active-tenant scans ordered by created_at without a sort step.
+        Index("ix_tenants_active_created_at", "created_at", postgresql_where=text("is_active")),
+        # Webhook payloads do not always preserve org id case; lookups go through lower().
+        Index("ix_tenants_clerk_org_lower", func.lower(text("clerk_org_id")), unique=True),
+    )
 
-    clerk_org_id: Mapped[str] = mapped_column(String(255), unique=True, nullable=False, index=True)
+    clerk_org_id: Mapped[str] = mapped_column(String(255), nullable=False)
     subscription_tier: Mapped[str] = mapped_column(String(50), nullable=False, default="free")
-    is_active: Mapped[bool] = mapped_column(nullable=False, default=True, index=True)
+    is_active: Mapped[bool] = mapped_column(nullable=False, default=True)
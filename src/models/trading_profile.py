@@ -3,7 +3,7 @@ from __future__ import annotations
 from decimal import Decimal
 from uuid import UUID
 
-from sqlalchemy import Numeric, UniqueConstraint
+from sqlalchemy import BigInteger, CheckConstraint, UniqueConstraint
 from sqlalchemy.dialects.postgresql import UUID as PGUUID
 from sqlalchemy.orm import Mapped, mapped_column
 
@@ -14,9 +14,19 @@ class TradingProfile(TenantScopedBase):
     __tablename__ = "trading_profiles"
     __table_args__ = (
         UniqueConstraint("tenant_id", "user_id", name="uq_trading_profiles_tenant_user"),
+        # Same bounds as TradingProfileUpsertRequest, enforced for writers that bypass the API.
+        CheckConstraint("max_orders > 0 AND max_orders <= 500", name="ck_trading_profiles_max_orders"),
+        CheckConstraint("max_daily_loss_minor > 0", name="ck_trading_profiles_max_daily_loss_pos"),
     )
 
-    user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False, index=True)
-    max_daily_loss: Mapped[Decimal] = mapped_column(Numeric(14, 2), nullable=False)
+    # The (tenant_id, user_id) unique index serves tenant-scoped lookups; no standalone indexes.
+    tenant_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
+    user_id: Mapped[UUID] = mapped_column(PGUUID(as_uuid=True), nullable=False)
+    # Paise, so reads never allocate a Decimal.
+    max_daily_loss_minor: Mapped[int] = mapped_column(BigInteger, nullable=False)
     max_orders: Mapped[int] = mapped_column(nullable=False)
     master_switch_enabled: Mapped[bool] = mapped_column(nullable=False, default=False)
+
+    @property
+    def max_daily_loss(self) -> Decimal:
+        return Decimal(self.max_daily_loss_minor).scaleb(-2)
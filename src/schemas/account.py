@@ -1,15 +1,27 @@
 from __future__ import annotations
 
-from pydantic import BaseModel, Field
+from typing import Annotated, TypedDict
+
+from pydantic import BaseModel, Field, StringConstraints
+
+from src.schemas.base import ResponseModel
+
+
+# Declared once so every field shares the same pydantic-core (Rust) string schema.
+_KITE_TOKEN_CONSTRAINTS = StringConstraints(
+    strip_whitespace=True, min_length=4, max_length=255, pattern=r"^[A-Za-z0-9]+$"
+)
+KiteTokenStr = Annotated[str, _KITE_TOKEN_CONSTRAINTS]
+TotpSecretStr = Annotated[str, StringConstraints(strip_whitespace=True, min_length=8, max_length=255)]
 
 
 class KiteCredentialUpsertRequest(BaseModel):
-    api_key: str = Field(min_length=4, max_length=255)
-    api_secret: str = Field(min_length=4, max_length=255)
-    totp_secret: str = Field(min_length=8, max_length=255)
+    api_key: KiteTokenStr
+    api_secret: KiteTokenStr
+    totp_secret: TotpSecretStr
 
 
-class KiteCredentialStatusResponse(BaseModel):
+class KiteCredentialStatusResponse(ResponseModel):
     linked: bool
     updated_at: str | None = None
 
@@ -18,7 +30,7 @@ class KiteConnectionCheckRequest(BaseModel):
     request_token: str = Field(min_length=8, max_length=1024)
 
 
-class KiteConnectionCheckResponse(BaseModel):
+class KiteConnectionCheckResponse(TypedDict):
     success: bool
     message: str
-    kite_user_id: str | None = None
+    kite_user_id: str | None
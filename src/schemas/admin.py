@@ -1,17 +1,19 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from typing import NotRequired, TypedDict
 
 
-class TenantConnectionStatus(BaseModel):
+# Server-built responses are TypedDicts: no model instantiation, while FastAPI still
+# validates and documents them through response_model.
+class TenantConnectionStatus(TypedDict):
     tenant_id: str
     clerk_org_id: str
     subscription_tier: str
     connected: bool
-    token_ttl_seconds: int | None = None
+    token_ttl_seconds: NotRequired[int]
 
 
-class SystemHealthResponse(BaseModel):
+class SystemHealthResponse(TypedDict):
     status: str
     database_ok: bool
     redis_ok: bool
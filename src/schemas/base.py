@@ -0,0 +1,9 @@
+from __future__ import annotations
+
+from pydantic import BaseModel, ConfigDict
+
+
+class ResponseModel(BaseModel):
+    """Immutable base for response DTOs; they are built once and only serialized."""
+
+    model_config = ConfigDict(frozen=True, extra="ignore")
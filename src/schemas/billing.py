@@ -1,17 +1,31 @@
 from __future__ import annotations
 
-from pydantic import BaseModel
+from typing import Any, TypedDict
 
+from src.schemas.base import ResponseModel
 
-class EntitlementResponse(BaseModel):
+
+class EntitlementResponse(ResponseModel):
     tier: str
     max_strategies: int | None
     daily_trade_limit: int | None
     priority_execution: bool
 
+    @classmethod
+    def from_orm_trusted(cls, entitlements: Any) -> EntitlementResponse:
+        """Build from TierEntitlements, which is computed server-side and needs no validation."""
+        return cls.model_construct(
+            tier=entitlements.tier,
+            max_strategies=entitlements.max_strategies,
+            daily_trade_limit=entitlements.daily_trade_limit,
+            priority_execution=entitlements.priority_execution,
+        )
+
 
-class BillingWebhookResponse(BaseModel):
+# Server-built, so a TypedDict like the other status responses.
+class BillingWebhookResponse(TypedDict):
     received: bool
     event_type: str
-    tenant_id: str | None = None
+    tenant_id: str | None
     updated: bool
+    queued: bool
@@ -1,21 +1,39 @@
 from __future__ import annotations
 
 from decimal import Decimal
+from typing import Any
 
 from pydantic import BaseModel, Field
 
+from src.schemas.base import ResponseModel
+
 
 class TradingProfileUpsertRequest(BaseModel):
-    max_daily_loss: Decimal = Field(gt=0)
+    max_daily_loss: Decimal = Field(gt=0, max_digits=14, decimal_places=2)
     max_orders: int = Field(gt=0, le=500)
     master_switch_enabled: bool = False
 
+    @property
+    def max_daily_loss_minor(self) -> int:
+        return int(self.max_daily_loss.scaleb(2))
+
 
-class TradingProfileResponse(BaseModel):
-    max_daily_loss: Decimal
+class TradingProfileResponse(ResponseModel):
+    # Pre-formatted ("123.45") from the stored minor units; no Decimal on the response path.
+    max_daily_loss: str
     max_orders: int
     master_switch_enabled: bool
 
+    @classmethod
+    def from_orm_trusted(cls, row: Any) -> TradingProfileResponse:
+        """Build from a TradingProfile row without re-validating already-typed DB values."""
+        rupees, paise = divmod(row.max_daily_loss_minor, 100)
+        return cls.model_construct(
+            max_daily_loss=f"{rupees}.{paise:02d}",
+            max_orders=row.max_orders,
+            master_switch_enabled=row.master_switch_enabled,
+        )
+
 
 class MasterSwitchUpdateRequest(BaseModel):
     enabled: bool
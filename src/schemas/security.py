@@ -4,13 +4,15 @@ from uuid import UUID
 
 from pydantic import BaseModel, Field
 
+from src.schemas.base import ResponseModel
+
 
 class KiteConnectionTestRequest(BaseModel):
     user_id: UUID
     request_token: str = Field(min_length=8, max_length=1024)
 
 
-class KiteConnectionTestResponse(BaseModel):
+class KiteConnectionTestResponse(ResponseModel):
     connected: bool
     kite_user_id: str | None = None
     user_name: str | None = None
@@ -1,8 +1,63 @@
 from __future__ import annotations
 
+import asyncio
 import sys
+from collections.abc import AsyncIterator, Callable, Iterator, Mapping
 from pathlib import Path
+from typing import Any
+
+import httpx
+import pytest
+from fastapi import FastAPI
 
 ROOT = Path(__file__).resolve().parents[1]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
+
+
+# Optional: pytest-asyncio < 1.4 has no such hook and keeps its default loop.
+@pytest.hookimpl(optionalhook=True)
+def pytest_asyncio_loop_factories(
+    config: pytest.Config, item: pytest.Item
+) -> Mapping[str, Callable[[], asyncio.AbstractEventLoop]]:
+    try:
+        import uvloop
+    except ImportError:  # uvloop is not built for Windows
+        return {"asyncio": asyncio.new_event_loop}
+    return {"uvloop": uvloop.new_event_loop}
+
+
+@pytest.fixture(scope="session")
+def app() -> FastAPI:
+    # Imported on first use so collecting non-API test modules never builds the app.
+    from src.api.main import app as _app
+
+    return _app
+
+
+@pytest.fixture(scope="session")
+async def _client(app: FastAPI) -> AsyncIterator[httpx.AsyncClient]:
+    # Requests run on the session event loop directly, with no portal-thread hop per call.
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://testserver") as c:
+        yield c
+
+
+_MISSING = object()
+
+
+@pytest.fixture
+def override(app: FastAPI) -> Iterator[Callable[[Any, Any], None]]:
+    """Set app.dependency_overrides entries for one test, restoring the previous values after."""
+    previous: dict[Any, Any] = {}
+
+    def _override(dependency: Any, replacement: Any) -> None:
+        previous.setdefault(dependency, app.dependency_overrides.get(dependency, _MISSING))
+        app.dependency_overrides[dependency] = replacement
+
+    yield _override
+    for dependency, value in previous.items():
+        if value is _MISSING:
+            app.dependency_overrides.pop(dependency, None)
+        else:
+            app.dependency_overrides[dependency] = value
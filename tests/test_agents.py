@@ -1,6 +1,10 @@
 from __future__ import annotations
 
 import asyncio
+import contextlib
+import json
+from collections.abc import AsyncIterator
+from datetime import datetime
 from types import SimpleNamespace
 from uuid import uuid4
 
@@ -13,7 +17,10 @@ from src.agents.notification_service import (
     NotificationDispatcher,
     NotificationTarget,
 )
-from src.agents.ticker_service import TenantTickerConfig, TenantTickerWorker, TickerAgent
+from src.agents.ticker_service import TenantTickerWorker, TickerAgent
+from src.models.notification_preference import NotificationChannel
+
+NOW_ISO = "2026-01-01T00:00:00+00:00"
 
 
 def test_agent_health_lifecycle_payload() -> None:
@@ -35,16 +42,17 @@ def test_agent_health_lifecycle_payload() -> None:
 async def test_notification_dispatcher_errors_without_webhook() -> None:
     dispatcher = NotificationDispatcher()
     with pytest.raises(ValueError):
-        await dispatcher.dispatch(channel="telegram", payload={"x": 1}, urgent=False)
+        await dispatcher.dispatch(channel=NotificationChannel.TELEGRAM, payload={"x": 1}, urgent=False)
+    with pytest.raises(ValueError):
+        await dispatcher.dispatch(channel=None, payload={"x": 1}, urgent=False)
 
 
 @pytest.mark.asyncio
 async def test_notification_dispatcher_posts_payload(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.agents import notification_service
 
-    dispatcher = NotificationDispatcher()
     monkeypatch.setattr(notification_service.settings, "n8n_email_webhook_url", "https://example.test")
-    dispatcher.channel_webhooks["email"] = "https://example.test"
+    dispatcher = NotificationDispatcher()
 
     called: dict[str, object] = {}
 
@@ -52,14 +60,13 @@ async def test_notification_dispatcher_posts_payload(monkeypatch: pytest.MonkeyP
         def raise_for_status(self) -> None:
             return None
 
-    def _post(url: str, json: dict, timeout: int):  # noqa: A002
+    async def _post(url: str, content: bytes):
         called["url"] = url
-        called["json"] = json
-        called["timeout"] = timeout
+        called["json"] = json.loads(content)
         return _Resp()
 
-    monkeypatch.setattr(notification_service.requests, "post", _post)
-    await dispatcher.dispatch(channel="email", payload={"event": "ok"}, urgent=False)
+    monkeypatch.setattr(dispatcher._http, "post", _post)
+    await dispatcher.dispatch(channel=NotificationChannel.EMAIL, payload={"event": "ok"}, urgent=False)
 
     assert called["url"] == "https://example.test"
     assert called["json"] == {"event": "ok"}
@@ -69,69 +76,335 @@ async def test_notification_dispatcher_posts_payload(monkeypatch: pytest.MonkeyP
 async def test_notification_agent_process_event_success_and_failure() -> None:
     agent = NotificationAgent()
 
-    class _Redis:
+    async def _ok(_fields: dict[str, str], _now_iso: str) -> None:
+        return None
+
+    async def _boom(_fields: dict[str, str], _now_iso: str) -> None:
+        raise ValueError("bad")
+
+    agent._handle_execution_result = _ok  # type: ignore[method-assign]
+    result = await agent._process_event(
+        "execution_results", "1-0", {"tenant_id": str(uuid4()), "user_id": str(uuid4())}, NOW_ISO
+    )
+    assert result is None
+    assert agent.health.metrics["events_processed"] == 1
+
+    agent._handle_execution_result = _boom  # type: ignore[method-assign]
+    failure = await agent._process_event(
+        "execution_results", "2-0", {"tenant_id": str(uuid4()), "user_id": str(uuid4())}, NOW_ISO
+    )
+    assert agent.health.metrics["events_failed"] == 1
+    assert failure is not None
+    assert failure["message_id"] == "2-0"
+    assert failure["error"] == "bad"
+    assert failure["reason"] == "handler_error"
+    assert failure["failed_at"] == NOW_ISO
+
+    calls: list[dict[str, str]] = []
+
+    async def _record(fields: dict[str, str], _now_iso: str) -> None:
+        calls.append(fields)
+
+    agent._handle_execution_result = _record  # type: ignore[method-assign]
+    failure = await agent._process_event(
+        "execution_results", "3-0", {"tenant_id": "not-a-uuid", "user_id": str(uuid4())}, NOW_ISO
+    )
+    assert failure is not None
+    assert failure["reason"] == "malformed_uuid"
+    assert calls == []
+    assert agent.health.metrics["events_failed"] == 2
+
+    tenant_id, user_id = uuid4(), uuid4()
+    raw = {"tenant_id": str(tenant_id).upper(), "user_id": user_id.hex}
+    assert await agent._process_event("execution_results", "4-0", raw, NOW_ISO) is None
+    assert calls == [{"tenant_id": str(tenant_id), "user_id": str(user_id)}]
+
+
+@pytest.mark.asyncio
+async def test_notification_agent_record_failures_single_pipeline() -> None:
+    agent = NotificationAgent()
+
+    class _Pipeline:
         def __init__(self) -> None:
-            self.acks: list[tuple[str, str, str]] = []
-            self.failed: list[dict[str, str]] = []
+            self.commands: list[tuple[str, str]] = []
+            self.executions = 0
+
+        async def __aenter__(self) -> _Pipeline:
+            return self
+
+        async def __aexit__(self, *exc) -> None:  # noqa: ANN002
+            return None
+
+        def xadd(self, stream: str, payload: dict[str, str]) -> None:
+            self.commands.append((stream, payload["message_id"]))
+
+        async def execute(self) -> list[object]:
+            self.executions += 1
+            return []
+
+    pipe = _Pipeline()
+    agent._redis = SimpleNamespace(pipeline=lambda transaction=True: pipe)  # type: ignore[assignment]
+
+    await agent._record_failures([None, None])
+    assert pipe.executions == 0
+
+    await agent._record_failures([None, {"message_id": "2-0"}, {"message_id": "3-0"}])
+    assert pipe.executions == 1
+    assert pipe.commands == [("notification_failures", "2-0"), ("notification_failures", "3-0")]
 
-        async def xack(self, stream: str, group: str, msg_id: str) -> None:
-            self.acks.append((stream, group, msg_id))
 
-        async def xadd(self, stream: str, payload: dict[str, str]) -> None:
-            self.failed.append(payload)
+@pytest.mark.asyncio
+async def test_notification_agent_ensure_consumer_groups_pipelined() -> None:
+    agent = NotificationAgent()
+
+    class _Pipeline:
+        def __init__(self, results: list[object]) -> None:
+            self.results = results
+            self.streams: list[str] = []
 
-        async def aclose(self) -> None:
+        async def __aenter__(self) -> _Pipeline:
+            return self
+
+        async def __aexit__(self, *exc) -> None:  # noqa: ANN002
             return None
 
-    fake_redis = _Redis()
-    agent._redis = fake_redis  # type: ignore[assignment]
+        def xgroup_create(self, *, name: str, groupname: str, id: str, mkstream: bool) -> None:  # noqa: A002
+            self.streams.append(name)
 
-    async def _ok(_fields: dict[str, str]) -> None:
-        return None
+        async def execute(self, raise_on_error: bool = True) -> list[object]:
+            assert raise_on_error is False
+            return self.results
 
-    async def _boom(_fields: dict[str, str]) -> None:
-        raise ValueError("bad")
+    pipe = _Pipeline([True, Exception("BUSYGROUP Consumer Group name already exists")])
+    agent._redis = SimpleNamespace(pipeline=lambda transaction=True: pipe)  # type: ignore[assignment]
+    await agent._ensure_consumer_groups()
+    assert pipe.streams == ["execution_results", "auth_errors"]
 
-    agent._handle_execution_result = _ok  # type: ignore[method-assign]
-    await agent._process_event("execution_results", "1-0", {"tenant_id": str(uuid4()), "user_id": str(uuid4())})
-    assert agent.health.metrics["events_processed"] == 1
-    assert len(fake_redis.acks) == 1
+    pipe = _Pipeline([True, Exception("WRONGTYPE")])
+    with pytest.raises(Exception, match="WRONGTYPE"):
+        await agent._ensure_consumer_groups()
 
-    agent._handle_execution_result = _boom  # type: ignore[method-assign]
-    await agent._process_event("execution_results", "2-0", {"tenant_id": str(uuid4()), "user_id": str(uuid4())})
-    assert agent.health.metrics["events_failed"] == 1
-    assert len(fake_redis.failed) == 1
+
+@pytest.mark.asyncio
+async def test_notification_agent_backoff_interrupted_by_stop() -> None:
+    agent = NotificationAgent()
+
+    async def _xreadgroup(**kwargs):  # noqa: ANN003
+        _ = kwargs
+        raise ConnectionError("redis down")
+
+    agent._redis = SimpleNamespace(xreadgroup=_xreadgroup)  # type: ignore[assignment]
+    task = asyncio.create_task(agent._consume_streams())
+    await asyncio.sleep(0.05)
+    agent._stop_event.set()
+
+    await asyncio.wait_for(task, timeout=0.5)
+    assert agent.health.last_error == "redis down"
 
 
 @pytest.mark.asyncio
 async def test_notification_agent_handle_execution_result_and_auth_error() -> None:
+    from src.agents import notification_service
+
     agent = NotificationAgent()
 
     sent: list[tuple[str, dict[str, object], bool]] = []
 
-    async def _dispatch(*, channel: str, payload: dict[str, object], urgent: bool = False) -> None:
+    async def _dispatch(
+        *, channel: NotificationChannel | None, payload: dict[str, object], urgent: bool = False
+    ) -> None:
         sent.append((channel, payload, urgent))
 
     async def _resolve(_tenant_id, _user_id, prefer_urgent: bool = False):  # noqa: ANN001
         _ = prefer_urgent
-        return NotificationTarget(channel="email", destination="org_1")
+        return NotificationTarget(channel=NotificationChannel.EMAIL, destination="org_1")
 
     agent._dispatcher = SimpleNamespace(dispatch=_dispatch)  # type: ignore[assignment]
     agent._resolve_target = _resolve  # type: ignore[method-assign]
 
     await agent._handle_execution_result(
-        {"tenant_id": str(uuid4()), "user_id": str(uuid4()), "status": "success"}
+        {"tenant_id": str(uuid4()), "user_id": str(uuid4()), "status": "success"},
+        NOW_ISO,
     )
-    await agent._handle_auth_error({"tenant_id": str(uuid4()), "user_id": str(uuid4())})
+    await agent._handle_auth_error({"tenant_id": str(uuid4()), "user_id": str(uuid4())}, NOW_ISO)
 
+    assert sent[0][0] is NotificationChannel.EMAIL
+    assert sent[0][1]["channel"] == "email"
     assert sent[0][2] is False
     assert sent[1][2] is True
+    assert sent[0][1]["timestamp"] == sent[1][1]["timestamp"] == NOW_ISO
+    assert sent[0][1]["severity"] == "info"
+    assert sent[0][1]["message"] == "Trade executed successfully"
+    assert sent[1][1]["event_type"] == "auth_2fa_failed"
+    assert sent[1][1]["severity"] == "urgent"
+
+    await agent._handle_execution_result(
+        {"tenant_id": str(uuid4()), "user_id": str(uuid4()), "status": "rejected", "error": "margin"},
+        NOW_ISO,
+    )
+    assert sent[2][1]["severity"] == "warning"
+    assert sent[2][1]["message"] == "Trade execution failed: margin"
+    assert "tenant_id" not in notification_service._TRADE_FAILURE_PAYLOAD
 
     with pytest.raises(ValueError):
-        await agent._handle_execution_result({"tenant_id": str(uuid4())})
+        await agent._handle_execution_result({"tenant_id": str(uuid4())}, NOW_ISO)
 
     with pytest.raises(ValueError):
-        await agent._handle_auth_error({"user_id": str(uuid4())})
+        await agent._handle_auth_error({"user_id": str(uuid4())}, NOW_ISO)
+
+
+@pytest.mark.asyncio
+async def test_notification_agent_resolves_targets_from_snapshot() -> None:
+    agent = NotificationAgent()
+    tenant_id = str(uuid4())
+    user_id = str(uuid4())
+    loads: list[str | None] = []
+
+    async def _load(tenant=None):  # noqa: ANN001
+        loads.append(tenant)
+        return {
+            (tenant_id, None): NotificationTarget(channel=NotificationChannel.EMAIL, destination="org_1"),
+            (tenant_id, user_id): NotificationTarget(
+                channel=NotificationChannel.TELEGRAM, destination=f"@dest-{len(loads)}"
+            ),
+        }
+
+    agent._load_targets = _load  # type: ignore[method-assign]
+    await agent._reload_targets()
+    assert loads == [None]
+
+    first = await agent._resolve_target(tenant_id, user_id)
+    fallback = await agent._resolve_target(tenant_id, str(uuid4()), prefer_urgent=True)
+    assert first.destination == "@dest-1"
+    assert fallback.destination == "org_1"
+    assert len(loads) == 1
+
+    await agent._handle_preference_change(tenant_id)
+    assert loads[-1] == tenant_id
+    assert (await agent._resolve_target(tenant_id, user_id)).destination == "@dest-2"
+
+    await agent._handle_preference_change("not-a-uuid")
+    assert loads[-1] is None
+
+    agent._targets.clear()
+    assert (await agent._resolve_target(tenant_id, user_id)).destination == "@dest-4"
+    assert loads[-1] == tenant_id
+
+    with pytest.raises(ValueError):
+        await agent._resolve_target(str(uuid4()), user_id)
+
+
+@pytest.mark.asyncio
+async def test_notification_agent_reloads_targets_periodically(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.agents import notification_service
+
+    monkeypatch.setattr(notification_service.settings, "notification_target_cache_ttl_seconds", 0.01)
+    agent = NotificationAgent()
+    loads: list[str | None] = []
+
+    async def _load(tenant=None):  # noqa: ANN001
+        loads.append(tenant)
+        return {}
+
+    agent._load_targets = _load  # type: ignore[method-assign]
+    task = asyncio.create_task(agent._refresh_targets_periodically())
+    await asyncio.sleep(0.05)
+    agent._stop_event.set()
+    await asyncio.wait_for(task, timeout=0.5)
+
+    assert len(loads) >= 2
+    assert set(loads) == {None}
+
+
+@pytest.mark.asyncio
+async def test_notification_agent_load_targets_single_query(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.agents import notification_service
+
+    tenant_id = uuid4()
+    user_id = uuid4()
+    rows = [
+        SimpleNamespace(
+            id=tenant_id,
+            clerk_org_id="org_1",
+            user_id=user_id,
+            channel=NotificationChannel.TELEGRAM,
+            destination="@trader",
+        ),
+        SimpleNamespace(id=tenant_id, clerk_org_id="org_1", user_id=None, channel=None, destination=None),
+    ]
+    statements: list[object] = []
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+        async def execute(self, stmt):  # noqa: ANN001
+            statements.append(stmt)
+            return SimpleNamespace(all=lambda: rows)
+
+    monkeypatch.setattr(notification_service, "AsyncSessionLocal", _Session)
+    agent = NotificationAgent()
+
+    targets = await agent._load_targets()
+    assert targets == {
+        (str(tenant_id), None): NotificationTarget(channel=NotificationChannel.EMAIL, destination="org_1"),
+        (str(tenant_id), str(user_id)): NotificationTarget(
+            channel=NotificationChannel.TELEGRAM, destination="@trader"
+        ),
+    }
+
+    await agent._load_targets(str(tenant_id))
+
+    assert "LEFT OUTER JOIN notification_preferences" in str(statements[0])
+    assert "WHERE" not in str(statements[0])
+    assert "notification_preferences.flags &" in str(statements[0])
+    assert statements[1].compile().params["tenant_id"] == str(tenant_id)
+
+
+@pytest.mark.asyncio
+async def test_auth_agent_iter_tenant_records_streams_rows(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.agents import auth_service
+
+    rows = [
+        SimpleNamespace(
+            id=uuid4(),
+            user_id=uuid4(),
+            api_key_encrypted="enc:key",
+            api_secret_encrypted="enc:sec",
+            totp_secret_encrypted="enc:totp",
+        )
+        for _ in range(3)
+    ]
+    statements: list[object] = []
+
+    class _Stream:
+        def __aiter__(self):
+            return self._rows()
+
+        async def _rows(self):
+            for row in rows:
+                yield row
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+        async def stream(self, stmt):  # noqa: ANN001
+            statements.append(stmt)
+            return _Stream()
+
+    monkeypatch.setattr(auth_service, "AsyncSessionLocal", _Session)
+    agent = AuthAgent()
+
+    records = [record async for record in agent._iter_tenant_records()]
+    assert [record.tenant_id for record in records] == [row.id for row in rows]
+    assert statements[0].get_execution_options()["yield_per"] == 50
 
 
 @pytest.mark.asyncio
@@ -149,11 +422,30 @@ async def test_auth_agent_emit_failure_and_refresh_token(monkeypatch: pytest.Mon
         async def xadd(self, _stream: str, payload: dict[str, str]) -> None:
             self.events.append(payload)
 
-        async def set(self, key: str, val: str, ex: int) -> None:
-            self.set_calls.append((key, val, ex))
+        def pipeline(self, transaction: bool = True) -> _Pipeline:
+            assert transaction is False
+            return _Pipeline(self)
+
+    class _Pipeline:
+        def __init__(self, redis_client: _Redis) -> None:
+            self._redis = redis_client
+            self.executed = False
+
+        async def __aenter__(self) -> _Pipeline:
+            return self
+
+        async def __aexit__(self, *exc) -> None:  # noqa: ANN002
+            return None
+
+        def set(self, key: str, val: str, ex: int) -> None:
+            self._redis.set_calls.append((key, val, ex))
+
+        def publish(self, channel: str, payload: str) -> None:
+            self._redis.publish_calls.append((channel, payload))
 
-        async def publish(self, channel: str, payload: str) -> None:
-            self.publish_calls.append((channel, payload))
+        async def execute(self) -> list[object]:
+            self.executed = True
+            return []
 
     record = TenantAuthRecord(
         tenant_id=uuid4(),
@@ -208,15 +500,36 @@ async def test_auth_agent_perform_login_requires_mapped_credentials(monkeypatch:
 async def test_ticker_worker_callbacks_publish_and_errors() -> None:
     class _Redis:
         def __init__(self) -> None:
-            self.published: list[tuple[str, str]] = []
+            self.published: list[tuple[bytes, bytes]] = []
+            self.executions = 0
 
-        def get(self, key: str):
+        async def get(self, key: str):
             if key.startswith("tenant:active:"):
                 return "1"
             return None
 
-        def publish(self, channel: str, payload: str) -> None:
-            self.published.append((channel, payload))
+        def pipeline(self, transaction: bool = True) -> _Pipeline:
+            assert transaction is False
+            return _Pipeline(self)
+
+    class _Pipeline:
+        def __init__(self, redis_client: _Redis) -> None:
+            self._redis = redis_client
+            self._pending: list[tuple[bytes, bytes]] = []
+
+        async def __aenter__(self) -> _Pipeline:
+            return self
+
+        async def __aexit__(self, *exc) -> None:  # noqa: ANN002
+            return None
+
+        def publish(self, channel: bytes, payload: bytes) -> None:
+            self._pending.append((channel, payload))
+
+        async def execute(self) -> list[int]:
+            self._redis.published.extend(self._pending)
+            self._redis.executions += 1
+            return [1] * len(self._pending)
 
     class _Kws:
         MODE_FULL = "full"
@@ -235,32 +548,94 @@ async def test_ticker_worker_callbacks_publish_and_errors() -> None:
             _ = mode, tokens
 
     health = AgentHealth(name="ticker")
+    redis_client = _Redis()
     worker = TenantTickerWorker(
         tenant_id=uuid4(),
         api_key="k",
-        redis_client=_Redis(),
+        redis_client=redis_client,
         instrument_tokens=[111],
         health=health,
+        reconnect_initial_delay=1,
+        reconnect_max_delay=4,
     )
     kws = _Kws()
     worker._configure_callbacks(kws)  # noqa: SLF001
+    drain = asyncio.create_task(worker._drain_ticks())
 
     kws.on_connect(kws, {})
-    kws.on_ticks(kws, [{"instrument_token": 111, "last_price": 123}])
+    kws.on_ticks(
+        kws,
+        [
+            {"instrument_token": 111, "last_price": 123},
+            {"last_price": 1},
+        ],
+    )
+    kws.on_ticks(kws, [{"instrument_token": 111, "last_price": 124}])
     kws.on_close(kws, 1000, "bye")
     kws.on_error(kws, 500, "oops")
 
-    await asyncio.sleep(0)
-    assert health.metrics["ticks_published"] == 1
+    for _ in range(5):
+        await asyncio.sleep(0)
+    assert health.metrics["ticks_published"] == 2
+    assert redis_client.executions == 1
+    channel_111 = f"ticker:{worker.tenant_id}:111".encode()
+    assert [channel for channel, _ in redis_client.published] == [channel_111] * 2
+    assert json.loads(redis_client.published[0][1]) == {"instrument_token": 111, "last_price": 123}
+
+    kws.on_ticks(
+        kws,
+        [
+            {
+                "instrument_token": 222,
+                "exchange_timestamp": datetime(2026, 1, 2, 9, 15),
+                "last_trade_time": None,
+            }
+        ],
+    )
+    for _ in range(5):
+        await asyncio.sleep(0)
+    channel, payload = redis_client.published[-1]
+    assert channel == f"ticker:{worker.tenant_id}:222".encode()
+    assert json.loads(payload)["exchange_timestamp"] == "2026-01-02 09:15:00"
+    assert json.loads(payload)["last_trade_time"] is None
     assert health.last_error == "500:oops"
 
+    drain.cancel()
+    with contextlib.suppress(asyncio.CancelledError):
+        await drain
+
+
+@pytest.mark.asyncio
+async def test_ticker_worker_drops_oldest_ticks_when_buffer_full(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.agents import ticker_service
+
+    monkeypatch.setattr(ticker_service.settings, "ticker_tick_buffer_size", 2)
+    health = AgentHealth(name="ticker")
+    worker = TenantTickerWorker(
+        tenant_id=uuid4(),
+        api_key="k",
+        redis_client=SimpleNamespace(),
+        instrument_tokens=[111],
+        health=health,
+        reconnect_initial_delay=1,
+        reconnect_max_delay=4,
+    )
+
+    worker._buffer_ticks([{"last_price": 1}])
+    worker._buffer_ticks([{"last_price": 2}, {"last_price": 3}])
+    await asyncio.sleep(0)
+
+    assert [tick["last_price"] for tick in worker._tick_buffer] == [2, 3]
+    assert health.metrics["ticks_dropped"] == 1
+    assert worker._drain_signal.is_set()
+
 
 @pytest.mark.asyncio
 async def test_ticker_agent_run_without_instruments_marks_error(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.agents import ticker_service
 
-    agent = TickerAgent()
     monkeypatch.setattr(ticker_service.settings, "ticker_instrument_tokens_csv", "")
+    agent = TickerAgent()
 
     await agent.run()
     assert agent.health.healthy is False
@@ -271,14 +646,20 @@ async def test_ticker_agent_run_without_instruments_marks_error(monkeypatch: pyt
 async def test_ticker_agent_run_workers_once(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.agents import ticker_service
 
+    monkeypatch.setattr(ticker_service.settings, "ticker_instrument_tokens_csv", "111,222")
     agent = TickerAgent()
     tenant_id = uuid4()
+    late_tenant_id = uuid4()
+    broken = True
 
-    async def _fetch() -> list[TenantTickerConfig]:
-        return [TenantTickerConfig(tenant_id=tenant_id, api_key_encrypted="enc:key")]
+    async def _iter() -> AsyncIterator[tuple[list, list[str]]]:
+        yield [tenant_id], ["enc:key"]
+        yield [late_tenant_id], ["enc:late"]
 
     class _Cipher:
         def decrypt(self, value: str) -> str:
+            if value == "enc:late" and broken:
+                raise ValueError("decrypt failed")
             return value.replace("enc:", "")
 
     class _Worker:
@@ -299,10 +680,134 @@ async def test_ticker_agent_run_workers_once(monkeypatch: pytest.MonkeyPatch) ->
         return worker
 
     monkeypatch.setattr(ticker_service, "get_security_cipher", lambda: _Cipher())
-    monkeypatch.setattr(ticker_service.settings, "ticker_instrument_tokens_csv", "111,222")
     monkeypatch.setattr(ticker_service, "TenantTickerWorker", _worker_factory)
-    monkeypatch.setattr(agent, "_fetch_tenant_configs", _fetch)
+    monkeypatch.setattr(agent, "_iter_tenant_batches", _iter)
 
-    await agent._run_workers_once()
-    assert agent.health.metrics["tenants_seen"] == 1
+    # The second batch fails after the first batch's worker has started.
+    with pytest.raises(ValueError):
+        await agent._run_workers_once()
     assert len(created) == 1
+    assert created[0].kwargs["api_key"] == "key"
+
+    broken = False
+    await agent._run_workers_once()
+    assert agent.health.metrics["tenants_seen"] == 2
+    assert [worker.kwargs["api_key"] for worker in created] == ["key", "late"]
+
+    await agent._run_workers_once()
+    assert agent.health.metrics["tenants_seen"] == 2
+    assert len(created) == 2
+    assert created[0].kwargs["instrument_tokens"] == [111, 222]
+
+
+@pytest.mark.asyncio
+async def test_ticker_agent_iter_tenant_batches_yields_columns(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.agents import ticker_service
+
+    tenant_ids = [uuid4() for _ in range(3)]
+    statements: list[object] = []
+
+    class _Stream:
+        async def partitions(self):
+            yield [(tenant_ids[0], "enc:a"), (tenant_ids[1], "enc:b")]
+            yield [(tenant_ids[2], "enc:c")]
+
+    class _Session:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+        async def stream(self, stmt):  # noqa: ANN001
+            statements.append(stmt)
+            return _Stream()
+
+    monkeypatch.setattr(ticker_service, "AsyncSessionLocal", _Session)
+    agent = TickerAgent()
+
+    batches = [batch async for batch in agent._iter_tenant_batches()]
+    assert batches == [(tenant_ids[:2], ["enc:a", "enc:b"]), (tenant_ids[2:], ["enc:c"])]
+    assert statements[0].get_execution_options()["yield_per"] == 50
+
+
+@pytest.mark.asyncio
+async def test_auth_agent_refresh_all_reuses_browser_contexts(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.agents import auth_service
+
+    agent = AuthAgent()
+    records = [
+        TenantAuthRecord(
+            tenant_id=uuid4(),
+            user_id=uuid4(),
+            api_key_encrypted="enc:key",
+            api_secret_encrypted="enc:sec",
+            totp_secret_encrypted="enc:totp",
+        )
+        for _ in range(5)
+    ]
+
+    class _Context:
+        def __init__(self) -> None:
+            self.cookie_clears = 0
+
+        async def clear_cookies(self) -> None:
+            self.cookie_clears += 1
+
+    contexts: list[_Context] = []
+
+    class _Browser:
+        async def new_context(self) -> _Context:
+            context = _Context()
+            contexts.append(context)
+            return context
+
+        async def close(self) -> None:
+            return None
+
+    class _Playwright:
+        def __init__(self) -> None:
+            self.chromium = SimpleNamespace(launch=self._launch)
+
+        async def _launch(self, **kwargs):  # noqa: ANN003
+            _ = kwargs
+            return _Browser()
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+    used: list[_Context] = []
+
+    async def _refresh(context, _redis, record):  # noqa: ANN001
+        used.append(context)
+        if record in records[:3]:
+            raise ValueError("login failed")
+
+    failures: list[TenantAuthRecord] = []
+
+    async def _emit(_redis, record, _exc):  # noqa: ANN001
+        failures.append(record)
+        # Failing to report must not kill the worker and stall the bounded queue.
+        raise ConnectionError("redis down")
+
+    async def _iter():
+        for record in records:
+            yield record
+
+    monkeypatch.setattr(auth_service, "async_playwright", _Playwright)
+    monkeypatch.setattr(auth_service.settings, "auth_refresh_concurrency", 2)
+    agent._iter_tenant_records = _iter  # type: ignore[method-assign]
+    agent._refresh_single_tenant_token = _refresh  # type: ignore[method-assign]
+    agent._emit_auth_failure_event = _emit  # type: ignore[method-assign]
+
+    await asyncio.wait_for(agent._refresh_all_tenant_tokens(), timeout=5)
+
+    assert 1 <= len(contexts) <= 2
+    assert set(map(id, used)) <= set(map(id, contexts))
+    assert sum(context.cookie_clears for context in contexts) == 5
+    assert sorted(map(id, failures)) == sorted(map(id, records[:3]))
+    assert agent.health.metrics["tenants_seen"] == 5
+    assert agent.health.metrics["tenants_refreshed"] == 2
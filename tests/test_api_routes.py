@@ -1,17 +1,51 @@
 from __future__ import annotations
 
+from collections import deque
+from collections.abc import Callable
 from dataclasses import dataclass
 from datetime import datetime, timezone
 from types import SimpleNamespace
+from typing import Any
+from unittest.mock import AsyncMock, Mock
 from uuid import uuid4
 
+import httpx
 import pytest
-from fastapi.testclient import TestClient
+import stripe
+from fastapi import FastAPI
+from pydantic import ValidationError
 
-from src.api.main import app
+from src.api import middleware
+from src.api.dependencies import get_redis
+from src.api.routes import account, billing, connections, profiles, webhooks
 from src.core.auth import AuthContext, require_auth_context, require_super_admin
 from src.core.db import get_db_session
 from src.core.security.crypto import EncryptionError
+from src.schemas.admin import TenantConnectionStatus
+
+
+# Signature of the conftest `override` fixture.
+_Override = Callable[[Any, Any], None]
+
+# Shared webhook request shapes; tests only read them.
+_CLERK_OK = {"X-Clerk-Webhook-Secret": "clerk_secret"}
+_CLERK_BAD = {"X-Clerk-Webhook-Secret": "bad"}
+_BARE_INVOICE_PAID = {"type": "invoice.paid"}
+_NOOP_EVENT = {"type": "noop.event"}
+_INVOICE_PAID_PAYLOAD = {
+    "type": "invoice.paid",
+    "data": {"object": {"metadata": {"clerk_org_id": "org_123", "subscription_tier": "pro"}}},
+}
+_QUEUED_PAYLOAD = {
+    "type": "subscription.deleted",
+    "data": {"object": {"metadata": {"clerk_org_id": "org_123"}}},
+}
+_NO_ORG_PAYLOAD = {"type": "invoice.paid", "data": {"object": {"metadata": {}}}}
+
+# Ids are drawn once at import; tests only need them to be distinct, not fresh.
+_TENANT_ID, _USER_ID, _ADMIN_TENANT_ID, _ADMIN_USER_ID, _OTHER_TENANT_ID, _PROFILE_ID, _LISTED_TENANT_ID = (
+    uuid4() for _ in range(7)
+)
 
 
 @dataclass
@@ -24,15 +58,15 @@ class _FakeScalars:
 
 class _FakeSession:
     def __init__(self, *, scalar_values: list | None = None, scalars_values: list | None = None) -> None:
-        self._scalar_values = list(scalar_values or [])
-        self._scalars_values = list(scalars_values or [])
+        self._scalar_values = deque(scalar_values or [])
+        self._scalars_values = deque(scalars_values or [])
         self.committed = False
 
     async def scalar(self, stmt):  # noqa: ANN001
-        return self._scalar_values.pop(0) if self._scalar_values else None
+        return self._scalar_values.popleft() if self._scalar_values else None
 
     async def scalars(self, stmt):  # noqa: ANN001
-        value = self._scalars_values.pop(0) if self._scalars_values else []
+        value = self._scalars_values.popleft() if self._scalars_values else []
         return _FakeScalars(value)
 
     async def execute(self, stmt):  # noqa: ANN001
@@ -42,11 +76,11 @@ class _FakeSession:
         self.committed = True
 
 
-@pytest.fixture
+@pytest.fixture(scope="module")
 def auth_context() -> AuthContext:
     return AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
+        tenant_id=_TENANT_ID,
+        user_id=_USER_ID,
         subject="user_123",
         org_id="org_123",
         claims={"role": "member"},
@@ -54,140 +88,234 @@ def auth_context() -> AuthContext:
 
 
 @pytest.fixture
-def client(auth_context: AuthContext):
+def client(_client: httpx.AsyncClient, auth_context: AuthContext, override: _Override) -> httpx.AsyncClient:
     async def _auth_override() -> AuthContext:
         return auth_context
 
-    app.dependency_overrides[require_auth_context] = _auth_override
-    with TestClient(app) as c:
-        yield c
-    app.dependency_overrides.clear()
+    override(require_auth_context, _auth_override)
+    return _client
 
 
-def test_health_endpoint(client: TestClient) -> None:
-    res = client.get("/health")
-    assert res.status_code == 200
-    assert res.json() == {"status": "ok"}
+class _FakeKite:
+    """KiteConnect stand-in whose behaviour is picked by the request token."""
 
+    def __init__(self, api_key: str) -> None:
+        self.api_key = api_key
 
-def test_account_upsert_kite_credentials_create(client: TestClient, monkeypatch: pytest.MonkeyPatch, auth_context: AuthContext) -> None:
-    from src.api.routes import account
+    def generate_session(self, request_token: str, api_secret: str) -> dict:
+        if request_token == "boomtoken":
+            raise RuntimeError("kite down")
+        if request_token == "notokenxx":
+            return {"user_id": "u1"}
+        return {"access_token": "at", "user_id": "u1"}
 
-    class FakeCipher:
-        def encrypt(self, value: str) -> str:
-            return f"enc:{value}"
+    def set_access_token(self, token: str) -> None:
+        return None
 
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            pass
+    def profile(self) -> dict:
+        return {"user_name": "Trader"}
 
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return None
 
-        async def create(self, **values):  # noqa: ANN001
-            return SimpleNamespace(updated_at=datetime.now(timezone.utc), **values)
+def _kite_credential(tenant_id) -> SimpleNamespace:  # noqa: ANN001
+    return SimpleNamespace(
+        tenant_id=tenant_id,
+        api_key_encrypted="enc:key",
+        api_secret_encrypted="enc:sec",
+        totp_secret_encrypted="enc:12345678",
+    )
+
 
-    fake_session = _FakeSession()
+class _FakeKiteCipher:
+    def __init__(self, env: SimpleNamespace) -> None:
+        self._env = env
 
-    async def _db_override():
-        yield fake_session
+    def encrypt(self, value: str) -> str:
+        return f"enc:{value}"
 
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(account, "get_security_cipher", lambda: FakeCipher())
-    monkeypatch.setattr(account, "KiteCredentialRepository", FakeRepo)
+    def decrypt(self, value: str) -> str:
+        if self._env.cipher_fail:
+            raise EncryptionError("bad")
+        return value.replace("enc:", "")
 
-    res = client.put(
-        "/api/v1/account/kite-credentials",
-        json={"api_key": "k", "api_secret": "s", "totp_secret": "12345678"},
-    )
 
-    assert res.status_code == 422  # key/secret too short by schema
+class _FakeCredentialRepo:
+    def __init__(self, env: SimpleNamespace) -> None:
+        self._env = env
 
-    res = client.put(
-        "/api/v1/account/kite-credentials",
-        json={"api_key": "key1", "api_secret": "sec1", "totp_secret": "12345678"},
-    )
-    assert res.status_code == 200
-    assert res.json()["linked"] is True
-    assert fake_session.committed is True
+    async def get_by_user_id(self, user_id):  # noqa: ANN001
+        return self._env.credential
 
+    async def upsert(self, user_id, **values):  # noqa: ANN001
+        self._env.upserts.append({"user_id": user_id, **values})
+        return SimpleNamespace(updated_at=datetime.now(timezone.utc), user_id=user_id, **values)
 
-def test_account_kite_status_not_linked(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import account
 
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            pass
+class _FakeKiteRedis:
+    def __init__(self, env: SimpleNamespace) -> None:
+        self._env = env
 
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
+    async def set(self, key, value, ex=None):  # noqa: ANN001
+        self._env.redis_keys.append(key)
+        return True
+
+
+class _FakeProfileRepo:
+    def __init__(self) -> None:
+        self.profile: SimpleNamespace | None = None
+        self.update_fails = False
+
+    async def get_by_user_id(self, user_id):  # noqa: ANN001
+        return self.profile
+
+    async def upsert(self, user_id, **values):  # noqa: ANN001
+        if self.profile is None:
+            self.profile = SimpleNamespace(id=_PROFILE_ID, user_id=user_id)
+        for k, v in values.items():
+            setattr(self.profile, k, v)
+        return self.profile
+
+    async def update(self, entity_id, **values):  # noqa: ANN001
+        if self.profile is None or self.update_fails:
             return None
+        for k, v in values.items():
+            setattr(self.profile, k, v)
+        return self.profile
 
-    fake_session = _FakeSession()
 
+def _override_db(override: _Override, session: _FakeSession) -> None:
     async def _db_override():
-        yield fake_session
+        yield session
+
+    override(get_db_session, _db_override)
 
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(account, "KiteCredentialRepository", FakeRepo)
 
-    res = client.get("/api/v1/account/kite-credentials/status")
+@pytest.fixture
+def kite_test_env(
+    override: _Override, client: httpx.AsyncClient, auth_context: AuthContext, monkeypatch: pytest.MonkeyPatch
+) -> SimpleNamespace:
+    """Patch the Kite routes' collaborators once; tests steer them through the returned namespace."""
+    env = SimpleNamespace(
+        client=client,
+        auth=auth_context,
+        session=_FakeSession(),
+        credential=None,
+        cipher_fail=False,
+        redis_keys=[],
+        upserts=[],
+    )
+    _override_db(override, env.session)
+    redis_client = _FakeKiteRedis(env)
+    override(get_redis, lambda: redis_client)
+    repo = _FakeCredentialRepo(env)
+    cipher = _FakeKiteCipher(env)
+    for module in (account, connections):
+        monkeypatch.setattr(module, "KiteCredentialRepository", lambda session: repo)
+        monkeypatch.setattr(module, "KiteConnect", _FakeKite)
+        monkeypatch.setattr(module, "get_security_cipher", lambda: cipher)
+    return env
+
+
+@pytest.fixture
+def profile_repo(
+    override: _Override, client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+) -> _FakeProfileRepo:
+    repo = _FakeProfileRepo()
+    _override_db(override, _FakeSession())
+    monkeypatch.setattr(profiles, "TradingProfileRepository", lambda session: repo)
+    return repo
+
+
+@pytest.mark.asyncio
+async def test_health_endpoint(client: httpx.AsyncClient) -> None:
+    res = await client.get("/health")
     assert res.status_code == 200
-    assert res.json() == {"linked": False, "updated_at": None}
+    assert res.json() == {"status": "ok"}
 
 
-def test_profiles_upsert_and_master_switch(client: TestClient, monkeypatch: pytest.MonkeyPatch, auth_context: AuthContext) -> None:
-    from src.api.routes import profiles
+@pytest.mark.asyncio
+async def test_health_endpoint_skips_tenant_context(
+    client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    opened: list[str] = []
+    monkeypatch.setattr(middleware, "begin_request_row_cache", lambda: opened.append("rows"))
 
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            self._profile = None
+    assert (await client.get("/health")).status_code == 200
+    assert opened == []
 
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return self._profile
 
-        async def create(self, **values):  # noqa: ANN001
-            self._profile = SimpleNamespace(id=uuid4(), **values)
-            return self._profile
+@pytest.mark.asyncio
+async def test_account_upsert_kite_credentials_create(kite_test_env: SimpleNamespace) -> None:
+    client = kite_test_env.client
+    res = await client.put(
+        "/api/v1/account/kite-credentials",
+        json={"api_key": "k", "api_secret": "s", "totp_secret": "12345678"},
+    )
 
-        async def update(self, entity_id, **values):  # noqa: ANN001
-            if self._profile is None:
-                return None
-            for k, v in values.items():
-                setattr(self._profile, k, v)
-            return self._profile
+    assert res.status_code == 422  # key/secret too short by schema
 
-    fake_repo = FakeRepo(None)
+    res = await client.put(
+        "/api/v1/account/kite-credentials",
+        json={"api_key": "key-1!", "api_secret": "sec1", "totp_secret": "12345678"},
+    )
+    assert res.status_code == 422  # Kite keys are alphanumeric
 
-    class RepoFactory:
-        def __new__(cls, session):  # noqa: ANN001
-            return fake_repo
+    res = await client.put(
+        "/api/v1/account/kite-credentials",
+        json={"api_key": " key1 ", "api_secret": "sec1", "totp_secret": "12345678"},
+    )
+    assert res.status_code == 200
+    assert res.json()["linked"] is True
+    assert kite_test_env.session.committed is True
 
-    fake_session = _FakeSession()
 
-    async def _db_override():
-        yield fake_session
+@pytest.mark.asyncio
+async def test_account_kite_status_not_linked(kite_test_env: SimpleNamespace) -> None:
+    res = await kite_test_env.client.get("/api/v1/account/kite-credentials/status")
+    assert res.status_code == 200
+    assert res.json() == {"linked": False}
 
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(profiles, "TradingProfileRepository", RepoFactory)
 
-    res = client.put(
+@pytest.mark.asyncio
+async def test_profiles_upsert_and_master_switch(
+    client: httpx.AsyncClient, profile_repo: _FakeProfileRepo
+) -> None:
+    res = await client.put(
         "/api/v1/profile/trading",
         json={"max_daily_loss": "100.50", "max_orders": 5, "master_switch_enabled": False},
     )
     assert res.status_code == 200
     assert res.json()["max_orders"] == 5
+    assert res.json()["max_daily_loss"] == "100.50"
+    assert profile_repo.profile.max_daily_loss_minor == 10050
 
-    res = client.patch("/api/v1/profile/trading/master-switch", json={"enabled": True})
+    res = await client.put(
+        "/api/v1/profile/trading",
+        json={"max_daily_loss": "100.505", "max_orders": 5, "master_switch_enabled": False},
+    )
+    assert res.status_code == 422
+
+    res = await client.patch("/api/v1/profile/trading/master-switch", json={"enabled": True})
     assert res.status_code == 200
     assert res.json()["master_switch_enabled"] is True
 
 
-def test_admin_routes(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import admin
+@pytest.fixture(scope="module")
+def listed_tenant() -> SimpleNamespace:
+    return SimpleNamespace(
+        id=_LISTED_TENANT_ID,
+        clerk_org_id="org_a",
+        subscription_tier="pro",
+        created_at=datetime.now(timezone.utc),
+    )
+
 
+@pytest.mark.asyncio
+async def test_admin_routes(
+    app: FastAPI, client: httpx.AsyncClient, override: _Override, listed_tenant: SimpleNamespace
+) -> None:
     admin_ctx = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
+        tenant_id=_ADMIN_TENANT_ID,
+        user_id=_ADMIN_USER_ID,
         subject="boss",
         org_id="org_admin",
         claims={"role": "super_admin"},
@@ -196,85 +324,86 @@ def test_admin_routes(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> No
     async def _super_admin_override() -> AuthContext:
         return admin_ctx
 
-    app.dependency_overrides[require_super_admin] = _super_admin_override
+    override(require_super_admin, _super_admin_override)
 
-    tenant = SimpleNamespace(id=uuid4(), clerk_org_id="org_a", subscription_tier="pro", created_at=datetime.now(timezone.utc))
     fake_session = _FakeSession(
         scalar_values=[1],
-        scalars_values=[[tenant], [tenant.id]],
+        scalars_values=[[listed_tenant], [listed_tenant.id]],
     )
 
-    async def _db_override():
-        yield fake_session
+    _override_db(override, fake_session)
+
+    class FakePipeline:
+        def __init__(self) -> None:
+            self.commands: list[tuple[str, str]] = []
+
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+        def get(self, key):  # noqa: ANN001
+            self.commands.append(("get", key))
+
+        def ttl(self, key):  # noqa: ANN001
+            self.commands.append(("ttl", key))
 
-    app.dependency_overrides[get_db_session] = _db_override
+        async def execute(self):
+            return ["token" if name == "get" else 100 for name, _ in self.commands]
 
     class FakeRedis:
-        async def get(self, key):  # noqa: ANN001
-            return "token"
+        def __init__(self) -> None:
+            self.exists_calls: list[tuple[str, ...]] = []
 
-        async def ttl(self, key):  # noqa: ANN001
-            return 100
+        def pipeline(self, transaction=True):  # noqa: ANN001
+            return FakePipeline()
 
         async def ping(self):
             return True
 
-        async def exists(self, key):  # noqa: ANN001
-            return 1
+        async def exists(self, *keys):  # noqa: ANN002
+            self.exists_calls.append(keys)
+            return len(keys)
 
-        async def aclose(self):
-            return None
-
-    monkeypatch.setattr(admin.redis, "from_url", lambda *a, **k: FakeRedis())
+    fake_redis = FakeRedis()
+    override(get_redis, lambda: fake_redis)
 
-    res = client.get("/api/v1/admin/tenants/active")
+    res = await client.get("/api/v1/admin/tenants/active")
     assert res.status_code == 200
     assert len(res.json()) == 1
     assert res.json()[0]["connected"] is True
+    assert res.json()[0]["token_ttl_seconds"] == 100
+    assert set(res.json()[0]) == set(TenantConnectionStatus.__annotations__)
+    assert "TenantConnectionStatus" in app.openapi()["components"]["schemas"]
 
-    res = client.get("/api/v1/admin/system/health")
+    res = await client.get("/api/v1/admin/system/health")
     assert res.status_code == 200
     body = res.json()
     assert body["status"] == "ok"
     assert body["connected_tenants"] == 1
+    assert fake_redis.exists_calls == [(f"kite:access_token:{listed_tenant.id}",)]
 
 
-def test_webhook_invoice_paid_flow(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import webhooks
-
-    tenant = SimpleNamespace(id=uuid4(), clerk_org_id="org_123", subscription_tier="basic", is_active=False)
-    fake_session = _FakeSession(scalar_values=[tenant])
-
-    async def _db_override():
-        yield fake_session
-
-    app.dependency_overrides[get_db_session] = _db_override
-
-    called = {"updated": False}
-
-    async def _fake_set_state(tenant_id: str, active: bool) -> None:
-        called["updated"] = True
-        called["active"] = active
-
-    monkeypatch.setattr(webhooks, "_set_tenant_redis_state", _fake_set_state)
+@pytest.mark.asyncio
+async def test_webhook_invoice_paid_flow(client: httpx.AsyncClient, monkeypatch: pytest.MonkeyPatch) -> None:
+    submitted: list = []
+    monkeypatch.setattr(
+        webhooks.billing_events,
+        "submit",
+        AsyncMock(side_effect=lambda event: submitted.append(event) or True),
+    )
     monkeypatch.setattr(webhooks.settings, "stripe_webhook_secret", "")
     monkeypatch.setattr(webhooks.settings, "clerk_webhook_secret", "")
 
-    payload = {
-        "type": "invoice.paid",
-        "data": {"object": {"metadata": {"clerk_org_id": "org_123", "subscription_tier": "pro"}}},
-    }
-
-    res = client.post("/api/v1/webhooks/billing", json=payload)
+    res = await client.post("/api/v1/webhooks/billing", json=_INVOICE_PAID_PAYLOAD)
     assert res.status_code == 200
-    assert res.json()["updated"] is True
-    assert called["updated"] is True
-    assert called["active"] is True
-
+    assert res.json()["queued"] is True
+    assert submitted == [webhooks.BillingEvent(event_type="invoice.paid", org_id="org_123", tier="pro")]
 
-def test_billing_guard_routes(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import billing
 
+@pytest.mark.asyncio
+async def test_billing_guard_routes(client: httpx.AsyncClient, override: _Override) -> None:
     ent = SimpleNamespace(tier="pro", max_strategies=None, daily_trade_limit=None, priority_execution=True)
 
     async def _ent_override():
@@ -283,339 +412,201 @@ def test_billing_guard_routes(client: TestClient, monkeypatch: pytest.MonkeyPatc
     async def _ok_guard():
         return ent
 
-    app.dependency_overrides[billing.get_current_entitlements] = _ent_override
-    app.dependency_overrides[billing.enforce_strategy_limit] = _ok_guard
-    app.dependency_overrides[billing.enforce_daily_trade_limit] = _ok_guard
-    app.dependency_overrides[billing.require_pro_tier] = _ok_guard
+    override(billing.get_current_entitlements, _ent_override)
+    override(billing.enforce_strategy_limit, _ok_guard)
+    override(billing.enforce_daily_trade_limit, _ok_guard)
+    override(billing.require_pro_tier, _ok_guard)
 
-    assert client.get("/api/v1/billing/entitlements").status_code == 200
-    assert client.post("/api/v1/billing/guards/strategy").status_code == 200
-    assert client.post("/api/v1/billing/guards/trade").status_code == 200
-    assert client.post("/api/v1/billing/guards/priority").status_code == 200
+    assert (await client.get("/api/v1/billing/entitlements")).status_code == 200
+    assert (await client.post("/api/v1/billing/guards/strategy")).status_code == 200
+    assert (await client.post("/api/v1/billing/guards/trade")).status_code == 200
+    assert (await client.post("/api/v1/billing/guards/priority")).status_code == 200
 
 
-def test_account_upsert_update_failure_returns_500(client: TestClient, monkeypatch: pytest.MonkeyPatch, auth_context: AuthContext) -> None:
-    from src.api.routes import account
-
-    class FakeCipher:
-        def encrypt(self, value: str) -> str:
-            return f"enc:{value}"
-
-    existing = SimpleNamespace(id=uuid4(), user_id=auth_context.user_id)
-
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            pass
-
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return existing
-
-        async def update(self, entity_id, **values):  # noqa: ANN001
-            return None
-
-    fake_session = _FakeSession()
-
-    async def _db_override():
-        yield fake_session
-
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(account, "get_security_cipher", lambda: FakeCipher())
-    monkeypatch.setattr(account, "KiteCredentialRepository", FakeRepo)
-
-    res = client.put(
+@pytest.mark.asyncio
+async def test_account_upsert_kite_credentials_overwrites_in_one_call(kite_test_env: SimpleNamespace) -> None:
+    res = await kite_test_env.client.put(
         "/api/v1/account/kite-credentials",
         json={"api_key": "key1", "api_secret": "sec1", "totp_secret": "12345678"},
     )
-    assert res.status_code == 500
-
-
-def test_account_check_connection_branches(client: TestClient, monkeypatch: pytest.MonkeyPatch, auth_context: AuthContext) -> None:
-    from src.api.routes import account
-
-    class FakeCipher:
-        def __init__(self, fail: bool = False) -> None:
-            self.fail = fail
-
-        def decrypt(self, value: str) -> str:
-            if self.fail:
-                raise EncryptionError("bad")
-            return value.replace("enc:", "")
-
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            self._cred = None
-
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return self._cred
-
-    repo = FakeRepo(None)
-
-    class RepoFactory:
-        def __new__(cls, session):  # noqa: ANN001
-            return repo
-
-    class FakeRedis:
-        async def set(self, key, value, ex=None):  # noqa: ANN001
-            return True
-
-        async def aclose(self):
-            return None
-
-    class FakeKite:
-        def __init__(self, api_key: str) -> None:
-            self.api_key = api_key
-
-        def generate_session(self, request_token: str, api_secret: str) -> dict:
-            if request_token == "boomtoken":
-                raise RuntimeError("kite down")
-            if request_token == "notokenxx":
-                return {"user_id": "u1"}
-            return {"access_token": "at", "user_id": "u1"}
-
-    fake_session = _FakeSession()
-
-    async def _db_override():
-        yield fake_session
-
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(account, "KiteCredentialRepository", RepoFactory)
-    monkeypatch.setattr(account.redis, "from_url", lambda *a, **k: FakeRedis())
-    monkeypatch.setattr(account, "KiteConnect", FakeKite)
-
-    res = client.post("/api/v1/account/kite/check-connection", json={"request_token": "tokennnn1"})
-    assert res.status_code == 404
-
-    repo._cred = SimpleNamespace(
-        api_key_encrypted="enc:key",
-        api_secret_encrypted="enc:sec",
-        totp_secret_encrypted="enc:12345678",
-    )
-    monkeypatch.setattr(account, "get_security_cipher", lambda: FakeCipher(fail=True))
-    res = client.post("/api/v1/account/kite/check-connection", json={"request_token": "tokennnn1"})
-    assert res.status_code == 500
-
-    monkeypatch.setattr(account, "get_security_cipher", lambda: FakeCipher(fail=False))
-    res = client.post("/api/v1/account/kite/check-connection", json={"request_token": "boomtoken"})
-    assert res.status_code == 200
-    assert res.json()["success"] is False
-
-    res = client.post("/api/v1/account/kite/check-connection", json={"request_token": "notokenxx"})
-    assert res.status_code == 200
-    assert res.json()["success"] is False
-
-    res = client.post("/api/v1/account/kite/check-connection", json={"request_token": "tokennnn1"})
     assert res.status_code == 200
-    assert res.json()["success"] is True
-
-
-def test_profiles_get_and_master_switch_errors(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import profiles
-
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            self.profile = None
-
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return self.profile
-
-        async def update(self, entity_id, **values):  # noqa: ANN001
-            return None
-
-    repo = FakeRepo(None)
-
-    class RepoFactory:
-        def __new__(cls, session):  # noqa: ANN001
-            return repo
-
-    fake_session = _FakeSession()
-
-    async def _db_override():
-        yield fake_session
+    assert kite_test_env.upserts == [
+        {
+            "user_id": kite_test_env.auth.user_id,
+            "api_key_encrypted": "enc:key1",
+            "api_secret_encrypted": "enc:sec1",
+            "totp_secret_encrypted": "enc:12345678",
+        }
+    ]
+
+
+@pytest.mark.parametrize(
+    ("credential", "cipher_fail", "request_token", "status_code", "success"),
+    [
+        pytest.param(False, False, "tokennnn1", 404, None, id="missing-credentials"),
+        pytest.param(True, True, "tokennnn1", 500, None, id="undecryptable"),
+        pytest.param(True, False, "boomtoken", 200, False, id="kite-error"),
+        pytest.param(True, False, "notokenxx", 200, False, id="missing-access-token"),
+        pytest.param(True, False, "tokennnn1", 200, True, id="connected"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_account_check_connection_branches(
+    kite_test_env: SimpleNamespace,
+    credential: bool,
+    cipher_fail: bool,
+    request_token: str,
+    status_code: int,
+    success: bool | None,
+) -> None:
+    if credential:
+        kite_test_env.credential = _kite_credential(kite_test_env.auth.tenant_id)
+    kite_test_env.cipher_fail = cipher_fail
+
+    res = await kite_test_env.client.post(
+        "/api/v1/account/kite/check-connection", json={"request_token": request_token}
+    )
+    assert res.status_code == status_code
+    if success is not None:
+        assert res.json()["success"] is success
+        assert bool(kite_test_env.redis_keys) is success
 
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(profiles, "TradingProfileRepository", RepoFactory)
 
-    res = client.get("/api/v1/profile/trading")
+@pytest.mark.asyncio
+async def test_profiles_get_and_master_switch_errors(
+    client: httpx.AsyncClient, profile_repo: _FakeProfileRepo
+) -> None:
+    res = await client.get("/api/v1/profile/trading")
     assert res.status_code == 404
 
-    repo.profile = SimpleNamespace(
-        id=uuid4(),
-        max_daily_loss="10.00",
+    profile_repo.profile = SimpleNamespace(
+        id=_PROFILE_ID,
+        max_daily_loss_minor=1000,
         max_orders=2,
         master_switch_enabled=False,
     )
-    res = client.patch("/api/v1/profile/trading/master-switch", json={"enabled": True})
+    profile_repo.update_fails = True
+    res = await client.patch("/api/v1/profile/trading/master-switch", json={"enabled": True})
     assert res.status_code == 500
 
 
-def test_profiles_get_success_and_upsert_update_failure(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import profiles
-
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            self.profile = SimpleNamespace(
-                id=uuid4(),
-                max_daily_loss="10.00",
-                max_orders=3,
-                master_switch_enabled=True,
-            )
-
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return self.profile
-
-        async def update(self, entity_id, **values):  # noqa: ANN001
-            return None
-
-    class RepoFactory:
-        def __new__(cls, session):  # noqa: ANN001
-            return FakeRepo(session)
-
-    fake_session = _FakeSession()
-
-    async def _db_override():
-        yield fake_session
-
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(profiles, "TradingProfileRepository", RepoFactory)
+@pytest.mark.asyncio
+async def test_profiles_get_success_and_upsert_existing(
+    client: httpx.AsyncClient, profile_repo: _FakeProfileRepo
+) -> None:
+    profile_repo.profile = SimpleNamespace(
+        id=_PROFILE_ID,
+        max_daily_loss_minor=1000,
+        max_orders=3,
+        master_switch_enabled=True,
+    )
 
-    res = client.get("/api/v1/profile/trading")
+    res = await client.get("/api/v1/profile/trading")
     assert res.status_code == 200
     assert res.json()["max_orders"] == 3
 
-    res = client.put(
+    res = await client.put(
         "/api/v1/profile/trading",
         json={"max_daily_loss": "99.99", "max_orders": 9, "master_switch_enabled": False},
     )
-    assert res.status_code == 500
-
-
-def test_connections_route_branches(client: TestClient, monkeypatch: pytest.MonkeyPatch, auth_context: AuthContext) -> None:
-    from src.api.routes import connections
-
-    class FakeCipher:
-        def __init__(self, fail: bool = False) -> None:
-            self.fail = fail
-
-        def decrypt(self, value: str) -> str:
-            if self.fail:
-                raise EncryptionError("bad")
-            return value.replace("enc:", "")
-
-    class FakeRepo:
-        def __init__(self, session):  # noqa: ANN001
-            self.credential = None
-
-        async def get_by_user_id(self, user_id):  # noqa: ANN001
-            return self.credential
-
-    repo = FakeRepo(None)
-
-    class RepoFactory:
-        def __new__(cls, session):  # noqa: ANN001
-            return repo
-
-    class FakeKite:
-        def __init__(self, api_key: str) -> None:
-            self.api_key = api_key
-
-        def generate_session(self, request_token: str, api_secret: str) -> dict:
-            if request_token == "badtoken1":
-                raise RuntimeError("bad token")
-            if request_token == "notokenx":
-                return {"user_id": "u1"}
-            return {"access_token": "at", "user_id": "u1"}
-
-        def set_access_token(self, token: str) -> None:
-            return None
-
-        def profile(self) -> dict:
-            return {"user_name": "Trader"}
-
-    fake_session = _FakeSession()
-
-    async def _db_override():
-        yield fake_session
-
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(connections, "KiteCredentialRepository", RepoFactory)
-    monkeypatch.setattr(connections, "KiteConnect", FakeKite)
-    monkeypatch.setattr(connections, "get_security_cipher", lambda: FakeCipher())
-
-    payload = {"user_id": str(auth_context.user_id), "request_token": "goodtokn1"}
-    assert client.post("/api/v1/connections/kite/test", json=payload).status_code == 404
-
-    repo.credential = SimpleNamespace(
-        tenant_id=uuid4(),
-        api_key_encrypted="enc:key",
-        api_secret_encrypted="enc:sec",
-        totp_secret_encrypted="enc:12345678",
-    )
-    assert client.post("/api/v1/connections/kite/test", json=payload).status_code == 403
-
-    repo.credential = SimpleNamespace(
-        tenant_id=auth_context.tenant_id,
-        api_key_encrypted="enc:key",
-        api_secret_encrypted="enc:sec",
-        totp_secret_encrypted="enc:12345678",
-    )
-    monkeypatch.setattr(connections, "get_security_cipher", lambda: FakeCipher(fail=True))
-    assert client.post("/api/v1/connections/kite/test", json=payload).status_code == 500
-
-    monkeypatch.setattr(connections, "get_security_cipher", lambda: FakeCipher())
-    bad_payload = {"user_id": str(auth_context.user_id), "request_token": "badtoken1"}
-    assert client.post("/api/v1/connections/kite/test", json=bad_payload).status_code == 400
-
-    missing_token_payload = {"user_id": str(auth_context.user_id), "request_token": "notokenx"}
-    assert client.post("/api/v1/connections/kite/test", json=missing_token_payload).status_code == 400
-
-    res = client.post("/api/v1/connections/kite/test", json=payload)
     assert res.status_code == 200
-    assert res.json()["connected"] is True
-
-
-def test_webhook_misc_branches(client: TestClient, monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.api.routes import webhooks
-
-    fake_session = _FakeSession(
-        scalar_values=[None, SimpleNamespace(id=uuid4(), is_active=True)]
+    assert res.json()["max_orders"] == 9
+
+
+@pytest.mark.parametrize(
+    ("owner", "cipher_fail", "request_token", "status_code"),
+    [
+        pytest.param(None, False, "tokennnn1", 404, id="missing-credentials"),
+        pytest.param("other", False, "tokennnn1", 403, id="other-tenant"),
+        pytest.param("own", True, "tokennnn1", 500, id="undecryptable"),
+        pytest.param("own", False, "boomtoken", 400, id="kite-error"),
+        pytest.param("own", False, "notokenxx", 400, id="missing-access-token"),
+        pytest.param("own", False, "tokennnn1", 200, id="connected"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_connections_route_branches(
+    kite_test_env: SimpleNamespace,
+    owner: str | None,
+    cipher_fail: bool,
+    request_token: str,
+    status_code: int,
+) -> None:
+    auth = kite_test_env.auth
+    if owner is not None:
+        kite_test_env.credential = _kite_credential(auth.tenant_id if owner == "own" else _OTHER_TENANT_ID)
+    kite_test_env.cipher_fail = cipher_fail
+
+    payload = {"user_id": str(auth.user_id), "request_token": request_token}
+    res = await kite_test_env.client.post("/api/v1/connections/kite/test", json=payload)
+    assert res.status_code == status_code
+    if status_code == 200:
+        assert res.json() == {"connected": True, "kite_user_id": "u1", "user_name": "Trader"}
+
+
+@pytest.mark.parametrize(
+    ("clerk_secret", "stripe_secret", "headers", "body", "accepted", "status_code", "expected"),
+    [
+        pytest.param("clerk_secret", "", _CLERK_BAD, _BARE_INVOICE_PAID, True, 401, None, id="bad-clerk"),
+        pytest.param("clerk_secret", "", {}, _BARE_INVOICE_PAID, True, 401, None, id="missing-clerk-secret"),
+        pytest.param("clerk_secret", "", _CLERK_OK, _NOOP_EVENT, True, 200, None, id="clerk-secret-ok"),
+        pytest.param(
+            "", "whsec_test", {}, _NOOP_EVENT, True, 200, {"updated": False, "queued": False},
+            id="ignored-event-skips-verification",
+        ),
+        pytest.param("", "whsec_test", {}, b"{bad", True, 400, None, id="malformed-body"),
+        pytest.param("", "whsec_test", {}, _BARE_INVOICE_PAID, True, 401, None, id="missing-signature"),
+        pytest.param("", "", {}, _NO_ORG_PAYLOAD, True, 400, None, id="missing-org"),
+        pytest.param("", "", {}, _QUEUED_PAYLOAD, True, 200, {"queued": True}, id="queued"),
+        pytest.param("", "", {}, _QUEUED_PAYLOAD, False, 503, None, id="not-persisted"),
+    ],
+)
+@pytest.mark.asyncio
+async def test_webhook_misc_branches(
+    client: httpx.AsyncClient,
+    monkeypatch: pytest.MonkeyPatch,
+    clerk_secret: str,
+    stripe_secret: str,
+    headers: dict[str, str],
+    body: dict | bytes,
+    accepted: bool,
+    status_code: int,
+    expected: dict | None,
+) -> None:
+    submitted: list = []
+    monkeypatch.setattr(
+        webhooks.billing_events,
+        "submit",
+        AsyncMock(side_effect=lambda event: submitted.append(event) or accepted),
     )
-
-    async def _db_override():
-        yield fake_session
-
-    app.dependency_overrides[get_db_session] = _db_override
-    monkeypatch.setattr(webhooks.settings, "stripe_webhook_secret", "")
-    monkeypatch.setattr(webhooks.settings, "clerk_webhook_secret", "clerk_secret")
-
-    res = client.post("/api/v1/webhooks/billing", headers={"X-Clerk-Webhook-Secret": "bad"}, json={"type": "invoice.paid"})
-    assert res.status_code == 401
-
-    monkeypatch.setattr(webhooks.settings, "clerk_webhook_secret", "")
-    res = client.post("/api/v1/webhooks/billing", json={"type": "noop.event"})
-    assert res.status_code == 200
-    assert res.json()["updated"] is False
-
-    res = client.post("/api/v1/webhooks/billing", json={"type": "invoice.paid", "data": {"object": {"metadata": {}}}})
-    assert res.status_code == 400
-
-    res = client.post(
-        "/api/v1/webhooks/billing",
-        json={"type": "invoice.paid", "data": {"object": {"metadata": {"clerk_org_id": "org_none"}}}},
+    monkeypatch.setattr(webhooks.settings, "clerk_webhook_secret", clerk_secret)
+    monkeypatch.setattr(webhooks.settings, "stripe_webhook_secret", stripe_secret)
+    monkeypatch.setattr(stripe.WebhookSignature, "verify_header", Mock(side_effect=AssertionError))
+
+    if isinstance(body, bytes):
+        res = await client.post("/api/v1/webhooks/billing", headers=headers, content=body)
+    else:
+        res = await client.post("/api/v1/webhooks/billing", headers=headers, json=body)
+    assert res.status_code == status_code
+    if expected is not None:
+        assert res.json().items() >= expected.items()
+    if body is _QUEUED_PAYLOAD:
+        assert [event.event_type for event in submitted] == ["subscription.deleted"]
+
+
+def test_trusted_response_constructors_match_validated_models() -> None:
+    from src.core.billing import tier_to_entitlements
+    from src.schemas.billing import EntitlementResponse
+    from src.schemas.profile import TradingProfileResponse
+
+    profile = SimpleNamespace(max_daily_loss_minor=25050, max_orders=20, master_switch_enabled=True)
+    trusted = TradingProfileResponse.from_orm_trusted(profile)
+    assert trusted.model_dump() == TradingProfileResponse.model_validate(trusted.model_dump()).model_dump()
+    assert trusted.model_dump_json() == '{"max_daily_loss":"250.50","max_orders":20,"master_switch_enabled":true}'
+    with pytest.raises(ValidationError):
+        trusted.max_orders = 1
+
+    entitlements = tier_to_entitlements("basic")
+    assert EntitlementResponse.from_orm_trusted(entitlements).model_dump() == (
+        EntitlementResponse.model_validate(entitlements, from_attributes=True).model_dump()
     )
-    assert res.status_code == 200
-    assert res.json()["updated"] is False
-
-    called = {"inactive": False}
-
-    async def _fake_set_state(tenant_id: str, active: bool) -> None:
-        called["inactive"] = not active
-
-    monkeypatch.setattr(webhooks, "_set_tenant_redis_state", _fake_set_state)
-    payload = {
-        "type": "subscription.deleted",
-        "data": {"object": {"metadata": {"clerk_org_id": "org_123"}}},
-    }
-    res = client.post("/api/v1/webhooks/billing", json=payload)
-    assert res.status_code == 200
-    assert res.json()["updated"] is True
-    assert called["inactive"] is True
@@ -1,14 +1,19 @@
 from __future__ import annotations
 
+import asyncio
 from types import SimpleNamespace
+from unittest.mock import AsyncMock
 from uuid import uuid4
 
+import httpx
+import orjson
 import pytest
 from fastapi import HTTPException
 from jose import JWTError
 
 from src.core.auth import (
     AuthContext,
+    ClaimsCache,
     JwksCache,
     _decode_clerk_jwt,
     _get_signing_key,
@@ -19,10 +24,15 @@ from src.core.auth import (
 )
 
 
+# The super-admin checks only read subject/claims; fixed ids are enough.
+_TENANT_ID = uuid4()
+_USER_ID = uuid4()
+
+
 def _ctx(*, subject: str = "user_1", claims: dict | None = None) -> AuthContext:
     return AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
+        tenant_id=_TENANT_ID,
+        user_id=_USER_ID,
         subject=subject,
         org_id="org_123",
         claims=claims or {},
@@ -31,6 +41,7 @@ def _ctx(*, subject: str = "user_1", claims: dict | None = None) -> AuthContext:
 
 def test_subject_to_user_id_is_deterministic() -> None:
     assert subject_to_user_id("abc") == subject_to_user_id("abc")
+    assert subject_to_user_id("abc") is subject_to_user_id("abc")
     assert subject_to_user_id("abc") != subject_to_user_id("xyz")
 
 
@@ -41,6 +52,21 @@ def test_is_super_admin_by_subject(monkeypatch: pytest.MonkeyPatch) -> None:
     assert _is_super_admin(_ctx(subject="user_1")) is True
 
 
+def test_settings_csv_and_json_parsing_is_cached_per_raw_value(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import auth
+
+    monkeypatch.setattr(auth.settings, "zerodha_user_id_map_json", '{"t1": "u1"}')
+    users = auth.settings.tenant_zerodha_users()
+    assert users == {"t1": "u1"}
+    assert auth.settings.tenant_zerodha_users() is users
+
+    monkeypatch.setattr(auth.settings, "super_admin_subjects_csv", " a, ,b ")
+    assert auth.settings.super_admin_subjects() == {"a", "b"}
+    assert auth.settings.super_admin_subjects() is auth.settings.super_admin_subjects()
+    monkeypatch.setattr(auth.settings, "super_admin_subjects_csv", "c")
+    assert auth.settings.super_admin_subjects() == {"c"}
+
+
 def test_is_super_admin_by_claim_role(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
@@ -71,75 +97,189 @@ async def test_require_super_admin_blocks_non_admin(monkeypatch: pytest.MonkeyPa
     assert exc.value.status_code == 403
 
 
-def test_get_signing_key_missing_kid(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.asyncio
+async def test_get_signing_key_missing_kid(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
     monkeypatch.setattr(auth.jwt, "get_unverified_header", lambda token: {})
     with pytest.raises(HTTPException) as exc:
-        _get_signing_key("token")
+        await _get_signing_key("token")
     assert exc.value.status_code == 401
 
 
-def test_get_signing_key_no_matching_key(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.asyncio
+async def test_get_signing_key_no_matching_key(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
     monkeypatch.setattr(auth.jwt, "get_unverified_header", lambda token: {"kid": "abc"})
-    monkeypatch.setattr(auth.jwks_cache, "get", lambda url: {"keys": [{"kid": "zzz"}]})
+    monkeypatch.setattr(auth.jwks_cache, "get_key", AsyncMock(return_value=None))
 
     with pytest.raises(HTTPException) as exc:
-        _get_signing_key("token")
+        await _get_signing_key("token")
     assert exc.value.status_code == 401
 
 
-def test_decode_clerk_jwt_invalid(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.asyncio
+async def test_decode_clerk_jwt_invalid(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
-    monkeypatch.setattr(auth, "_get_signing_key", lambda token: {"kid": "abc"})
+    signing_key = AsyncMock(return_value={"kid": "abc"})
+    monkeypatch.setattr(auth, "_get_signing_key", signing_key)
+    monkeypatch.setattr(auth, "claims_cache", ClaimsCache())
 
     def _boom(*args, **kwargs):  # noqa: ANN002, ANN003
         raise JWTError("bad token")
 
     monkeypatch.setattr(auth.jwt, "decode", _boom)
     with pytest.raises(HTTPException) as exc:
-        _decode_clerk_jwt("token")
+        await _decode_clerk_jwt("token")
     assert exc.value.status_code == 401
 
+    # The rejection is cached briefly: no second key lookup or verify.
+    with pytest.raises(HTTPException):
+        await _decode_clerk_jwt("token")
+    assert signing_key.await_count == 1
 
-def test_jwks_cache_fetches_and_reuses(monkeypatch: pytest.MonkeyPatch) -> None:
+
+@pytest.mark.asyncio
+async def test_decode_clerk_jwt_caches_claims_until_exp(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
-    calls = {"count": 0}
+    now = {"t": 1000.0}
+    decoded: list[str] = []
+
+    def _decode(token, *args, **kwargs):  # noqa: ANN001, ANN002, ANN003
+        decoded.append(token)
+        return {"sub": "user_1", "exp": 1060}
+
+    monkeypatch.setattr(auth, "_get_signing_key", AsyncMock(return_value={"kid": "abc"}))
+    monkeypatch.setattr(auth, "claims_cache", ClaimsCache(ttl_seconds=300))
+    monkeypatch.setattr(auth.jwt, "decode", _decode)
+    monkeypatch.setattr(auth.time, "time", lambda: now["t"])
 
-    class _Resp:
-        def raise_for_status(self) -> None:
-            return None
+    first = await _decode_clerk_jwt("token")
+    assert await _decode_clerk_jwt("token") is first
+    assert decoded == ["token"]
 
-        def json(self) -> dict:
-            return {"keys": [{"kid": "a"}]}
+    now["t"] = 1061
+    await _decode_clerk_jwt("token")
+    assert decoded == ["token", "token"]
+
+
+@pytest.mark.asyncio
+async def test_jwks_cache_fetches_once_and_honours_max_age(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import auth
 
-    def _get(url: str, timeout: int):  # noqa: ANN001
+    calls = {"count": 0}
+    now = {"t": 1000.0}
+
+    def _handler(request: httpx.Request) -> httpx.Response:
         calls["count"] += 1
-        return _Resp()
+        return httpx.Response(200, json={"keys": [{"kid": "a"}]}, headers={"Cache-Control": "max-age=60"})
 
     cache = JwksCache(ttl_seconds=300)
-    monkeypatch.setattr(auth.requests, "get", _get)
-    monkeypatch.setattr(auth.time, "time", lambda: 1000.0)
-    first = cache.get("https://jwks.example")
-    second = cache.get("https://jwks.example")
-    assert first == second
+    cache._http = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now["t"])
+
+    results = await asyncio.gather(*(cache.get("https://jwks.example") for _ in range(5)))
+    assert all(result == {"keys": [{"kid": "a"}]} for result in results)
     assert calls["count"] == 1
 
+    now["t"] += 61
+    await cache.get("https://jwks.example")
+    assert calls["count"] == 2
+    await cache.aclose()
+
+
+@pytest.mark.asyncio
+async def test_jwks_cache_clamps_max_age(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import auth
+
+    max_age = {"value": "0"}
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"keys": []}, headers={"Cache-Control": f"max-age={max_age['value']}"})
 
-def test_get_signing_key_returns_matching_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    cache = JwksCache(min_ttl_seconds=60, max_ttl_seconds=3600)
+    cache._http = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+    monkeypatch.setattr(auth.time, "monotonic", lambda: 1000.0)
+
+    await cache.get("https://jwks.example")
+    assert cache._fresh_for == 60
+
+    max_age["value"] = "31536000"
+    await cache._refresh("https://jwks.example", seen=cache._fetched_at)
+    assert cache._fresh_for == 3600
+    await cache.aclose()
+
+
+@pytest.mark.asyncio
+async def test_jwks_cache_serves_stale_keys_when_refresh_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import auth
+
+    now = {"t": 1000.0}
+    fail = {"on": False}
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        if fail["on"]:
+            return httpx.Response(503)
+        return httpx.Response(200, json={"keys": [{"kid": "a"}]})
+
+    cache = JwksCache(ttl_seconds=300, stale_seconds=900)
+    cache._http = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now["t"])
+
+    await cache.get("https://jwks.example")
+    fail["on"] = True
+    now["t"] += 600
+    assert await cache.get("https://jwks.example") == {"keys": [{"kid": "a"}]}
+
+    now["t"] += 1200
+    with pytest.raises(httpx.HTTPStatusError):
+        await cache.get("https://jwks.example")
+    await cache.aclose()
+
+
+@pytest.mark.asyncio
+async def test_jwks_cache_refetches_once_for_unknown_kid(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import auth
+
+    now = {"t": 1000.0}
+    key_sets = [[{"kid": "old"}], [{"kid": "old"}, {"kid": "new"}]]
+    calls = {"count": 0}
+
+    def _handler(request: httpx.Request) -> httpx.Response:
+        keys = key_sets[min(calls["count"], len(key_sets) - 1)]
+        calls["count"] += 1
+        return httpx.Response(200, json={"keys": keys})
+
+    cache = JwksCache(ttl_seconds=300, min_refresh_seconds=30)
+    cache._http = httpx.AsyncClient(transport=httpx.MockTransport(_handler))
+    monkeypatch.setattr(auth.time, "monotonic", lambda: now["t"])
+
+    assert await cache.get_key("https://jwks.example", "old") == {"kid": "old"}
+    # Inside the rate-limit window an unknown kid does not trigger a refetch.
+    assert await cache.get_key("https://jwks.example", "new") is None
+    assert calls["count"] == 1
+
+    now["t"] += 31
+    assert await cache.get_key("https://jwks.example", "new") == {"kid": "new"}
+    assert calls["count"] == 2
+    await cache.aclose()
+
+
+@pytest.mark.asyncio
+async def test_get_signing_key_returns_matching_key(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
     monkeypatch.setattr(auth.jwt, "get_unverified_header", lambda token: {"kid": "abc"})
-    monkeypatch.setattr(auth.jwks_cache, "get", lambda url: {"keys": [{"kid": "abc", "kty": "RSA"}]})
-    key = _get_signing_key("token")
+    monkeypatch.setattr(auth.jwks_cache, "get_key", AsyncMock(return_value={"kid": "abc", "kty": "RSA"}))
+    key = await _get_signing_key("token")
     assert key["kid"] == "abc"
 
 
-def test_get_signing_key_invalid_header(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.asyncio
+async def test_get_signing_key_invalid_header(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
     def _bad_header(_token: str) -> dict:
@@ -147,30 +287,52 @@ def test_get_signing_key_invalid_header(monkeypatch: pytest.MonkeyPatch) -> None
 
     monkeypatch.setattr(auth.jwt, "get_unverified_header", _bad_header)
     with pytest.raises(HTTPException) as exc:
-        _get_signing_key("token")
+        await _get_signing_key("token")
     assert exc.value.status_code == 401
 
 
+class _FakeTenantCache:
+    def __init__(self, cached: dict | None = None) -> None:
+        self.store: dict[str, bytes] = {}
+        if cached is not None:
+            self.store["tenant:by_org:org_1"] = orjson.dumps(cached)
+
+    async def get(self, key: str) -> bytes | None:
+        return self.store.get(key)
+
+    async def set(self, key: str, value: bytes, ex: int) -> bool:
+        self.store[key] = value
+        return True
+
+
+class _Session:
+    def __init__(self, row: object | None = None) -> None:
+        self.row = row
+        self.executed = 0
+
+    async def execute(self, _stmt):  # noqa: ANN001
+        self.executed += 1
+        return SimpleNamespace(first=lambda: self.row)
+
+
 @pytest.mark.asyncio
 async def test_require_auth_context_sets_request_state(monkeypatch: pytest.MonkeyPatch) -> None:
     tenant_id = uuid4()
 
-    class _Session:
-        async def scalar(self, _stmt):  # noqa: ANN001
-            return SimpleNamespace(id=tenant_id)
-
     from src.core import auth
     from src.core.context import set_current_tenant_id
 
     monkeypatch.setattr(
         auth,
         "_decode_clerk_jwt",
-        lambda _token: {"org_id": "org_1", "sub": "user_1", "role": "member"},
+        AsyncMock(return_value={"org_id": "org_1", "sub": "user_1", "role": "member"}),
     )
+    monkeypatch.setattr(auth, "get_redis_client", lambda: _FakeTenantCache())
 
     request = SimpleNamespace(state=SimpleNamespace())
     credentials = SimpleNamespace(credentials="jwt")
-    context = await require_auth_context(request, credentials, _Session())
+    session = _Session(SimpleNamespace(id=tenant_id, is_active=True, subscription_tier="basic"))
+    context = await require_auth_context(request, credentials, session)
 
     assert context.tenant_id == tenant_id
     assert context.org_id == "org_1"
@@ -181,17 +343,35 @@ async def test_require_auth_context_sets_request_state(monkeypatch: pytest.Monke
 
 
 @pytest.mark.asyncio
-async def test_require_auth_context_missing_claims(monkeypatch: pytest.MonkeyPatch) -> None:
-    class _Session:
-        async def scalar(self, _stmt):  # noqa: ANN001
-            return None
+async def test_load_tenant_by_org_prefers_redis_then_fills_it(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import auth
+
+    tenant_id = uuid4()
+    cache = _FakeTenantCache({"id": str(tenant_id), "is_active": True, "subscription_tier": "pro"})
+    monkeypatch.setattr(auth, "get_redis_client", lambda: cache)
+    session = _Session()
+
+    tenant = await auth._load_tenant_by_org(session, "org_1")
+    assert tenant == auth.CachedTenant(id=tenant_id, is_active=True, subscription_tier="pro")
+    assert await auth._load_tenant_by_org(session, "ORG_1") == tenant
+    assert session.executed == 0
+
+    cache.store.clear()
+    session.row = SimpleNamespace(id=tenant_id, is_active=False, subscription_tier="basic")
+    tenant = await auth._load_tenant_by_org(session, "org_1")
+    assert tenant is not None and tenant.is_active is False
+    assert session.executed == 1
+    assert orjson.loads(cache.store["tenant:by_org:org_1"])["subscription_tier"] == "basic"
 
+
+@pytest.mark.asyncio
+async def test_require_auth_context_missing_claims(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import auth
 
     request = SimpleNamespace(state=SimpleNamespace())
     credentials = SimpleNamespace(credentials="jwt")
 
-    monkeypatch.setattr(auth, "_decode_clerk_jwt", lambda _token: {"sub": "user_1"})
+    monkeypatch.setattr(auth, "_decode_clerk_jwt", AsyncMock(return_value={"sub": "user_1"}))
     with pytest.raises(HTTPException) as exc:
         await require_auth_context(request, credentials, _Session())
     assert exc.value.status_code == 403
@@ -199,17 +379,14 @@ async def test_require_auth_context_missing_claims(monkeypatch: pytest.MonkeyPat
 
 @pytest.mark.asyncio
 async def test_require_auth_context_tenant_not_provisioned(monkeypatch: pytest.MonkeyPatch) -> None:
-    class _Session:
-        async def scalar(self, _stmt):  # noqa: ANN001
-            return None
-
     from src.core import auth
 
     monkeypatch.setattr(
         auth,
         "_decode_clerk_jwt",
-        lambda _token: {"org_id": "org_missing", "sub": "user_2"},
+        AsyncMock(return_value={"org_id": "org_missing", "sub": "user_2"}),
     )
+    monkeypatch.setattr(auth, "get_redis_client", lambda: _FakeTenantCache())
 
     request = SimpleNamespace(state=SimpleNamespace())
     credentials = SimpleNamespace(credentials="jwt")
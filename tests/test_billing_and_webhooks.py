@@ -1,11 +1,17 @@
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import hmac
 import json
+import time
+from collections.abc import Awaitable, Callable
 from types import SimpleNamespace
-from unittest.mock import AsyncMock
+from unittest.mock import AsyncMock, Mock
 from uuid import uuid4
 
 import pytest
+import stripe
 from fastapi import HTTPException
 
 from src.api.routes.webhooks import (
@@ -17,6 +23,7 @@ from src.api.routes.webhooks import (
 from src.core.auth import AuthContext
 from src.core.billing import (
     ClerkBillingClient,
+    TierEntitlements,
     get_current_entitlements,
     enforce_daily_trade_limit,
     enforce_strategy_limit,
@@ -40,6 +47,9 @@ def test_tier_to_entitlements_basic_and_pro() -> None:
     assert pro.daily_trade_limit is None
     assert pro.priority_execution is True
 
+    assert tier_to_entitlements(" PRO ") is pro
+    assert tier_to_entitlements("unknown") is basic
+
 
 @pytest.mark.asyncio
 async def test_require_pro_tier_blocks_non_pro() -> None:
@@ -94,142 +104,251 @@ async def test_verify_and_parse_event_json_mode(monkeypatch: pytest.MonkeyPatch)
         _verify_and_parse_event(b"{bad-json", stripe_signature=None)
     assert exc.value.status_code == 400
 
+    with pytest.raises(HTTPException) as exc:
+        _verify_and_parse_event(b"[]", stripe_signature=None)
+    assert exc.value.status_code == 400
+
+    # An already-decoded body is reused rather than parsed again.
+    assert _verify_and_parse_event(b"", stripe_signature=None, unverified=payload) is payload
+
+
+# Shared by the billing tests; none of them mutate it.
+_CONTEXT = AuthContext(
+    tenant_id=uuid4(),
+    user_id=uuid4(),
+    subject="user_1",
+    org_id="org_1",
+    claims={},
+)
+
+
+def _entitled(tier: str) -> Callable[..., Awaitable[TierEntitlements]]:
+    entitlements = tier_to_entitlements(tier)
+
+    async def _get_current_entitlements(*args: object, **kwargs: object) -> TierEntitlements:
+        return entitlements
+
+    return _get_current_entitlements
+
+
+def _clerk_tier(tier: str) -> Callable[..., Awaitable[str]]:
+    async def _fetch(self: ClerkBillingClient, org_id: str) -> str:
+        return tier
+
+    return _fetch
+
+
+async def _clerk_down(self: ClerkBillingClient, org_id: str) -> str:
+    raise RuntimeError("down")
+
+
+def _request() -> SimpleNamespace:
+    return SimpleNamespace(state=SimpleNamespace())
+
+
+class _FakeTradeCounter:
+    def __init__(self, count: int) -> None:
+        self.count = count
+        self.executed: list[tuple] = []
+
+    def pipeline(self, transaction=True):  # noqa: ANN001
+        return self
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):  # noqa: ANN002
+        return None
+
+    def incr(self, *args):  # noqa: ANN002
+        self.executed.append(("incr", args, {}))
+
+    def expire(self, *args, **kwargs):  # noqa: ANN002, ANN003
+        self.executed.append(("expire", args, kwargs))
+
+    async def execute(self) -> list:
+        return [self.count, True]
+
 
 class _FakeSession:
     def __init__(self, tenant: object | None) -> None:
         self._tenant = tenant
         self.committed = False
+        self.queries = 0
 
     async def scalar(self, stmt):  # noqa: ANN001
+        self.queries += 1
         return self._tenant
 
     async def commit(self) -> None:
         self.committed = True
 
 
+class _FakeTierCache:
+    def __init__(self, cached: str | None = None) -> None:
+        self.cached = cached
+        self.generation: str | None = None
+        self.set_calls: list[tuple] = []
+        self.delete = AsyncMock(return_value=1)
+
+    async def mget(self, tier_key, generation_key):  # noqa: ANN001
+        assert generation_key == tier_key.replace("tenant:tier:", "tenant:tier_gen:")
+        return [self.cached, self.generation]
+
+    async def set(self, key, value, ex=None):  # noqa: ANN001
+        self.set_calls.append((key, value, ex))
+
+
+@pytest.fixture
+def tier_cache(monkeypatch: pytest.MonkeyPatch) -> _FakeTierCache:
+    from src.core import billing
+
+    cache = _FakeTierCache()
+    monkeypatch.setattr(billing, "get_redis_client", lambda: cache)
+    return cache
+
+
 @pytest.mark.asyncio
-async def test_resolve_tenant_subscription_tier_fallback_when_clerk_unavailable(monkeypatch: pytest.MonkeyPatch) -> None:
-    tenant = SimpleNamespace(id=uuid4(), subscription_tier="basic", is_active=True)
+async def test_resolve_tenant_subscription_tier_fallback_when_clerk_unavailable(
+    monkeypatch: pytest.MonkeyPatch, tier_cache: _FakeTierCache
+) -> None:
+    tenant = SimpleNamespace(id=_CONTEXT.tenant_id, subscription_tier="basic", is_active=True)
     session = _FakeSession(tenant)
-    context = AuthContext(
-        tenant_id=tenant.id,
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
 
-    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", lambda self, org: (_ for _ in ()).throw(RuntimeError("down")))
+    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", _clerk_down)
 
-    tier = await resolve_tenant_subscription_tier(context, session)
+    tier = await resolve_tenant_subscription_tier(_CONTEXT, session)
     assert tier == "basic"
+    # The fallback is not cached, so Clerk is retried on the next request.
+    assert tier_cache.set_calls == []
 
 
 @pytest.mark.asyncio
-async def test_resolve_tenant_subscription_tier_blocks_inactive_tenant(monkeypatch: pytest.MonkeyPatch) -> None:
-    tenant = SimpleNamespace(id=uuid4(), subscription_tier="basic", is_active=False)
+async def test_resolve_tenant_subscription_tier_blocks_inactive_tenant(
+    monkeypatch: pytest.MonkeyPatch, tier_cache: _FakeTierCache
+) -> None:
+    tenant = SimpleNamespace(id=_CONTEXT.tenant_id, subscription_tier="basic", is_active=False)
     session = _FakeSession(tenant)
-    context = AuthContext(
-        tenant_id=tenant.id,
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
 
-    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", lambda self, org: (_ for _ in ()).throw(RuntimeError("down")))
+    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", _clerk_down)
 
     with pytest.raises(HTTPException) as exc:
-        await resolve_tenant_subscription_tier(context, session)
+        await resolve_tenant_subscription_tier(_CONTEXT, session)
     assert exc.value.status_code == 403
+    assert tier_cache.set_calls == [(f"tenant:tier:{tenant.id}", "0:0:basic", 60)]
+
+    # The cached inactive flag is honoured on later hits without touching Postgres.
+    tier_cache.cached = "0:0:basic"
+    with pytest.raises(HTTPException) as exc:
+        await resolve_tenant_subscription_tier(_CONTEXT, session)
+    assert exc.value.status_code == 403
+    assert session.queries == 1
 
 
 @pytest.mark.asyncio
-async def test_resolve_tenant_subscription_tier_updates_from_clerk(monkeypatch: pytest.MonkeyPatch) -> None:
-    tenant = SimpleNamespace(id=uuid4(), subscription_tier="basic", is_active=True)
+async def test_resolve_tenant_subscription_tier_updates_from_clerk(
+    monkeypatch: pytest.MonkeyPatch, tier_cache: _FakeTierCache
+) -> None:
+    tenant = SimpleNamespace(id=_CONTEXT.tenant_id, subscription_tier="basic", is_active=True)
     session = _FakeSession(tenant)
-    context = AuthContext(
-        tenant_id=tenant.id,
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
 
-    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", lambda self, org: "pro")
-    tier = await resolve_tenant_subscription_tier(context, session)
+    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", _clerk_tier("pro"))
+    tier = await resolve_tenant_subscription_tier(_CONTEXT, session)
+    tier_cache.delete.assert_awaited_once_with("tenant:by_org:org_1")
 
     assert tier == "pro"
     assert tenant.subscription_tier == "pro"
     assert session.committed is True
+    assert session.queries == 1
+    assert tier_cache.set_calls == [(f"tenant:tier:{tenant.id}", "0:1:pro", 60)]
+
+
+@pytest.mark.asyncio
+async def test_resolve_tenant_subscription_tier_cache_hit(
+    monkeypatch: pytest.MonkeyPatch, tier_cache: _FakeTierCache
+) -> None:
+    session = _FakeSession(None)
+    tier_cache.cached = "3:1:pro"
+    tier_cache.generation = "3"
+    fetch = AsyncMock(return_value="basic")
+    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", fetch)
+
+    assert await resolve_tenant_subscription_tier(_CONTEXT, session) == "pro"
+    assert session.queries == 0
+    fetch.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_resolve_tenant_subscription_tier_ignores_entries_from_an_older_generation(
+    monkeypatch: pytest.MonkeyPatch, tier_cache: _FakeTierCache
+) -> None:
+    tenant = SimpleNamespace(id=_CONTEXT.tenant_id, subscription_tier="pro", is_active=False)
+    session = _FakeSession(tenant)
+    # Written by a request that raced the deactivation webhook, which bumped the generation.
+    tier_cache.cached = "3:1:pro"
+    tier_cache.generation = "4"
+    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", _clerk_tier("pro"))
+
+    with pytest.raises(HTTPException) as exc:
+        await resolve_tenant_subscription_tier(_CONTEXT, session)
+    assert exc.value.status_code == 403
+    assert session.queries == 1
+    assert tier_cache.set_calls == [(f"tenant:tier:{tenant.id}", "4:0:pro", 60)]
 
 
 @pytest.mark.asyncio
 async def test_enforce_strategy_limit_blocks_on_basic_limit(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import billing
 
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
     session = SimpleNamespace(scalar=AsyncMock(return_value=1))
-    monkeypatch.setattr(
-        billing,
-        "get_current_entitlements",
-        AsyncMock(return_value=tier_to_entitlements("basic")),
-    )
+    monkeypatch.setattr(billing, "get_current_entitlements", _entitled("basic"))
 
     with pytest.raises(HTTPException) as exc:
-        await enforce_strategy_limit(context, session)
+        await enforce_strategy_limit(_request(), _CONTEXT, session)
     assert exc.value.status_code == 403
+    [stmt] = session.scalar.await_args.args
+    assert "LIMIT" in str(stmt)
 
 
 @pytest.mark.asyncio
-async def test_enforce_daily_trade_limit_blocks_when_exceeded(monkeypatch: pytest.MonkeyPatch) -> None:
+async def test_enforce_strategy_limit_allows_basic_under_limit(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import billing
 
-    class _FakeRedis:
-        async def incr(self, _key):  # noqa: ANN001
-            return 6
+    session = SimpleNamespace(scalar=AsyncMock(return_value=0))
+    monkeypatch.setattr(billing, "get_current_entitlements", _entitled("basic"))
+    # The count always comes from Postgres, never from a cached value.
+    monkeypatch.setattr(billing, "get_redis_client", Mock(side_effect=AssertionError))
 
-        async def expire(self, _key, _ttl):  # noqa: ANN001
-            return True
+    ent = await enforce_strategy_limit(_request(), _CONTEXT, session)
+    assert ent.tier == "basic"
+    session.scalar.assert_awaited_once()
 
-        async def aclose(self):
-            return None
 
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
-    monkeypatch.setattr(
-        billing,
-        "get_current_entitlements",
-        AsyncMock(return_value=tier_to_entitlements("basic")),
-    )
-    monkeypatch.setattr(billing.redis, "from_url", lambda *args, **kwargs: _FakeRedis())
+@pytest.mark.asyncio
+async def test_enforce_daily_trade_limit_blocks_when_exceeded(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import billing
+
+    fake_redis = _FakeTradeCounter(count=6)
+    monkeypatch.setattr(billing, "get_current_entitlements", _entitled("basic"))
+    monkeypatch.setattr(billing, "get_redis_client", lambda: fake_redis)
 
     with pytest.raises(HTTPException) as exc:
-        await enforce_daily_trade_limit(context, session=SimpleNamespace())
+        await enforce_daily_trade_limit(_request(), _CONTEXT, session=SimpleNamespace())
     assert exc.value.status_code == 403
 
 
-def test_clerk_billing_client_requires_secret(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.asyncio
+async def test_clerk_billing_client_requires_secret(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import billing
 
     monkeypatch.setattr(billing.settings, "clerk_secret_key", "")
     with pytest.raises(HTTPException) as exc:
-        ClerkBillingClient().fetch_org_subscription_tier("org_1")
+        await ClerkBillingClient().fetch_org_subscription_tier("org_1")
     assert exc.value.status_code == 500
 
 
-def test_clerk_billing_client_fetches_tier(monkeypatch: pytest.MonkeyPatch) -> None:
+@pytest.mark.asyncio
+async def test_clerk_billing_client_fetches_tier(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import billing
 
     class _Resp:
@@ -241,16 +360,16 @@ def test_clerk_billing_client_fetches_tier(monkeypatch: pytest.MonkeyPatch) -> N
 
     called = {}
 
-    def _get(url: str, headers: dict, timeout: int):  # noqa: ANN001
-        called["url"] = url
-        called["headers"] = headers
-        called["timeout"] = timeout
-        return _Resp()
+    class _Http:
+        async def get(self, url: str, headers: dict):  # noqa: ANN001
+            called["url"] = url
+            called["headers"] = headers
+            return _Resp()
 
     monkeypatch.setattr(billing.settings, "clerk_secret_key", "sk_test")
-    monkeypatch.setattr(billing.requests, "get", _get)
+    monkeypatch.setattr(billing, "_get_clerk_http", lambda: _Http())
 
-    tier = ClerkBillingClient().fetch_org_subscription_tier("org_123")
+    tier = await ClerkBillingClient().fetch_org_subscription_tier("org_123")
     assert tier == "pro"
     assert called["headers"]["Authorization"] == "Bearer sk_test"
 
@@ -259,56 +378,25 @@ def test_clerk_billing_client_fetches_tier(monkeypatch: pytest.MonkeyPatch) -> N
 async def test_enforce_daily_trade_limit_sets_expiry_on_first_trade(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import billing
 
-    class _FakeRedis:
-        def __init__(self) -> None:
-            self.expired = False
-
-        async def incr(self, _key):  # noqa: ANN001
-            return 1
-
-        async def expire(self, _key, _ttl):  # noqa: ANN001
-            self.expired = True
-            return True
-
-        async def aclose(self):
-            return None
-
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
-    fake_redis = _FakeRedis()
-    monkeypatch.setattr(
-        billing,
-        "get_current_entitlements",
-        AsyncMock(return_value=tier_to_entitlements("basic")),
-    )
-    monkeypatch.setattr(billing.redis, "from_url", lambda *args, **kwargs: fake_redis)
+    fake_redis = _FakeTradeCounter(count=1)
+    monkeypatch.setattr(billing, "get_current_entitlements", _entitled("basic"))
+    monkeypatch.setattr(billing, "get_redis_client", lambda: fake_redis)
 
-    entitlements = await enforce_daily_trade_limit(context, session=SimpleNamespace())
+    entitlements = await enforce_daily_trade_limit(_request(), _CONTEXT, session=SimpleNamespace())
     assert entitlements.tier == "basic"
-    assert fake_redis.expired is True
+    assert [name for name, *_ in fake_redis.executed] == ["incr", "expire"]
+    assert fake_redis.executed[1][2] == {"nx": True}
 
 
 @pytest.mark.asyncio
 async def test_resolve_tenant_subscription_tier_missing_tenant_after_clerk_success(
-    monkeypatch: pytest.MonkeyPatch,
+    monkeypatch: pytest.MonkeyPatch, tier_cache: _FakeTierCache
 ) -> None:
     session = _FakeSession(None)
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
-    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", lambda self, org: "pro")
+    monkeypatch.setattr(ClerkBillingClient, "fetch_org_subscription_tier", _clerk_tier("pro"))
 
     with pytest.raises(HTTPException) as exc:
-        await resolve_tenant_subscription_tier(context, session)
+        await resolve_tenant_subscription_tier(_CONTEXT, session)
     assert exc.value.status_code == 403
 
 
@@ -316,82 +404,55 @@ async def test_resolve_tenant_subscription_tier_missing_tenant_after_clerk_succe
 async def test_get_current_entitlements_basic(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core import billing
 
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
-    monkeypatch.setattr(billing, "resolve_tenant_subscription_tier", AsyncMock(return_value="basic"))
-    ent = await get_current_entitlements(context, session=SimpleNamespace())
+    resolve = AsyncMock(return_value="basic")
+    monkeypatch.setattr(billing, "resolve_tenant_subscription_tier", resolve)
+    request = _request()
+    ent = await get_current_entitlements(request, _CONTEXT, session=SimpleNamespace())
     assert ent.tier == "basic"
 
-
-@pytest.mark.asyncio
-async def test_enforce_strategy_limit_allows_pro(monkeypatch: pytest.MonkeyPatch) -> None:
-    from src.core import billing
-
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
-    monkeypatch.setattr(
-        billing,
-        "get_current_entitlements",
-        AsyncMock(return_value=tier_to_entitlements("pro")),
-    )
-
-    ent = await enforce_strategy_limit(context, session=SimpleNamespace())
-    assert ent.tier == "pro"
+    assert await get_current_entitlements(request, _CONTEXT, session=SimpleNamespace()) is ent
+    resolve.assert_awaited_once()
 
 
+@pytest.mark.parametrize("guard", [enforce_strategy_limit, enforce_daily_trade_limit])
 @pytest.mark.asyncio
-async def test_enforce_daily_trade_limit_allows_pro(monkeypatch: pytest.MonkeyPatch) -> None:
+async def test_limit_guards_allow_pro(
+    monkeypatch: pytest.MonkeyPatch, guard: Callable[..., Awaitable[TierEntitlements]]
+) -> None:
     from src.core import billing
 
-    context = AuthContext(
-        tenant_id=uuid4(),
-        user_id=uuid4(),
-        subject="user_1",
-        org_id="org_1",
-        claims={},
-    )
-    monkeypatch.setattr(
-        billing,
-        "get_current_entitlements",
-        AsyncMock(return_value=tier_to_entitlements("pro")),
-    )
+    monkeypatch.setattr(billing, "get_current_entitlements", _entitled("pro"))
+    # Pro has no limits, so neither guard may touch Redis or the session.
+    monkeypatch.setattr(billing, "get_redis_client", Mock(side_effect=AssertionError))
 
-    ent = await enforce_daily_trade_limit(context, session=SimpleNamespace())
+    ent = await guard(_request(), _CONTEXT, session=SimpleNamespace())
     assert ent.tier == "pro"
 
 
 def test_verify_and_parse_event_with_stripe_signature(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.api.routes import webhooks
 
-    class _Event:
-        def to_dict_recursive(self) -> dict:
-            return {"type": "invoice.paid"}
-
+    body = b'{"type":"invoice.paid"}'
+    timestamp = int(time.time())
+    digest = hmac.new(b"whsec_test", f"{timestamp}.".encode() + body, hashlib.sha256).hexdigest()
     monkeypatch.setattr(webhooks.settings, "stripe_webhook_secret", "whsec_test")
-    monkeypatch.setattr(webhooks.stripe.Webhook, "construct_event", lambda **kwargs: _Event())
 
-    parsed = _verify_and_parse_event(b"{}", stripe_signature="sig_header")
-    assert parsed["type"] == "invoice.paid"
+    parsed = _verify_and_parse_event(body, stripe_signature=f"t={timestamp},v1={digest}")
+    assert parsed == {"type": "invoice.paid"}
+
+    with pytest.raises(HTTPException) as exc:
+        _verify_and_parse_event(body, stripe_signature=f"t={timestamp},v1={'0' * 64}")
+    assert exc.value.status_code == 400
 
 
 def test_verify_and_parse_event_with_invalid_stripe_signature(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.api.routes import webhooks
 
-    def _boom(**kwargs):  # noqa: ANN003
+    def _boom(*args, **kwargs):  # noqa: ANN002, ANN003
         raise ValueError("bad sig")
 
     monkeypatch.setattr(webhooks.settings, "stripe_webhook_secret", "whsec_test")
-    monkeypatch.setattr(webhooks.stripe.Webhook, "construct_event", _boom)
+    monkeypatch.setattr(stripe.WebhookSignature, "verify_header", _boom)
 
     with pytest.raises(HTTPException) as exc:
         _verify_and_parse_event(b"{}", stripe_signature="sig_header")
@@ -400,33 +461,205 @@ def test_verify_and_parse_event_with_invalid_stripe_signature(monkeypatch: pytes
 
 @pytest.mark.asyncio
 async def test_set_tenant_redis_state_active_and_inactive(monkeypatch: pytest.MonkeyPatch) -> None:
+    from redis.asyncio import Redis
+    from redis.exceptions import NoScriptError
+
     from src.api.routes import webhooks
 
     class _FakeRedis:
         def __init__(self) -> None:
+            self.loaded: list[str] = []
             self.calls: list[tuple] = []
 
-        async def set(self, *args, **kwargs):  # noqa: ANN002, ANN003
-            self.calls.append(("set", args, kwargs))
-            return True
-
-        async def publish(self, *args, **kwargs):  # noqa: ANN002, ANN003
-            self.calls.append(("publish", args, kwargs))
+        async def evalsha(self, sha, numkeys, *args):  # noqa: ANN001, ANN002
+            if not self.loaded:
+                raise NoScriptError("NOSCRIPT")
+            self.calls.append((sha, numkeys, args))
             return 1
 
-        async def delete(self, *args, **kwargs):  # noqa: ANN002, ANN003
-            self.calls.append(("delete", args, kwargs))
-            return 1
+        async def script_load(self, script):  # noqa: ANN001
+            self.loaded.append(script)
+            return webhooks._tenant_state_script().sha
 
-        async def aclose(self):
-            self.calls.append(("aclose", (), {}))
-            return None
+        def register_script(self, script):  # noqa: ANN001
+            # A real (never connected) client only supplies the encoder; calls pass client=self.
+            return Redis().register_script(script)
 
     fake = _FakeRedis()
-    monkeypatch.setattr(webhooks.redis, "from_url", lambda *args, **kwargs: fake)
+    monkeypatch.setattr(webhooks, "get_redis_client", lambda: fake)
+    webhooks._tenant_state_script.cache_clear()
+
+    await _set_tenant_redis_state("tenant_1", active=True, org_id="org_1")
+    await _set_tenant_redis_state("tenant_1", active=False, org_id="org_1", deactivated_strategy_ids=["s1", "s2"])
+
+    assert fake.loaded == [webhooks._TENANT_STATE_LUA]
+    (_, numkeys, active_args), (_, _, inactive_args) = fake.calls
+    assert numkeys == 6
+    assert active_args[:6] == (
+        "tenant:active:tenant_1",
+        "tenant:by_org:org_1",
+        "kite:access_token:tenant_1",
+        "kite:connection_status:tenant_1",
+        "tenant:tier:tenant_1",
+        "tenant:tier_gen:tenant_1",
+    )
+    assert active_args[6:9] == ("1", "active", "billing:tenant_status:tenant_1")
+    assert active_args[-1] == b""
+    assert inactive_args[6:8] == ("0", "inactive")
+    assert inactive_args[-2:] == ("strategies:deactivated:tenant_1", b'["s1","s2"]')
+    webhooks._tenant_state_script.cache_clear()
+
+
+class _FakeWebhookSession:
+    def __init__(self, tenant: object | None, strategy_ids: list | None = None) -> None:
+        self.tenant = tenant
+        self.strategy_ids = strategy_ids or []
+        self.committed = False
+
+    async def scalar(self, stmt):  # noqa: ANN001
+        return self.tenant
+
+    async def scalars(self, stmt):  # noqa: ANN001
+        return SimpleNamespace(all=lambda: self.strategy_ids)
+
+    async def commit(self) -> None:
+        self.committed = True
+
+
+@pytest.mark.asyncio
+async def test_apply_billing_event_updates_tenant_and_redis(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.api.routes import webhooks
+
+    calls: list[tuple] = []
+
+    async def _fake_set_state(tenant_id: str, active: bool, org_id: str, deactivated_strategy_ids=()) -> None:
+        calls.append((tenant_id, active, list(deactivated_strategy_ids)))
+
+    monkeypatch.setattr(webhooks, "_set_tenant_redis_state", _fake_set_state)
+    tenant = SimpleNamespace(id=_CONTEXT.tenant_id, subscription_tier="basic", is_active=False)
+
+    session = _FakeWebhookSession(tenant)
+    paid = webhooks.BillingEvent(event_type="invoice.paid", org_id="org_1", tier="pro")
+    assert await webhooks._apply_billing_event(session, paid) == tenant.id
+    assert (tenant.subscription_tier, tenant.is_active, session.committed) == ("pro", True, True)
+
+    strategy_id = uuid4()
+    session = _FakeWebhookSession(tenant, [strategy_id])
+    deleted = webhooks.BillingEvent(event_type="subscription.deleted", org_id="org_1", tier="pro")
+    assert await webhooks._apply_billing_event(session, deleted) == tenant.id
+    assert tenant.is_active is False
+    assert calls == [(str(tenant.id), True, []), (str(tenant.id), False, [strategy_id])]
+
+    assert await webhooks._apply_billing_event(_FakeWebhookSession(None), paid) is None
+
+
+class _FakeBillingStream:
+    def __init__(self) -> None:
+        self.entries: list[tuple[str, dict[str, str]]] = []
+        self.stale: list[tuple[str, dict[str, str] | None]] = []
+        self.delivered = 0
+        self.acked: list[str] = []
+        self.groups: list[str] = []
+
+    async def xgroup_create(self, name, groupname, id, mkstream):  # noqa: ANN001, A002
+        self.groups.append(groupname)
+
+    async def xadd(self, stream, fields):  # noqa: ANN001
+        message_id = f"{len(self.entries) + 1}-0"
+        self.entries.append((message_id, fields))
+        return message_id
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, count):  # noqa: ANN001
+        claimed, self.stale = self.stale, []
+        return ["0-0", claimed, []]
+
+    async def xreadgroup(self, groupname, consumername, streams, count, block):  # noqa: ANN001
+        new = self.entries[self.delivered :]
+        self.delivered = len(self.entries)
+        if not new:
+            await asyncio.sleep(0.001)
+            return []
+        return [["billing_events", new]]
+
+    def pipeline(self, transaction=True):  # noqa: ANN001
+        stream = self
+
+        class _Pipeline:
+            async def __aenter__(self):
+                return self
+
+            async def __aexit__(self, *exc):  # noqa: ANN002
+                return None
+
+            def xack(self, stream_name, group, message_id):  # noqa: ANN001
+                stream.acked.append(message_id)
+
+            def xdel(self, stream_name, message_id):  # noqa: ANN001
+                return None
+
+            async def execute(self) -> list:
+                return []
+
+        return _Pipeline()
+
+
+@pytest.mark.asyncio
+async def test_billing_event_queue_persists_before_ack_and_acks_once_applied(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    from src.api.routes import webhooks
+
+    applied: list[str] = []
+    stream = _FakeBillingStream()
+
+    class _SessionCtx:
+        async def __aenter__(self):
+            return object()
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+    async def _fake_apply(session, event):  # noqa: ANN001
+        applied.append(event.org_id)
+        if event.org_id == "org_bad":
+            raise RuntimeError("db down")
+
+    monkeypatch.setattr(webhooks, "AsyncSessionLocal", lambda: _SessionCtx())
+    monkeypatch.setattr(webhooks, "_apply_billing_event", _fake_apply)
+    monkeypatch.setattr(webhooks, "get_redis_client", lambda: stream)
+
+    queue = webhooks.BillingEventQueue(workers=1, maxsize=2)
+    # Persisted before any worker runs: nothing is lost if the process dies here.
+    assert await queue.submit(webhooks.BillingEvent("invoice.paid", "org_1", "pro"))
+    assert await queue.submit(webhooks.BillingEvent("invoice.paid", "org_bad", "pro"))
+    assert [fields["org_id"] for _, fields in stream.entries] == ["org_1", "org_bad"]
+
+    # A dead consumer's pending entry is reclaimed; a malformed one is discarded.
+    stream.stale = [("0-1", {"event_type": "subscription.deleted", "org_id": "org_old", "tier": "pro"})]
+    stream.stale.append(("0-2", None))
+
+    await queue.start()
+    async with asyncio.timeout(1):
+        while queue.metrics["processed"] + queue.metrics["failed"] < 3:
+            await asyncio.sleep(0.001)
+    await queue.aclose()
+
+    assert stream.groups == ["billing"]
+    assert applied == ["org_old", "org_1", "org_bad"]
+    # The failed event stays pending in the stream so it is redelivered.
+    assert stream.acked == ["0-2", "0-1", "1-0"]
+    assert queue.metrics == {"enqueued": 2, "rejected": 0, "processed": 2, "failed": 1}
+
+
+@pytest.mark.asyncio
+async def test_billing_event_queue_rejects_when_stream_write_fails(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.api.routes import webhooks
+
+    async def _xadd(stream, fields):  # noqa: ANN001
+        raise ConnectionError("redis down")
 
-    await _set_tenant_redis_state("tenant_1", active=True)
-    await _set_tenant_redis_state("tenant_1", active=False)
+    monkeypatch.setattr(webhooks, "get_redis_client", lambda: SimpleNamespace(xadd=_xadd))
 
-    assert any(call[0] == "publish" for call in fake.calls)
-    assert any(call[0] == "delete" for call in fake.calls)
+    queue = webhooks.BillingEventQueue(workers=1, maxsize=2)
+    assert not await queue.submit(webhooks.BillingEvent("invoice.paid", "org_1", "pro"))
+    assert queue.metrics["rejected"] == 1
@@ -1,10 +1,12 @@
 from __future__ import annotations
 
+import asyncio
 from types import SimpleNamespace
 from unittest.mock import AsyncMock, Mock
 from uuid import uuid4
 
 import pytest
+from sqlalchemy.dialects import postgresql
 
 from src.core.context import reset_current_tenant_id, set_current_tenant_id
 from src.core.db import apply_rls_tenant_context, get_db_session
@@ -14,18 +16,44 @@ from src.core.repositories import (
     TenantRepository,
     TradingProfileRepository,
 )
+from src.models.notification_preference import NotificationChannel, NotificationPreference
 from src.models.tenant import Tenant
 
 
 @pytest.mark.asyncio
 async def test_apply_rls_tenant_context_executes_sql() -> None:
-    session = Mock()
+    session = Mock(info={})
     session.execute = AsyncMock()
 
     await apply_rls_tenant_context(session, uuid4())
     session.execute.assert_awaited_once()
 
 
+@pytest.mark.asyncio
+async def test_apply_rls_tenant_context_skips_repeat_until_transaction_ends() -> None:
+    from sqlalchemy.orm import Session
+
+    tenant_id = uuid4()
+    session = Session()
+    session.begin()
+    executed = []
+
+    async def _execute(stmt, params):  # noqa: ANN001
+        executed.append(params)
+
+    wrapper = SimpleNamespace(info=session.info, execute=_execute)
+    await apply_rls_tenant_context(wrapper, tenant_id)
+    await apply_rls_tenant_context(wrapper, tenant_id)
+    assert len(executed) == 1
+
+    await apply_rls_tenant_context(wrapper, uuid4())
+    assert len(executed) == 2
+
+    session.rollback()
+    await apply_rls_tenant_context(wrapper, tenant_id)
+    assert len(executed) == 3
+
+
 @pytest.mark.asyncio
 async def test_get_db_session_yields_session(monkeypatch: pytest.MonkeyPatch) -> None:
     sentinel = object()
@@ -49,6 +77,27 @@ async def test_get_db_session_yields_session(monkeypatch: pytest.MonkeyPatch) ->
         await agen.__anext__()
 
 
+def test_engine_pool_options_follow_settings(monkeypatch: pytest.MonkeyPatch) -> None:
+    from sqlalchemy.pool import NullPool
+
+    from src.core import db
+
+    monkeypatch.setattr(db.settings, "db_pool_size", 7)
+    assert db._engine_pool_options()["pool_size"] == 7
+
+    monkeypatch.setattr(db.settings, "db_use_null_pool", True)
+    assert db._engine_pool_options() == {"poolclass": NullPool}
+
+
+def test_engine_connect_args_disable_jit_by_default(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core import db
+
+    assert db._engine_connect_args() == {"server_settings": {"application_name": "orra", "jit": "off"}}
+
+    monkeypatch.setattr(db.settings, "db_jit", True)
+    assert db._engine_connect_args() == {"server_settings": {"application_name": "orra"}}
+
+
 @pytest.mark.asyncio
 async def test_tenant_repository_get_list_update_delete() -> None:
     tenant_id = uuid4()
@@ -62,15 +111,19 @@ async def test_tenant_repository_get_list_update_delete() -> None:
             is_active=True,
         )
 
-        execute_values = [
-            SimpleNamespace(scalar_one_or_none=lambda: entity),
-            SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: [entity])),
-            SimpleNamespace(scalar_one_or_none=lambda: entity),
-            SimpleNamespace(rowcount=1),
-        ]
+        execute_values = iter(
+            [
+                SimpleNamespace(scalar_one_or_none=lambda: entity),
+                SimpleNamespace(scalars=lambda: SimpleNamespace(all=lambda: [entity])),
+                SimpleNamespace(scalar_one_or_none=lambda: entity),
+                SimpleNamespace(rowcount=1),
+            ]
+        )
+        statements = []
 
-        async def _execute(_stmt):  # noqa: ANN001
-            return execute_values.pop(0)
+        async def _execute(stmt):  # noqa: ANN001
+            statements.append(stmt)
+            return next(execute_values)
 
         session = Mock()
         session.execute = AsyncMock(side_effect=_execute)
@@ -88,12 +141,61 @@ async def test_tenant_repository_get_list_update_delete() -> None:
         assert got is entity
         assert listed == [entity]
         assert updated is entity
-        assert entity.subscription_tier == "pro"
+        update_sql = str(statements[2].compile(dialect=postgresql.dialect()))
+        assert update_sql.startswith("UPDATE tenants SET subscription_tier=")
+        assert "RETURNING" in update_sql
+        assert "SET id=" not in update_sql and "tenant_id=%(tenant_id)s," not in update_sql
         assert deleted is True
+        session.flush.assert_not_awaited()
+        session.refresh.assert_not_awaited()
     finally:
         reset_current_tenant_id(token)
 
 
+def test_notification_preference_flags_pack_channel_and_enabled() -> None:
+    pref = NotificationPreference(destination="@trader", channel=NotificationChannel.WHATSAPP)
+    assert pref.flags == 0b101
+    assert pref.is_enabled is True
+
+    pref.is_enabled = False
+    assert pref.flags == 0b100
+    assert pref.channel is NotificationChannel.WHATSAPP
+
+    where_sql = str(NotificationPreference.is_enabled.compile(dialect=postgresql.dialect()))
+    assert where_sql.startswith("(notification_preferences.flags &")
+
+    # Codes the check constraint allows but no channel uses fall back to email.
+    assert NotificationPreference(flags=(7 << 1) | 1).channel is NotificationChannel.EMAIL
+
+
+@pytest.mark.asyncio
+async def test_notification_preference_repository_writes_fold_hybrids_into_flags() -> None:
+    token = set_current_tenant_id(uuid4())
+    try:
+        session = Mock(info={})
+        session.execute = AsyncMock(
+            return_value=SimpleNamespace(scalar_one=lambda: Mock(), scalar_one_or_none=lambda: Mock())
+        )
+        repo = NotificationPreferenceRepository(session)
+        repo._apply_rls = AsyncMock()
+
+        await repo.create(user_id=uuid4(), destination="@trader", channel=NotificationChannel.TELEGRAM)
+        await repo.update(uuid4(), is_enabled=False)
+    finally:
+        reset_current_tenant_id(token)
+
+    insert_stmt, update_stmt = (call.args[0] for call in session.execute.await_args_list)
+    insert_sql = insert_stmt.compile(dialect=postgresql.dialect())
+    assert str(insert_sql).startswith("INSERT INTO notification_preferences (")
+    assert "&" not in str(insert_sql).split("VALUES")[0]
+    assert insert_sql.params["flags"] == 0b011
+
+    update_sql = update_stmt.compile(dialect=postgresql.dialect())
+    assert "SET flags=((notification_preferences.flags &" in str(update_sql)
+    # Only the enabled bit is cleared; the channel bits are kept.
+    assert sorted(v for v in update_sql.params.values() if isinstance(v, int)) == [0, 0xFE]
+
+
 def test_repository_exports_and_concrete_repositories_init() -> None:
     session = Mock()
 
@@ -129,3 +231,52 @@ async def test_concrete_repositories_get_by_user_id_paths() -> None:
         assert await profile.get_by_user_id(user_id) is expected
     finally:
         reset_current_tenant_id(token)
+
+
+@pytest.mark.asyncio
+async def test_notification_preference_writes_publish_after_commit(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core.repositories import notification_preferences
+
+    published: list[str] = []
+
+    class _Pipeline:
+        async def __aenter__(self):
+            return self
+
+        async def __aexit__(self, *exc):  # noqa: ANN002
+            return None
+
+        def publish(self, channel: str, message: str) -> None:
+            assert channel == "notif:prefs:changed"
+            published.append(message)
+
+        async def execute(self) -> list:
+            return []
+
+    monkeypatch.setattr(
+        notification_preferences,
+        "get_redis_client",
+        lambda: SimpleNamespace(pipeline=lambda transaction=True: _Pipeline()),
+    )
+    tenant_id = uuid4()
+    token = set_current_tenant_id(tenant_id)
+    try:
+        session = Mock(info={})
+        repo = NotificationPreferenceRepository(session)
+        repo._apply_rls = AsyncMock()
+        session.execute = AsyncMock(return_value=SimpleNamespace(rowcount=1))
+        assert await repo.delete(uuid4()) is True
+    finally:
+        reset_current_tenant_id(token)
+
+    # Nothing is published until the transaction commits.
+    assert published == []
+    notification_preferences._publish_committed_changes(session)
+    await asyncio.gather(*notification_preferences._publish_tasks)
+    assert published == [str(tenant_id)]
+    assert "notification_preferences_changed" not in session.info
+
+    session.info["notification_preferences_changed"] = {tenant_id}
+    notification_preferences._drop_rolled_back_changes(session)
+    notification_preferences._publish_committed_changes(session)
+    assert published == [str(tenant_id)]
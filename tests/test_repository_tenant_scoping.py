@@ -7,7 +7,14 @@ import pytest
 from sqlalchemy.dialects import postgresql
 
 from src.core.context import reset_current_tenant_id, set_current_tenant_id
-from src.core.repositories.base import TenantContextMissingError, TenantRepository
+from src.core.repositories.base import (
+    TenantContextMissingError,
+    TenantRepository,
+    begin_request_row_cache,
+    end_request_row_cache,
+)
+from src.core.repositories.kite_credentials import KiteCredentialRepository
+from src.models.kite_credential import KiteCredential
 from src.models.tenant import Tenant
 
 
@@ -39,9 +46,11 @@ async def test_create_injects_tenant_id() -> None:
     tenant_id = uuid4()
     token = set_current_tenant_id(tenant_id)
     try:
+        tenant = Tenant(id=uuid4(), tenant_id=tenant_id, clerk_org_id="org_test", subscription_tier="basic")
+        result = Mock()
+        result.scalar_one.return_value = tenant
         session = Mock()
-        session.add = Mock()
-        session.flush = AsyncMock()
+        session.execute = AsyncMock(return_value=result)
         session.refresh = AsyncMock()
 
         repo = TenantRepository(session=session, model=Tenant)
@@ -49,9 +58,90 @@ async def test_create_injects_tenant_id() -> None:
 
         created = await repo.create(clerk_org_id="org_test", subscription_tier="basic")
 
-        assert created.tenant_id == tenant_id
-        session.add.assert_called_once_with(created)
-        session.flush.assert_awaited_once()
-        session.refresh.assert_awaited_once_with(created)
+        assert created is tenant
+        stmt = session.execute.await_args.args[0]
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert sql.startswith("INSERT INTO tenants")
+        assert "RETURNING" in sql
+        assert stmt.compile().params["tenant_id"] == tenant_id
+        session.refresh.assert_not_awaited()
+    finally:
+        reset_current_tenant_id(token)
+
+
+@pytest.mark.asyncio
+async def test_request_row_cache_skips_repeat_lookups() -> None:
+    tenant_id = uuid4()
+    credential = KiteCredential(id=uuid4(), tenant_id=tenant_id, user_id=uuid4())
+    token = set_current_tenant_id(tenant_id)
+    rows_token = begin_request_row_cache()
+    try:
+        result = Mock()
+        result.scalar_one_or_none.return_value = credential
+        session = Mock()
+        session.execute = AsyncMock(return_value=result)
+        session.flush = AsyncMock()
+        session.refresh = AsyncMock()
+
+        repo = KiteCredentialRepository(session)
+        repo._apply_rls = AsyncMock()
+
+        assert await repo.get_by_user_id(credential.user_id) is credential
+        assert await KiteCredentialRepository(session).get_by_user_id(credential.user_id) is credential
+        assert await repo.get(credential.id) is credential
+        session.execute.assert_awaited_once()
+    finally:
+        end_request_row_cache(rows_token)
+        reset_current_tenant_id(token)
+
+
+@pytest.mark.asyncio
+async def test_get_by_filters_within_tenant_scope() -> None:
+    tenant_id = uuid4()
+    user_id = uuid4()
+    token = set_current_tenant_id(tenant_id)
+    try:
+        credential = KiteCredential(id=uuid4(), tenant_id=tenant_id, user_id=user_id)
+        result = Mock()
+        result.scalar_one_or_none.return_value = credential
+        session = Mock()
+        session.execute = AsyncMock(return_value=result)
+
+        repo = KiteCredentialRepository(session)
+        repo._apply_rls = AsyncMock()
+
+        assert await repo.get_by(user_id=user_id, api_key_encrypted="enc") is credential
+
+        sql = str(session.execute.await_args.args[0].compile(dialect=postgresql.dialect()))
+        assert "kite_credentials.tenant_id = %(tenant_id_1)s" in sql
+        assert "kite_credentials.user_id = %(user_id_1)s" in sql
+        assert "kite_credentials.api_key_encrypted = %(api_key_encrypted_1)s" in sql
+        assert "LIMIT" in sql
+    finally:
+        reset_current_tenant_id(token)
+
+
+@pytest.mark.asyncio
+async def test_upsert_compiles_to_on_conflict_returning() -> None:
+    tenant_id = uuid4()
+    user_id = uuid4()
+    token = set_current_tenant_id(tenant_id)
+    try:
+        credential = KiteCredential(id=uuid4(), tenant_id=tenant_id, user_id=user_id)
+        result = Mock()
+        result.scalar_one.return_value = credential
+        session = Mock()
+        session.execute = AsyncMock(return_value=result)
+
+        repo = KiteCredentialRepository(session)
+        repo._apply_rls = AsyncMock()
+
+        assert await repo.upsert(user_id, api_key_encrypted="enc") is credential
+
+        stmt = session.execute.await_args.args[0]
+        sql = str(stmt.compile(dialect=postgresql.dialect()))
+        assert "ON CONFLICT (tenant_id, user_id) DO UPDATE" in sql
+        assert "SET api_key_encrypted = %(param_1)s" in sql
+        assert "RETURNING" in sql
     finally:
         reset_current_tenant_id(token)
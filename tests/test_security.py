@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+import base64
+
 from cryptography.fernet import Fernet
 import pytest
 
@@ -25,6 +27,21 @@ def test_security_cipher_invalid_token_raises() -> None:
     with pytest.raises(EncryptionError):
         cipher.decrypt("not-a-valid-token")
 
+    prefix, _, body = cipher.encrypt("secret").partition(":")
+    sealed = bytearray(base64.urlsafe_b64decode(body))
+    sealed[-1] ^= 1
+    with pytest.raises(EncryptionError):
+        cipher.decrypt(f"{prefix}:{base64.urlsafe_b64encode(sealed).decode()}")
+    with pytest.raises(EncryptionError):
+        cipher.decrypt("v2:%%%")
+
+
+def test_security_cipher_decrypts_legacy_fernet_tokens() -> None:
+    key = Fernet.generate_key().decode()
+    legacy = Fernet(key.encode()).encrypt(b"kite-api-secret").decode()
+
+    assert SecurityCipher(key).decrypt(legacy) == "kite-api-secret"
+
 
 def test_get_security_cipher_requires_env_key(monkeypatch: pytest.MonkeyPatch) -> None:
     from src.core.security import dependencies
@@ -42,3 +59,16 @@ def test_get_security_cipher_requires_env_key(monkeypatch: pytest.MonkeyPatch) -
 
     cipher = get_security_cipher()
     assert isinstance(cipher, SecurityCipher)
+
+
+def test_get_security_cipher_is_memoized_per_key(monkeypatch: pytest.MonkeyPatch) -> None:
+    from src.core.security import dependencies
+
+    first_key = Fernet.generate_key().decode()
+    monkeypatch.setattr(dependencies.settings, "master_encryption_key", first_key)
+    cipher = get_security_cipher()
+    assert get_security_cipher() is cipher
+
+    monkeypatch.setattr(dependencies.settings, "master_encryption_key", Fernet.generate_key().decode())
+    assert get_security_cipher() is not cipher
+